@@ -11,11 +11,16 @@
 from __future__ import annotations
 
 import argparse
+import csv
 import dataclasses
+import gzip
+import hashlib
 import json
 import os
 import re
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from pathlib import Path, PurePath
 from typing import Any, Callable, Literal, TypeVar, Union
@@ -119,6 +124,46 @@ class CategoryNotInJDex:
         )
 
 
+@dataclass(frozen=True)
+class DeepCheckOverBudget:
+    """An ID whose deep checks were stopped because it holds too much to walk."""
+
+    entries: int
+    seconds: float
+    type: Literal["DEEP_CHECK_OVER_BUDGET"] = "DEEP_CHECK_OVER_BUDGET"
+
+    def display(self, files: list[File]) -> str:
+        """Display this particular instance of an error."""
+        return f"{_print_nest(files[0])} [stopped after {self.entries:,} entries, {self.seconds:.1f}s]"
+
+    def explain(self) -> _Explanation:
+        """Explain what this error is."""
+        return _Explanation(
+            explanation="Some IDs hold too much to check in depth (e.g. a node_modules folder), so their deep checks are incomplete.",
+            fix="Ignore the offending folder with -i, move it out of your JD system, or raise the budget.",
+        )
+
+
+@dataclass(frozen=True)
+class DeepNesting:
+    """A folder nested too deep inside an ID."""
+
+    depth: int
+    max_depth: int
+    type: Literal["DEEP_NESTING"] = "DEEP_NESTING"
+
+    def display(self, files: list[File]) -> str:
+        """Display this particular instance of an error."""
+        return f"{_print_nest(files[0])} [{self.depth} levels inside its ID]"
+
+    def explain(self) -> _Explanation:
+        """Explain what this error is."""
+        return _Explanation(
+            explanation="Some IDs have folders nested deeper than allowed; the deepest one of each is shown.",
+            fix="Flatten them, or split the ID into several IDs.",
+        )
+
+
 @dataclass(frozen=True)
 class DuplicateArea:
     """An area that has been used multiple times."""
@@ -180,6 +225,24 @@ class DuplicateId:
         )
 
 
+@dataclass(frozen=True)
+class EmptyId:
+    """An ID (other than an inbox) with no files in it."""
+
+    type: Literal["EMPTY_ID"] = "EMPTY_ID"
+
+    def display(self, files: list[File]) -> str:
+        """Display this particular instance of an error."""
+        return _print_nest(files[0])
+
+    def explain(self) -> _Explanation:
+        """Explain what this error is."""
+        return _Explanation(
+            explanation="Some IDs have no files in them.",
+            fix="Delete them if they're unused, or record in your JDex what they're waiting for.",
+        )
+
+
 @dataclass(frozen=True)
 class FileOutsideId:
     """A file was encountered not in a terminal ID folder."""
@@ -198,6 +261,25 @@ class FileOutsideId:
         )
 
 
+@dataclass(frozen=True)
+class HugeFile:
+    """A file inside an ID that is bigger than the limit."""
+
+    size: int
+    type: Literal["HUGE_FILE"] = "HUGE_FILE"
+
+    def display(self, files: list[File]) -> str:
+        """Display this particular instance of an error."""
+        return f"{_print_nest(files[0])} [{_format_size(self.size)}]"
+
+    def explain(self) -> _Explanation:
+        """Explain what this error is."""
+        return _Explanation(
+            explanation="Some files inside IDs are huge.",
+            fix="Check that they belong there, e.g. not a forgotten disk image or export.",
+        )
+
+
 @dataclass(frozen=True)
 class IdDifferentFromJDex:
     """An ID with a differently-named JDex entry."""
@@ -313,6 +395,25 @@ class InvalidIDName:
         )
 
 
+@dataclass(frozen=True)
+class LitterFiles:
+    """An ID containing system or temporary files, e.g. .DS_Store."""
+
+    num_items: int
+    type: Literal["LITTER_FILES"] = "LITTER_FILES"
+
+    def display(self, files: list[File]) -> str:
+        """Display this particular instance of an error."""
+        return f"{_print_nest(files[0])} [{self.num_items} items]"
+
+    def explain(self) -> _Explanation:
+        """Explain what this error is."""
+        return _Explanation(
+            explanation="System and temporary files (.DS_Store, ._*, ~$*, *.tmp, ...) were found inside IDs.",
+            fix="Delete them, or ignore them with -i if they keep coming back.",
+        )
+
+
 @dataclass(frozen=True)
 class NonemptyInbox:
     """An inbox (AC.01) that contains items."""
@@ -338,16 +439,21 @@ ErrorType = Union[
     CategoryDifferentFromJDex,
     CategoryInWrongArea,
     CategoryNotInJDex,
+    DeepCheckOverBudget,
+    DeepNesting,
     DuplicateArea,
     DuplicateCategory,
     DuplicateId,
+    EmptyId,
     FileOutsideId,
+    HugeFile,
     IdDifferentFromJDex,
     IdInWrongCategory,
     IdNotInJDex,
     InvalidAreaName,
     InvalidCategoryName,
     InvalidIDName,
+    LitterFiles,
     NonemptyInbox,
 ]
 
@@ -670,6 +776,62 @@ class LintResults:
     used_ids: dict[str, list[tuple[str, File]]]
 
 
+@dataclass(frozen=True)
+class Fix:
+    """A move or rename of a folder that fixes an error."""
+
+    error: ErrorType
+    src: Path
+    dst: Path
+
+    def display(self, root: Path) -> str:
+        """Display the fix relative to the root."""
+        verb = "rename" if self.src.parent == self.dst.parent else "move"
+        return f"{verb} {self.src.relative_to(root)} -> {self.dst.relative_to(root)} ({self.error.type})"
+
+
+@dataclass(frozen=True)
+class DeepChecks:
+    """Limits for the opt-in checks inside IDs, and the budget each ID gets for them."""
+
+    max_depth: int = 4
+    huge_size: int = 1_000_000_000
+    max_entries: int = 50_000
+    max_seconds: float = 5.0
+
+
+@dataclass
+class Usage:
+    """Disk usage of the contents of a folder: allocated bytes, file count, and newest/oldest file mtimes."""
+
+    size: int = 0
+    files: int = 0
+    newest: float | None = None
+    oldest: float | None = None
+
+    def add(self, other: Usage) -> None:
+        """Add another folder's usage to this one."""
+        self.size += other.size
+        self.files += other.files
+        if other.newest is not None:
+            self.newest = other.newest if self.newest is None else max(self.newest, other.newest)
+        if other.oldest is not None:
+            self.oldest = other.oldest if self.oldest is None else min(self.oldest, other.oldest)
+
+    def add_file(self, st: os.stat_result) -> None:
+        """Count one file."""
+        self.add(Usage(size=st.st_blocks * 512, files=1, newest=st.st_mtime, oldest=st.st_mtime))
+
+
+@dataclass(frozen=True)
+class UsageRow:
+    """The usage of one ID, category, or area."""
+
+    level: Literal["area", "category", "id"]
+    path: str
+    usage: Usage
+
+
 @dataclass
 class _JDexAccumulator:
     """Accumulator used by _get_jdex_entries to gather information about the JDex."""
@@ -720,6 +882,18 @@ def _sort_file(f: File) -> tuple[list[str], str]:
     return (f.nested_under, f.name)
 
 
+# System and temporary files that shouldn't be kept in IDs
+litter_re = re.compile(
+    "\\.DS_Store|\\._.+|Thumbs\\.db|desktop\\.ini|~\\$.+|\\.~lock\\..+#|.+\\.tmp|\\.tmp\\.drive(?:down|up)load",
+    flags=re.IGNORECASE,
+)
+# Per-directory usage is cached here, keyed by root
+stats_cache_dir = Path.home() / "Library/Caches/jdlint"
+# Files that grow in place leave their folder's mtime alone, so the cache is dropped after this long
+stats_rescan_days = 7
+# ID folders walked at once by --stats and the deep checks
+stats_workers = 8
+
 # Any valid area folder name
 valid_area_re = re.compile("([0-9])0-(?:\\1)9 (.+)")
 # Any valid category folder name
@@ -807,7 +981,7 @@ def _process_single_file_jdex(path: Path) -> _JDexResults:
             area_match = jdex_line_area_re.fullmatch(entry.strip())
             if area_match:
                 file_areas[area_match.group(1)] = (
-                    f"{area_match.group(1)}0-09 {area_match.group(2)}"
+                    f"{_print_area(area_match.group(1))} {area_match.group(2)}"
                 )
                 continue
             category_match = jdex_line_category_re.fullmatch(entry.strip())
@@ -1082,11 +1256,92 @@ def _get_jdex_entries(
     )
 
 
+def _deep_check_id(f: File, deep: DeepChecks, ignored: list[str] | None) -> list[Error]:
+    """
+    Run every deep check on one ID in a single walk of its contents.
+
+    The walk stops once it has seen deep.max_entries entries or run for deep.max_seconds,
+    and reports that instead of whether the ID is empty.
+    """
+    errors: list[Error] = []
+    started = time.monotonic()
+    entries = 0
+    files = 0
+    litter = 0
+    deepest: tuple[int, File] | None = None
+    stack = [(f.full_path, [*f.nested_under, f.name], 0)]
+    while stack:
+        (dir_path, nested_under, depth) = stack.pop()
+        try:
+            dir_it = os.scandir(dir_path)
+        except OSError:
+            continue
+        with dir_it:
+            for entry in dir_it:
+                entries += 1
+                if entries > deep.max_entries or time.monotonic() - started > deep.max_seconds:
+                    errors.append(
+                        Error(
+                            error=DeepCheckOverBudget(
+                                entries=entries - 1,
+                                seconds=round(time.monotonic() - started, 1),
+                            ),
+                            files=[f],
+                        ),
+                    )
+                    stack = []
+                    break
+                if _entry_is_ignored(ignored, nested_under, entry):
+                    continue
+                if litter_re.fullmatch(entry.name):
+                    litter += 1
+                elif entry.is_dir(follow_symlinks=False):
+                    if depth + 1 > deep.max_depth and (deepest is None or depth + 1 > deepest[0]):
+                        deepest = (
+                            depth + 1,
+                            File(name=entry.name, full_path=entry.path, nested_under=nested_under),
+                        )
+                    stack.append((entry.path, [*nested_under, entry.name], depth + 1))
+                else:
+                    try:
+                        size = entry.stat(follow_symlinks=False).st_size
+                    except OSError:
+                        continue  # Gone since the listing, e.g. removed by a sync client
+                    files += 1
+                    if size >= deep.huge_size:
+                        errors.append(
+                            Error(
+                                error=HugeFile(size=size),
+                                files=[File(name=entry.name, full_path=entry.path, nested_under=nested_under)],
+                            ),
+                        )
+
+    over_budget = bool(errors) and isinstance(errors[-1].error, DeepCheckOverBudget)
+    if not files and not over_budget and not inbox_re.fullmatch(f.name):
+        errors.append(Error(error=EmptyId(), files=[f]))
+    if litter:
+        errors.append(Error(error=LitterFiles(num_items=litter), files=[f]))
+    if deepest:
+        errors.append(
+            Error(
+                error=DeepNesting(depth=deepest[0], max_depth=deep.max_depth),
+                files=[deepest[1]],
+            ),
+        )
+    return errors
+
+
 def lint_dir(
     path: Path,
     ignored: list[str] | None = None,
+    areas: set[str] | None = None,
+    deep: DeepChecks | None = None,
 ) -> LintResults:
-    """Check a root of a JD system for issues."""
+    """
+    Check a root of a JD system for issues, or only the area folders named in areas.
+
+    With deep, also look inside every ID (see _deep_check_id), stats_workers IDs at once.
+    """
     errors: list[Error] = []
     used_areas: dict[str, list[tuple[str, File]]] = {}
     used_categories: dict[str, list[tuple[str, File]]] = {}
@@ -1128,6 +1383,8 @@ def lint_dir(
 
     with os.scandir(path) as areas_it:
         for area in areas_it:
+            if areas is not None and area.name not in areas:
+                continue
             if _entry_is_ignored(ignored, [], area) or check_if_out_of_id(area, []):
                 continue
             area_file = File(
@@ -1238,6 +1495,14 @@ def lint_dir(
         errors.extend(_error_if_dups(DuplicateCategory, Error, used_categories))
         errors.extend(_error_if_dups(DuplicateId, Error, used_ids))
 
+    if deep:
+        with ThreadPoolExecutor(max_workers=stats_workers) as pool:
+            for id_errors in pool.map(
+                lambda f: _deep_check_id(f, deep, ignored),
+                [f for files in used_ids.values() for (_, f) in files],
+            ):
+                errors.extend(id_errors)
+
     return LintResults(
         errors=sorted(errors, key=_sort_error),
         used_areas=used_areas,
@@ -1252,14 +1517,19 @@ def lint_dir_and_jdex(
     jdex_path: Path,
     ignored: list[str] | None = None,
     alt_zeros: bool = False,
+    deep: DeepChecks | None = None,
 ) -> tuple[list[Error], list[JDexError]]:
     """Check a root of a JD system and its JDex for issues."""
-    results = lint_dir(path, ignored)
+    results = lint_dir(path, ignored, deep=deep)
     jdex = _get_jdex_entries(jdex_path, ignored=ignored, alt_zeros=alt_zeros)
     if isinstance(jdex, list):
         return (results.errors, sorted(jdex, key=_sort_error))
+    return (_compare_to_jdex(results, jdex), [])
 
-    errors = results.errors
+
+def _compare_to_jdex(results: LintResults, jdex: _JDexResults) -> list[Error]:
+    """Add the errors from comparing the areas, categories, and IDs used to the JDex."""
+    errors = list(results.errors)
 
     for area, files in results.used_areas.items():
         if area not in jdex.areas:
@@ -1309,7 +1579,438 @@ def lint_dir_and_jdex(
                     files=[f for (_, f) in files],
                 ),
             )
-    return (sorted(errors, key=_sort_error), [])
+    return sorted(errors, key=_sort_error)
+
+
+def _area_of(root: Path, path: Path) -> str:
+    """The name of the area folder that path is (in)."""
+    return path.relative_to(root).parts[0]
+
+
+def _single_folder(used: dict[str, list[tuple[str, File]]], key: str) -> Path | None:
+    """The folder used for an area/category, if there is exactly one."""
+    if len(used.get(key, [])) != 1:
+        return None
+    return Path(used[key][0][1].full_path)
+
+
+def plan_fixes(
+    results: LintResults,
+    errors: list[Error],
+) -> tuple[list[Fix], list[tuple[Error, str]]]:
+    """
+    Turn the errors of one lint into moves and renames, checked against each other and the disk.
+
+    IDs and categories in the wrong place move into the one folder for their category/area,
+    unless their number is already used there, and anything named differently from the
+    JDex gets the JDex name. No two fixes may claim the same name or number. Moves run before
+    renames, and deeper folders before their parents, so that every path is still the
+    one that was linted when it is used. Returns the fixes in that order and the errors
+    that can't be fixed, with the reason.
+    """
+    # Each candidate with what it claims: its new path (casefolded, as most Macs have
+    # case-insensitive file systems) and, for a move, its number
+    candidates: list[tuple[Error, Fix, list[str]]] = []
+    unfixable: list[tuple[Error, str]] = []
+    for e in errors:
+        src = Path(e.files[0].full_path)
+        if isinstance(e.error, IdInWrongCategory):
+            id_match = generic_id_re.fullmatch(src.name)
+            jid = f"{id_match.group(1)}.{id_match.group(2)}" if id_match else ""
+            parent = _single_folder(results.used_categories, e.error.id_ac)
+            if parent is None:
+                unfixable.append((e, f"there is no single category {e.error.id_ac} to move it to"))
+            elif jid in results.used_ids:
+                unfixable.append((e, f"ID {jid} is already used"))
+            else:
+                fix = Fix(error=e.error, src=src, dst=parent / src.name)
+                candidates.append((e, fix, [str(fix.dst).casefold(), jid]))
+        elif isinstance(e.error, CategoryInWrongArea):
+            category = src.name[:2]
+            parent = _single_folder(results.used_areas, e.error.category_area)
+            if parent is None:
+                unfixable.append(
+                    (e, f"there is no single area {_print_area(e.error.category_area)} to move it to"),
+                )
+            elif category in results.used_categories:
+                unfixable.append((e, f"category {category} is already used"))
+            else:
+                fix = Fix(error=e.error, src=src, dst=parent / src.name)
+                candidates.append((e, fix, [str(fix.dst).casefold(), category]))
+        elif isinstance(e.error, (AreaDifferentFromJDex, CategoryDifferentFromJDex, IdDifferentFromJDex)):
+            fix = Fix(error=e.error, src=src, dst=src.with_name(e.error.jdex_name))
+            candidates.append((e, fix, [str(fix.dst).casefold()]))
+
+    claims: dict[str, list[Fix]] = {}
+    for _, fix, keys in candidates:
+        for key in keys:
+            _insert_append(key, fix, claims)
+    fixes: list[Fix] = []
+    for e, fix, keys in candidates:
+        if any(len(claims[key]) > 1 for key in keys):
+            unfixable.append((e, f"another fix claims the same name or number as {fix.dst.name}"))
+        elif os.path.lexists(fix.dst) and not os.path.samefile(fix.src, fix.dst):
+            unfixable.append((e, f"{fix.dst.name} already exists there"))
+        else:
+            fixes.append(fix)
+
+    # Moves before renames, then deepest first
+    fixes.sort(key=lambda f: (f.src.parent == f.dst.parent, -len(f.src.parts)))
+    return (fixes, unfixable)
+
+
+def _batchrename() -> Any:
+    """utils/batchrename.py, which journals every batch of renames (it imports this module too)."""
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "utils"))
+    import batchrename
+
+    return batchrename
+
+
+def apply_fixes(fixes: list[Fix]) -> list[Fix]:
+    """
+    Move/rename in order as one journaled batch, stopping at the first failure.
+
+    The batch is batchrename's, so `batchrename undo` reverts it and `batchrename recover`
+    finishes or rolls back a run that was cut short. Returns the fixes that were applied.
+    """
+    batchrename = _batchrename()
+    try:
+        # Checked again against the disk: os.rename would silently replace an empty folder
+        steps = batchrename.plan_renames({fix.src: fix.dst for fix in fixes})
+    except batchrename.RenamePlanError as e:
+        print(f"Nothing was fixed: {e}")
+        return []
+    journal = batchrename.RenameJournal.create(steps, "fix")
+    failures = batchrename.execute_batch(steps, journal=journal)
+    if not failures:
+        return fixes
+    for folder, e in failures:
+        print(f"Stopped, {folder} could not be fixed: {e} (run batchrename recover to finish or roll back)")
+    # No fix claims another's name, so the plan has one step per fix
+    done = {steps[i] for i in batchrename.read_batch(journal.path)["done"]}
+    return [fix for fix in fixes if (fix.src, fix.dst) in done]
+
+
+def relint_areas(
+    path: Path,
+    previous: LintResults,
+    areas: set[str],
+    ignored: list[str] | None = None,
+    deep: DeepChecks | None = None,
+) -> LintResults:
+    """
+    Lint only the given areas again and merge them into the previous results.
+
+    Results from the other areas are kept as they were; duplicates are worked out
+    again across everything, since they can span areas.
+    """
+    fresh = lint_dir(path, ignored, areas=areas, deep=deep)
+    duplicates = (DuplicateArea, DuplicateCategory, DuplicateId)
+
+    def untouched(f: File) -> bool:
+        return (f.nested_under[0] if f.nested_under else f.name) not in areas
+
+    def merge(
+        old: dict[str, list[tuple[str, File]]],
+        new: dict[str, list[tuple[str, File]]],
+    ) -> dict[str, list[tuple[str, File]]]:
+        merged: dict[str, list[tuple[str, File]]] = {}
+        for k, v in old.items():
+            for entry in v:
+                if untouched(entry[1]):
+                    _insert_append(k, entry, merged)
+        for k, v in new.items():
+            for entry in v:
+                _insert_append(k, entry, merged)
+        return merged
+
+    used_areas = merge(previous.used_areas, fresh.used_areas)
+    used_categories = merge(previous.used_categories, fresh.used_categories)
+    used_ids = merge(previous.used_ids, fresh.used_ids)
+    errors = [
+        e
+        for e in previous.errors
+        if not isinstance(e.error, duplicates) and all(untouched(f) for f in e.files)
+    ]
+    errors.extend(e for e in fresh.errors if not isinstance(e.error, duplicates))
+    errors.extend(_error_if_dups(DuplicateArea, Error, used_areas))
+    errors.extend(_error_if_dups(DuplicateCategory, Error, used_categories))
+    errors.extend(_error_if_dups(DuplicateId, Error, used_ids))
+    return LintResults(
+        errors=sorted(errors, key=_sort_error),
+        used_areas=used_areas,
+        used_categories=used_categories,
+        used_ids=used_ids,
+    )
+
+
+def fix_dir(
+    *,
+    path: Path,
+    jdex_path: Path | None = None,
+    ignored: list[str] | None = None,
+    alt_zeros: bool = False,
+    apply: bool = False,
+    deep: DeepChecks | None = None,
+) -> tuple[list[Error], list[JDexError], list[Fix], list[tuple[Error, str]]]:
+    """
+    Lint once, plan the fixes, and with apply run them and re-lint only the areas they touched.
+
+    With a JDex, the JDex is taken to be right about names. A JDex with errors of its own
+    is not used for fixing. Deep checks are run and reported, but have no fixes.
+    Returns the errors left, the JDex errors, the fixes planned (or applied, with apply)
+    and the errors that can't be fixed.
+    """
+    results = lint_dir(path, ignored, deep=deep)
+    jdex = None
+    if jdex_path:
+        jdex_results = _get_jdex_entries(jdex_path, ignored=ignored, alt_zeros=alt_zeros)
+        if isinstance(jdex_results, list):
+            return (results.errors, sorted(jdex_results, key=_sort_error), [], [])
+        jdex = jdex_results
+    errors = _compare_to_jdex(results, jdex) if jdex else results.errors
+    fixes, unfixable = plan_fixes(results, errors)
+    if not apply or not fixes:
+        return (errors, [], fixes, unfixable)
+
+    fixes = apply_fixes(fixes)
+    areas = {_area_of(path, p) for fix in fixes for p in (fix.src, fix.dst)}
+    results = relint_areas(path, results, areas, ignored, deep)
+    errors = _compare_to_jdex(results, jdex) if jdex else results.errors
+    return (errors, [], fixes, unfixable)
+
+
+def _dir_usage(
+    path: str,
+    mtime_ns: int,
+    nested_under: list[str],
+    ignored: list[str] | None,
+    cache: dict[str, list],
+    new_cache: dict[str, list],
+) -> Usage:
+    """
+    Usage of everything under path, stat-ing each file once.
+
+    Each folder's own files are cached with the folder's mtime. A folder whose mtime
+    hasn't changed has the same entries, so its files aren't listed or stat-ed again;
+    only its subfolders are, for their mtimes. A folder that can't be listed is
+    counted as far as it was read and not cached.
+    """
+    total = Usage()
+    stack = [(path, mtime_ns, nested_under)]
+    while stack:
+        (dir_path, dir_mtime_ns, dir_nested_under) = stack.pop()
+        own = Usage()
+        subdirs: list[tuple[str, int]] = []
+        listed = True
+        cached = cache.get(dir_path)
+        if cached is not None and cached[0] == dir_mtime_ns:
+            own = Usage(*cached[1:5])
+            for name in cached[5]:
+                try:
+                    subdirs.append((name, os.stat(os.path.join(dir_path, name), follow_symlinks=False).st_mtime_ns))
+                except OSError:
+                    pass  # Gone since it was cached
+        else:
+            try:
+                with os.scandir(dir_path) as it:
+                    for entry in it:
+                        if _entry_is_ignored(ignored, dir_nested_under, entry):
+                            continue
+                        try:
+                            st = entry.stat(follow_symlinks=False)
+                            is_dir = entry.is_dir(follow_symlinks=False)
+                        except OSError:
+                            continue  # Gone since it was listed, or unreadable
+                        if is_dir:
+                            subdirs.append((entry.name, st.st_mtime_ns))
+                        else:
+                            own.add_file(st)
+            except OSError:
+                listed = False
+        if listed:
+            new_cache[dir_path] = [dir_mtime_ns, own.size, own.files, own.newest, own.oldest, [n for (n, _) in subdirs]]
+
+        total.add(own)
+        for name, sub_mtime_ns in subdirs:
+            stack.append((os.path.join(dir_path, name), sub_mtime_ns, [*dir_nested_under, name]))
+    return total
+
+
+def _stats_cache_path(path: Path, ignored: list[str] | None) -> Path:
+    """The cache file for a root and set of ignore patterns."""
+    key = json.dumps([str(path.resolve()), sorted(ignored or [])])
+    return stats_cache_dir / f"stats-{hashlib.sha256(key.encode()).hexdigest()[:16]}.json.gz"
+
+
+def _load_stats_cache(cache_path: Path, now: float) -> tuple[float, dict[str, list]]:
+    """The time the cache was started and its folders, or a new, empty cache once it is too old."""
+    try:
+        with gzip.open(cache_path, "rt") as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return (now, {})
+    if now - cache.get("time", 0) > stats_rescan_days * 24 * 60 * 60:
+        return (now, {})
+    return (cache["time"], cache.get("dirs", {}))
+
+
+def _save_stats_cache(cache_path: Path, started: float, dirs: dict[str, list]) -> None:
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    temp = cache_path.with_name(f".{cache_path.name}.{os.getpid()}.tmp")
+    with gzip.open(temp, "wt", compresslevel=1) as f:
+        # One dumps() is several times faster than dump()'s many small writes
+        f.write(json.dumps({"time": started, "dirs": dirs}))
+    os.replace(temp, cache_path)
+
+
+def usage_stats(
+    path: Path,
+    ignored: list[str] | None = None,
+    use_cache: bool = True,
+) -> list[UsageRow]:
+    """
+    Disk usage, file count, and newest/oldest mtime of every ID, and summed up per category and area.
+
+    The IDs come from one lint_dir walk and their contents are walked in parallel.
+    With use_cache, folders unchanged since the last run (by mtime) are taken from the
+    cache; it is dropped every stats_rescan_days, and only holds what this run walked.
+    """
+    started = time.time()
+    results = lint_dir(path, ignored)
+    cache_path = _stats_cache_path(path, ignored)
+    (cache_time, cache) = _load_stats_cache(cache_path, started) if use_cache else (started, {})
+    new_cache: dict[str, list] = {}
+    id_files = [f for files in results.used_ids.values() for (_, f) in files]
+
+    def walk(f: File) -> Usage:
+        try:
+            mtime_ns = os.stat(f.full_path, follow_symlinks=False).st_mtime_ns
+        except OSError:
+            return Usage()
+        return _dir_usage(f.full_path, mtime_ns, [*f.nested_under, f.name], ignored, cache, new_cache)
+
+    # A task per category rather than per ID: with the cache, an ID takes less time than handing it to a thread
+    by_category: dict[tuple[str, ...], list[File]] = {}
+    for f in id_files:
+        _insert_append(tuple(f.nested_under), f, by_category)
+    id_files = [f for files in by_category.values() for f in files]
+    with ThreadPoolExecutor(max_workers=stats_workers) as pool:
+        id_usages = [
+            usage
+            for usages in pool.map(lambda files: [walk(f) for f in files], by_category.values())
+            for usage in usages
+        ]
+    if use_cache:
+        # The cache keeps its age, so it is still dropped after stats_rescan_days
+        _save_stats_cache(cache_path, cache_time, new_cache)
+
+    areas = {f.name: Usage() for files in results.used_areas.values() for (_, f) in files}
+    categories = {
+        (f.nested_under[0], f.name): Usage() for files in results.used_categories.values() for (_, f) in files
+    }
+    rows = []
+    for f, usage in zip(id_files, id_usages):
+        categories[(f.nested_under[0], f.nested_under[1])].add(usage)
+        areas[f.nested_under[0]].add(usage)
+        rows.append(UsageRow(level="id", path=_print_nest(f), usage=usage))
+    rows.extend(UsageRow(level="category", path=f"{a}/{c}", usage=u) for (a, c), u in categories.items())
+    rows.extend(UsageRow(level="area", path=a, usage=u) for a, u in areas.items())
+    return rows
+
+
+def sort_usage_rows(
+    rows: list[UsageRow],
+    level: str,
+    key: str = "name",
+    reverse: bool = False,
+) -> list[UsageRow]:
+    """
+    The rows of one level, in order of key.
+
+    name sorts alphabetically, size and files biggest first, and newest/oldest
+    earliest first, so the IDs untouched the longest come first (empty ones before all).
+    """
+    sort_keys: dict[str, Callable[[UsageRow], Any]] = {
+        "name": lambda r: r.path,
+        "size": lambda r: -r.usage.size,
+        "files": lambda r: -r.usage.files,
+        "newest": lambda r: r.usage.newest or 0,
+        "oldest": lambda r: r.usage.oldest or 0,
+    }
+    return sorted(
+        [r for r in rows if r.level == level],
+        key=lambda r: (sort_keys[key](r), r.path),
+        reverse=reverse,
+    )
+
+
+def _format_size(size: int) -> str:
+    """Human-readable size, e.g. 1.2 GB."""
+    value = float(size)
+    for unit in ("B", "KB", "MB", "GB", "TB"):
+        if value < 1000 or unit == "TB":
+            return f"{value:.0f} {unit}" if unit == "B" else f"{value:.1f} {unit}"
+        value /= 1000
+    return f"{size} B"
+
+
+def _parse_size(text: str) -> int:
+    """Parse a size such as 500M or 2G (decimal units, as Finder shows them)."""
+    m = re.fullmatch("([0-9]+(?:\\.[0-9]+)?) *([KMGT]?)B?", text.strip(), flags=re.IGNORECASE)
+    if not m:
+        raise argparse.ArgumentTypeError(f"not a size: {text}")
+    return int(float(m.group(1)) * 1000 ** " KMGT".index(m.group(2).upper() or " "))
+
+
+def _format_date(t: float | None) -> str:
+    return time.strftime("%Y-%m-%d", time.localtime(t)) if t is not None else "-"
+
+
+def _format_iso(t: float | None) -> str | None:
+    return time.strftime("%Y-%m-%dT%H:%M:%S%z", time.localtime(t)) if t is not None else None
+
+
+def print_usage_rows(rows: list[UsageRow], level: str, output: Literal["text", "csv", "json"]) -> None:
+    """Print usage rows as an aligned table, CSV, or JSON."""
+    if output == "json":
+        json.dump(
+            [
+                {
+                    "level": r.level,
+                    "path": r.path,
+                    "size": r.usage.size,
+                    "files": r.usage.files,
+                    "newest": _format_iso(r.usage.newest),
+                    "oldest": _format_iso(r.usage.oldest),
+                }
+                for r in rows
+            ],
+            sys.stdout,
+        )
+        return
+    if output == "csv":
+        writer = csv.writer(sys.stdout)
+        writer.writerow(["level", "path", "size", "files", "newest", "oldest"])
+        for r in rows:
+            writer.writerow(
+                [
+                    r.level,
+                    r.path,
+                    r.usage.size,
+                    r.usage.files,
+                    _format_iso(r.usage.newest) or "",
+                    _format_iso(r.usage.oldest) or "",
+                ],
+            )
+        return
+    print(f"{'SIZE':>9}  {'FILES':>9}  {'NEWEST':<10}  {'OLDEST':<10}  {level.upper()}")
+    for r in rows:
+        print(
+            f"{_format_size(r.usage.size):>9}  {r.usage.files:>9,}  "
+            f"{_format_date(r.usage.newest):<10}  {_format_date(r.usage.oldest):<10}  {r.path}",
+        )
 
 
 def _print_area(d: str) -> str:
@@ -1373,19 +2074,142 @@ if __name__ == "__main__":
         const=True,
         help="Specify use of the alternative standard zeros layout; see the README for more info",
     )
+    parser.add_argument(
+        "--fix",
+        dest="fix",
+        action="store_const",
+        const=True,
+        help="Plan moves/renames for misplaced IDs and categories and, with --jdex, names that differ from the JDex",
+    )
+    parser.add_argument(
+        "--apply",
+        dest="apply",
+        action="store_const",
+        const=True,
+        help="With --fix, carry out the plan instead of only showing it",
+    )
+
+    parser.add_argument(
+        "--stats",
+        dest="stats",
+        choices=["area", "category", "id"],
+        nargs="?",
+        const="id",
+        help="Instead of linting, list the disk usage, file count, and newest/oldest file of every ID (or category/area)",
+    )
+    parser.add_argument(
+        "--sort",
+        dest="sort",
+        choices=["name", "size", "files", "newest", "oldest"],
+        default="name",
+        help="With --stats: size/files list the biggest first, newest/oldest the least recently touched first",
+    )
+    parser.add_argument(
+        "--reverse",
+        dest="reverse",
+        action="store_const",
+        const=True,
+        help="With --stats, reverse the order",
+    )
+    parser.add_argument(
+        "--csv",
+        dest="csv",
+        action="store_const",
+        const=True,
+        help="With --stats, output CSV",
+    )
+    parser.add_argument(
+        "--no-cache",
+        dest="no_cache",
+        action="store_const",
+        const=True,
+        help="With --stats, walk everything instead of reusing folders unchanged since the last run",
+    )
+
+    parser.add_argument(
+        "--deep",
+        dest="deep",
+        action="store_const",
+        const=True,
+        help="Also check inside IDs: EMPTY_ID, DEEP_NESTING, HUGE_FILE, and LITTER_FILES",
+    )
+    parser.add_argument(
+        "--max-depth",
+        dest="max_depth",
+        type=int,
+        default=DeepChecks.max_depth,
+        help=f"With --deep, folder levels allowed inside an ID (default {DeepChecks.max_depth})",
+    )
+    parser.add_argument(
+        "--huge",
+        dest="huge_size",
+        type=_parse_size,
+        default=DeepChecks.huge_size,
+        metavar="SIZE",
+        help="With --deep, the size from which a file is huge, e.g. 500M (default 1G)",
+    )
+    parser.add_argument(
+        "--id-budget",
+        dest="id_budget",
+        nargs=2,
+        type=float,
+        default=[DeepChecks.max_entries, DeepChecks.max_seconds],
+        metavar=("ENTRIES", "SECONDS"),
+        help=f"With --deep, stop checking an ID after this many entries or seconds (default {DeepChecks.max_entries} {DeepChecks.max_seconds:g})",
+    )
 
     args = parser.parse_args()
+    deep = (
+        DeepChecks(
+            max_depth=args.max_depth,
+            huge_size=args.huge_size,
+            max_entries=int(args.id_budget[0]),
+            max_seconds=args.id_budget[1],
+        )
+        if args.deep
+        else None
+    )
+
+    if args.stats:
+        rows = usage_stats(Path(args.path), args.ignored, use_cache=not args.no_cache)
+        print_usage_rows(
+            sort_usage_rows(rows, args.stats, args.sort, bool(args.reverse)),
+            args.stats,
+            "json" if args.json else "csv" if args.csv else "text",
+        )
+        sys.exit(0)
 
     # Get all errors
-    if args.jdex:
+    fixes: list[Fix] = []
+    if args.fix:
+        (errors, jdex_errors, fixes, unfixable) = fix_dir(
+            path=Path(args.path),
+            jdex_path=Path(args.jdex) if args.jdex else None,
+            ignored=args.ignored,
+            alt_zeros=args.altzeros,
+            apply=bool(args.apply),
+            deep=deep,
+        )
+        if not args.json:
+            if fixes:
+                print("Fixes applied:" if args.apply else "Fixes (dry run, add --apply to make them):")
+                print("\n".join(["  " + fix.display(Path(args.path)) for fix in fixes]))
+            if unfixable:
+                print("Can't fix:")
+                print("\n".join([f"  {e.display()} ({reason})" for (e, reason) in unfixable]))
+            if jdex_errors:
+                print("The JDex has errors, so nothing was fixed.")
+            print()
+    elif args.jdex:
         (errors, jdex_errors) = lint_dir_and_jdex(
             path=Path(args.path),
             jdex_path=Path(args.jdex),
             ignored=args.ignored,
             alt_zeros=args.altzeros,
+            deep=deep,
         )
     else:
-        errors = (lint_dir(args.path, args.ignored)).errors
+        errors = (lint_dir(args.path, args.ignored, deep=deep)).errors
         jdex_errors = []
 
     # Filter disabled errors
@@ -1397,7 +2221,8 @@ if __name__ == "__main__":
         # Dump to JSON if asked
         if args.json:
             json.dump(
-                {"errors": errors, "jdex_errors": jdex_errors},
+                {"errors": errors, "jdex_errors": jdex_errors}
+                | ({"fixes": fixes} if args.fix else {}),
                 sys.stdout,
                 cls=_EnhancedJSONEncoder,
             )
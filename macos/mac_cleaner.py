@@ -3,16 +3,82 @@
 import os
 import sys
 import shutil
+import stat
 import time
 import subprocess
 import plistlib
+import json
+import argparse
+import shlex
 import re
+import select
+import threading
+import heapq
+import random
+import math
+import hashlib
+import gzip
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, FIRST_COMPLETED, wait
 from pathlib import Path
 from difflib import SequenceMatcher
 
 # Constants
+# The system volume. Only the benchmark suite (mac_cleaner_bench.py) points this at a fake tree.
+SYSTEM_ROOT = Path(os.environ.get("MAC_CLEANER_ROOT", "/"))
 LARGE_FILE_THRESHOLD_BYTES = 500 * 1024 * 1024  # 500 MB
 UNUSED_APP_THRESHOLD_SECONDS = 6 * 30 * 24 * 60 * 60  # ~6 months
+LARGE_FILE_TOP_K = 100  # Largest files kept by the native large-file finder
+LARGE_FILE_SCAN_WORKERS = 8
+DISPLAY_COUNT = 15  # Candidates shown per stage
+LIVE_REFRESH_SECONDS = 0.5  # Redraw interval while a stage is still scanning
+
+# Roots walked by the native large-file finder when Spotlight has nothing for us
+LARGE_FILE_SCAN_ROOTS = [
+    Path.home(),
+    SYSTEM_ROOT / "Users/Shared",
+]
+
+# Duplicate finder: files at least this big are compared
+DUPLICATE_MIN_BYTES = 64 * 1024 * 1024  # 64 MB
+DUPLICATE_EDGE_BYTES = 64 * 1024  # Read from both ends of a file for the partial hash
+DUPLICATE_CHUNK_BYTES = 8 * 1024 * 1024  # Read size while comparing whole files
+DUPLICATE_HASH_WORKERS = 4
+DUPLICATE_OPEN_FILES = 32  # Files each comparison keeps open; the rest are reopened per chunk
+
+# Locations where 'System Data' hides, walked once into a usage tree
+USAGE_TREE_ROOTS = [
+    Path.home() / "Library",
+    SYSTEM_ROOT / "Library",
+    SYSTEM_ROOT / "Users/Shared",
+]
+USAGE_COLLAPSE_BYTES = 64 * 1024 * 1024  # Smaller subtrees are kept as a single total
+USAGE_HOTSPOT_BYTES = 1 * 1024 * 1024 * 1024  # Folders worth listing in the deep scan
+
+# --estimate: directory sizes for threshold checks are sampled instead of walked
+ESTIMATE_FILE_SAMPLES = 16  # Files measured per directory, the others are extrapolated
+ESTIMATE_Z = 2.58  # ~99% confidence interval
+
+# Wall-clock budget per scan stage (0 = no limit), see --budget.
+# A stage that runs out of time stops and offers what it found so far.
+STAGE_BUDGET_SECONDS = {
+    'unused': 300,
+    'leftovers': 300,
+    'large': 600,
+    'duplicates': 900,
+    'junk': 600,
+    'usage': 900,
+}
+
+# Deletion: items are first moved into a staging directory on their own volume,
+# then purged in the background. Journals let an interrupted purge resume.
+PURGE_JOURNAL_DIR = Path.home() / "Library/Application Support/mac_cleaner/purges"
+TRASH_DIR = Path.home() / ".Trash"  # Staging on the home volume goes in here
+STAGING_DIR_NAME = ".mac_cleaner-staging"  # Staging at the root of any other volume
+PURGE_WORKERS = 4
+
+# Cloud Storage paths (Box, Dropbox, OneDrive, Drive, iCloud) whose files may be placeholders
+CLOUD_PATH_MARKERS = ("Library/CloudStorage", "Library/Mobile Documents", ".tmp.driveupload")
 
 # Locations to scan for leftovers
 LIBRARY_SCAN_DIRS = [
@@ -22,21 +88,56 @@ LIBRARY_SCAN_DIRS = [
     Path.home() / "Library/Containers",
     Path.home() / "Library/Saved Application State",
     Path.home() / "Library/WebKit",
-    Path("/Library/Application Support"),
-    Path("/Library/Caches"),
+    SYSTEM_ROOT / "Library/Application Support",
+    SYSTEM_ROOT / "Library/Caches",
 ]
 
-# Folders to ignore absolutely (System / Apple)
-IGNORE_NAMES = {
-    "com.apple", "ContextStore", "CloudKit", "Safari", "Siri", 
-    "News", "Stocks", "Weather", "Maps", "Photos", "iCloud",
-    "Caches", "Cookies", "Logs"
+# Top-level categories in the disk usage summary
+DISK_USAGE_DIRS = {
+    "Applications": SYSTEM_ROOT / "Applications",
+    "User Applications": Path.home() / "Applications",
+    "Library": SYSTEM_ROOT / "Library",
+    "User Library": Path.home() / "Library",
+    "System": SYSTEM_ROOT / "System",
+    "Users": SYSTEM_ROOT / "Users",
+    "Home": Path.home(),
+}
+
+# Size history (--snapshot / --diff): folder sizes below DISK_USAGE_DIRS and
+# LIBRARY_SCAN_DIRS, recorded down to SIZE_HISTORY_DEPTH levels below each of them
+SIZE_HISTORY_DIR = Path.home() / "Library/Application Support/mac_cleaner/size-history"
+SIZE_HISTORY_DEPTH = 3
+SIZE_HISTORY_RESCAN_DAYS = 7  # Folders unchanged by mtime are trusted from the cache for at most this long
+SIZE_HISTORY_RESTAT_BYTES = 64 * 1024 * 1024  # Files this big are stat'ed again even in cached folders
+SIZE_HISTORY_TOP = 20  # Growing folders listed by --diff
+SIZE_HISTORY_SHARE = 0.8  # A folder is left out of --diff when one subfolder explains this much of its growth
+
+# External commands: per-program timeouts and how many may run at once
+COMMAND_TIMEOUT_SECONDS = {
+    'du': 300,
+    'mdls': 15,
+    'mdfind': 120,
+    'tmutil': 300,
+    'df': 15,
 }
+DEFAULT_COMMAND_TIMEOUT_SECONDS = 60
+TRACE_SLOW_SIZE_SECONDS = 1.0  # get_directory_size calls slower than this are colored in --trace output
+TRACE_COUNTER_INTERVAL_SECONDS = 0.01  # Counter samples per counter are at least this far apart
+CANCEL_POLL_SECONDS = 0.25  # How often running commands check whether their stage was cancelled
+CANCEL_CHECK_ENTRIES = 1000  # How often directory walkers check it, in entries listed
+COMMAND_CONCURRENCY = 4
+
+# Keep rules for leftover detection (system folders, CLI tools, vendor folders)
+LEFTOVER_RULES_PATH = Path(__file__).resolve().with_name("cleaner-rules.tsv")
 
 def check_command_exists(cmd):
     """Check if a command-line tool exists."""
     return shutil.which(cmd) is not None
 
+def item_sort_key(item):
+    """Candidates sort by size, with pinned entries (size unknown) first."""
+    return (item.get('pinned', False), item['size'])
+
 def format_size(size_bytes):
     """Format bytes to human readable string."""
     for unit in ['B', 'KB', 'MB', 'GB', 'TB']:
@@ -45,16 +146,602 @@ def format_size(size_bytes):
         size_bytes /= 1024
     return f"{size_bytes:.1f} PB"
 
+class _NullSpan:
+    """What trace_span returns when tracing is off: does nothing, costs nothing."""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **args):
+        pass
+
+_NULL_SPAN = _NullSpan()
+
+class _TraceSpan:
+    def __init__(self, tracer, name, cat, args):
+        self.tracer = tracer
+        self.event = {'name': name, 'cat': cat, 'ph': 'X', 'args': args}
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter()
+        self.event['ts'] = self.tracer.micros(self.start)
+        self.event['dur'] = round((end - self.start) * 1e6, 1)
+        if exc[0] is not None:
+            self.event['args']['error'] = exc[0].__name__
+        if self.event['args'].get('slow'):
+            self.event['cname'] = "terrible"  # Red in chrome://tracing
+        self.tracer.add(self.event)
+        return False
+
+    def set(self, **args):
+        """Adds arguments (e.g. results) to the span before it ends."""
+        self.event['args'].update(args)
+
+class Tracer:
+    """
+    Collects Chrome trace events (spans and counters) for --trace.
+    The file loads in Perfetto (ui.perfetto.dev) or chrome://tracing.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._events = []
+        self._threads = {}
+        self._counters = {}  # name -> [totals, last emitted]
+        self._origin = time.perf_counter()
+        self._pid = os.getpid()
+
+    def micros(self, t):
+        return round((t - self._origin) * 1e6, 1)
+
+    def span(self, name, cat, args):
+        return _TraceSpan(self, name, cat, args)
+
+    def add(self, event):
+        thread = threading.current_thread()
+        event['pid'] = self._pid
+        event['tid'] = thread.ident
+        with self._lock:
+            if thread.ident not in self._threads:
+                self._threads[thread.ident] = thread.name
+            self._events.append(event)
+
+    def count(self, name, values):
+        now = time.perf_counter()
+        with self._lock:
+            counter = self._counters.setdefault(name, [dict.fromkeys(values, 0), 0.0])
+            totals = counter[0]
+            for key, value in values.items():
+                totals[key] = totals.get(key, 0) + value
+            if now - counter[1] < TRACE_COUNTER_INTERVAL_SECONDS:
+                return
+            counter[1] = now
+            self._events.append({'name': name, 'ph': 'C', 'ts': self.micros(now), 'pid': self._pid,
+                                 'args': dict(totals)})
+
+    def totals(self, name):
+        """The running totals of a counter, e.g. {'edges': ..., 'full': ...} for "bytes hashed"."""
+        with self._lock:
+            return dict(self._counters.get(name, [{}])[0])
+
+    def save(self):
+        now = self.micros(time.perf_counter())
+        with self._lock:
+            events = list(self._events)
+            events += [{'name': name, 'ph': 'C', 'ts': now, 'pid': self._pid, 'args': dict(totals)}
+                       for name, (totals, _) in self._counters.items()]
+            events += [{'name': 'thread_name', 'ph': 'M', 'pid': self._pid, 'tid': tid, 'args': {'name': name}}
+                       for tid, name in self._threads.items()]
+        with open(self.path, "w", encoding="utf-8") as fp:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, fp)
+
+_tracer = None
+
+def set_tracer(tracer):
+    """Starts (a Tracer) or stops (None) recording trace events."""
+    global _tracer
+    _tracer = tracer
+    return tracer
+
+def trace_span(name, cat="cleaner", **args):
+    """Context manager timing a span for --trace; a shared no-op when tracing is off."""
+    if _tracer is None:
+        return _NULL_SPAN
+    return _tracer.span(name, cat, args)
+
+def trace_count(name, **values):
+    """Adds values to the running totals of a --trace counter."""
+    if _tracer is not None:
+        _tracer.count(name, values)
+
+def ask(prompt):
+    """input(), traced as time spent waiting for the user."""
+    with trace_span("waiting for user", "interactive", prompt=prompt.strip()):
+        return input(prompt)
+
+class StageCancelled(Exception):
+    """Raised inside a scan whose stage was cancelled or ran out of time."""
+
+class CancelToken:
+    """
+    Cooperative cancellation for one stage: an optional deadline plus cancel().
+    Scans poll it through check_cancelled(); commands are killed when it fires.
+    A token with a parent also fires when the parent does, and shares its deadline.
+    """
+    def __init__(self, budget=None, parent=None):
+        self.deadline = time.monotonic() + budget if budget else (parent and parent.deadline)
+        self.reason = None  # "timed out", "interrupted", "stopped" or "decided"
+        self.parent = parent
+        self._event = threading.Event()
+
+    def cancel(self, reason="stopped"):
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+
+    @property
+    def cancelled(self):
+        if not self._event.is_set() and self.deadline is not None and time.monotonic() > self.deadline:
+            self.cancel("timed out")
+        if not self._event.is_set() and self.parent is not None and self.parent.cancelled:
+            self.cancel(self.parent.reason)
+        return self._event.is_set()
+
+    def check(self):
+        if self.cancelled:
+            raise StageCancelled(self.reason)
+
+    def remaining(self):
+        """Seconds left before the deadline, or None without one."""
+        if self.deadline is None:
+            return None
+        return max(self.deadline - time.monotonic(), 0)
+
+_NO_CANCEL = CancelToken()
+_stage_context = threading.local()
+
+def current_cancel_token():
+    """The token of the stage running in this thread (one that never fires outside stages)."""
+    return getattr(_stage_context, 'token', None) or _NO_CANCEL
+
+def check_cancelled():
+    """Raises StageCancelled if the current stage was cancelled or is out of time."""
+    current_cancel_token().check()
+
+def with_cancel_token(token, fn):
+    """Wraps fn so it runs as part of token's stage, e.g. in a worker pool."""
+    def run(*args, **kwargs):
+        previous = getattr(_stage_context, 'token', None)
+        _stage_context.token = token
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _stage_context.token = previous
+    return run
+
+class CommandResult:
+    """Outcome of an external command. error is None on success."""
+    __slots__ = ('args', 'returncode', 'stdout', 'error', 'elapsed')
+
+    def __init__(self, args, returncode, stdout, error, elapsed):
+        self.args = args
+        self.returncode = returncode
+        self.stdout = stdout
+        self.error = error
+        self.elapsed = elapsed
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def describe(self):
+        return f"{shlex.join(self.args)}: {self.error}"
+
+class CommandFailed(Exception):
+    def __init__(self, result):
+        super().__init__(result.describe())
+        self.result = result
+
+class SubprocessBackend:
+    """Runs commands for real."""
+    def run(self, args, timeout, cancel=_NO_CANCEL):
+        # Own session: Ctrl-C is meant for the stage on screen, not for every
+        # du running in the background. The stage's token kills it instead.
+        with subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                              text=True, errors='replace', start_new_session=True) as proc:
+            deadline = time.monotonic() + timeout
+            while True:
+                try:
+                    stdout, _ = proc.communicate(timeout=CANCEL_POLL_SECONDS)
+                    return proc.returncode, stdout
+                except subprocess.TimeoutExpired:
+                    if cancel.cancelled or time.monotonic() > deadline:
+                        proc.kill()
+                        proc.communicate()
+                        raise subprocess.TimeoutExpired(args, timeout)
+
+class RecordingBackend:
+    """Runs commands through another backend and records their output for replay."""
+    def __init__(self, path, backend=None):
+        self.path = path
+        self.backend = backend or SubprocessBackend()
+        self._lock = threading.Lock()
+        self._recordings = {}
+
+    def run(self, args, timeout, cancel=_NO_CANCEL):
+        returncode, stdout = self.backend.run(args, timeout, cancel)
+        with self._lock:
+            self._recordings[tuple(args)] = {'args': list(args), 'returncode': returncode, 'stdout': stdout}
+        return returncode, stdout
+
+    def save(self):
+        with self._lock:
+            recordings = list(self._recordings.values())
+        with open(self.path, "w", encoding="utf-8") as fp:
+            json.dump({'recordings': recordings}, fp, indent=1)
+
+class FakeBackend:
+    """
+    Answers commands without the macOS tools, so the cleaner runs anywhere.
+    Recorded output (see RecordingBackend) is replayed first; otherwise du,
+    mdls, mdfind, tmutil and df are emulated in Python.
+    """
+    def __init__(self, recordings_path=None, last_used=None, snapshots=None, spotlight_roots=None,
+                 snapshot_bytes=0):
+        self._recordings = {}
+        if recordings_path:
+            with open(recordings_path, encoding="utf-8") as fp:
+                for record in json.load(fp).get('recordings', []):
+                    self._recordings[tuple(record['args'])] = (record['returncode'], record['stdout'])
+        self.last_used = dict(last_used or {})  # app path -> "2023-10-27 10:00:00 +0000"
+        self.snapshots = list(snapshots or [])  # "com.apple.TimeMachine.2023-10-25-100000.local"
+        self.snapshot_bytes = snapshot_bytes  # Space each fake snapshot holds, freed on delete
+        self.spotlight_roots = spotlight_roots
+        self._lock = threading.Lock()
+
+    def run(self, args, timeout, cancel=_NO_CANCEL):
+        if tuple(args) in self._recordings:
+            return self._recordings[tuple(args)]
+        handler = getattr(self, f"_fake_{os.path.basename(args[0])}", None)
+        if handler is None:
+            raise FileNotFoundError(f"{args[0]}: not recorded and no fake available")
+        return handler(args[1:])
+
+    @staticmethod
+    def _disk_usage(path):
+        total = 0
+        for dirpath, dirnames, filenames in os.walk(path):
+            check_cancelled()
+            for name in filenames + dirnames:
+                try:
+                    total += os.lstat(os.path.join(dirpath, name)).st_blocks * 512
+                except OSError:
+                    pass
+        return total
+
+    def _fake_du(self, args):
+        path = args[-1]
+        if not os.path.exists(path):
+            return 1, ""
+        size = self._disk_usage(path)
+        if "-sh" in args:
+            return 0, f"{format_size(size).replace(' ', '')}\t{path}\n"
+        return 0, f"{size // 1024}\t{path}\n"
+
+    def _fake_mdls(self, args):
+        return 0, self.last_used.get(args[-1], "(null)")
+
+    def _fake_mdfind(self, args):
+        match = re.fullmatch(r"kMDItemFSSize > (\d+)", args[-1])
+        if not match:
+            return 1, ""
+        threshold = int(match.group(1))
+        roots = self.spotlight_roots if self.spotlight_roots is not None else [str(Path.home())]
+        hits = []
+        for root in roots:
+            for dirpath, _, filenames in os.walk(root):
+                for name in filenames:
+                    path = os.path.join(dirpath, name)
+                    try:
+                        if os.lstat(path).st_size > threshold:
+                            hits.append(path)
+                    except OSError:
+                        pass
+        return 0, "\n".join(hits) + "\n"
+
+    def _fake_tmutil(self, args):
+        with self._lock:
+            if args[:1] == ["listlocalsnapshots"]:
+                return 0, "".join(f"{s}\n" for s in self.snapshots)
+            if args[:1] == ["deletelocalsnapshots"]:
+                target = args[1] if len(args) > 1 else ""
+                if target.startswith("/"):
+                    self.snapshots = []  # Whole volume
+                else:
+                    self.snapshots = [s for s in self.snapshots if target not in s]
+                return 0, ""
+        return 1, ""
+
+    def _fake_df(self, args):
+        stats = os.statvfs(args[-1])
+        size = stats.f_blocks * stats.f_frsize
+        with self._lock:
+            held = len(self.snapshots) * self.snapshot_bytes
+        avail = max(stats.f_bavail * stats.f_frsize - held, 0)
+        used = size - stats.f_bfree * stats.f_frsize + held
+        pct = round(used / size * 100) if size else 0
+        if "-k" in args:
+            fmt = lambda n: str(n // 1024)
+        else:
+            fmt = lambda n: format_size(n).replace(' ', '')
+        return 0, (f"Filesystem Size Used Avail Capacity Mounted on\n"
+                   f"fake {fmt(size)} {fmt(used)} {fmt(avail)} {pct}% {args[-1]}\n")
+
+class CommandExecutor:
+    """
+    The one way the cleaner runs external commands.
+    Adds per-program timeouts, a global limit on concurrent commands,
+    optional memoization of identical calls and a record of every failure.
+    """
+    def __init__(self, backend=None, max_parallel=COMMAND_CONCURRENCY):
+        self.backend = backend or SubprocessBackend()
+        self.max_parallel = max_parallel
+        self._slots = threading.BoundedSemaphore(max_parallel)
+        self._lock = threading.Lock()
+        self._memo = {}
+        self.failures = []
+        self.counts = {}  # program -> number of commands run
+
+    def run(self, args, timeout=None, memo=False, cancel=None):
+        """
+        Runs args and returns a CommandResult; never raises for command failures.
+        The command is bounded by the deadline of the calling stage and raises
+        StageCancelled when that stage is cancelled.
+        """
+        args = [str(a) for a in args]
+        cancel = cancel or current_cancel_token()
+        if not memo:
+            return self._run(args, timeout, cancel)
+        key = tuple(args)
+        while True:
+            with self._lock:
+                future = self._memo.get(key)
+                owner = future is None
+                if owner:
+                    future = self._memo[key] = Future()
+            if owner:
+                try:
+                    result = self._run(args, timeout, cancel)
+                except BaseException as e:
+                    with self._lock:
+                        self._memo.pop(key, None)
+                    future.set_exception(e)
+                    raise
+                future.set_result(result)
+                return result
+            try:
+                return future.result()
+            except StageCancelled:
+                continue  # The stage that ran it was cancelled; run it for this one
+
+    def forget(self, *args):
+        """Drops memoized results of commands starting with args."""
+        prefix = tuple(str(a) for a in args)
+        with self._lock:
+            for key in [k for k in self._memo if k[:len(prefix)] == prefix]:
+                del self._memo[key]
+
+    def run_many(self, commands, timeout=None):
+        """Runs several commands in parallel (bounded) and returns results in order."""
+        commands = list(commands)
+        if not commands:
+            return []
+        cancel = current_cancel_token()
+        with ThreadPoolExecutor(max_workers=self.max_parallel) as pool:
+            return list(pool.map(lambda args: self.run(args, timeout, cancel=cancel), commands))
+
+    def _run(self, args, timeout, cancel):
+        program = os.path.basename(args[0])
+        if timeout is None:
+            timeout = COMMAND_TIMEOUT_SECONDS.get(program, DEFAULT_COMMAND_TIMEOUT_SECONDS)
+        remaining = cancel.remaining()
+        if remaining is not None:
+            timeout = min(timeout, remaining)
+        with self._slots, trace_span(program, "command", args=shlex.join(args)) as span:
+            cancel.check()
+            trace_count("subprocesses", spawned=1)
+            start = time.monotonic()
+            returncode, stdout, error = None, "", None
+            try:
+                returncode, stdout = self.backend.run(args, timeout, cancel)
+                if returncode != 0:
+                    error = f"exit status {returncode}"
+            except subprocess.TimeoutExpired:
+                error = f"timed out after {timeout}s"
+            except OSError as e:
+                error = str(e)
+            elapsed = time.monotonic() - start
+            span.set(returncode=returncode, error=error)
+        if error:
+            cancel.check()  # Killed because the stage ended, not a failure of the command
+        result = CommandResult(args, returncode, stdout, error, elapsed)
+        with self._lock:
+            self.counts[program] = self.counts.get(program, 0) + 1
+            if error:
+                self.failures.append(result)
+        return result
+
+    def report_failures(self):
+        """Prints a summary of the commands that failed, grouped by program."""
+        if not self.failures:
+            return
+        by_program = {}
+        for result in self.failures:
+            by_program.setdefault(os.path.basename(result.args[0]), []).append(result)
+        print(f"\n⚠️  {len(self.failures)} external commands failed (results may be incomplete):")
+        for program, results in sorted(by_program.items()):
+            print(f"  {program}: {len(results)} failed, e.g. {results[0].describe()}")
+
+_executor = CommandExecutor()
+
+def get_executor():
+    return _executor
+
+def set_command_backend(backend):
+    """Routes all external commands through backend (e.g. a FakeBackend)."""
+    global _executor
+    _executor = CommandExecutor(backend)
+    return _executor
+
 def get_directory_size(path):
     """Get directory size using du for speed."""
     if os.path.isfile(path):
         return os.path.getsize(path)
-    try:
+    with trace_span("get_directory_size", "size", path=str(path)) as span:
+        start = time.monotonic()
         # -sk returns size in KB
-        res = subprocess.check_output(['du', '-sk', str(path)], stderr=subprocess.DEVNULL)
-        return int(res.split()[0]) * 1024
-    except Exception:
-        return 0
+        result = get_executor().run(['du', '-sk', path])
+        try:
+            size = int(result.stdout.split()[0]) * 1024
+        except (IndexError, ValueError):
+            size = 0  # du failed; the failure is reported at the end
+        span.set(bytes=size)
+        if time.monotonic() - start > TRACE_SLOW_SIZE_SECONDS:
+            span.set(slow=True)
+        trace_count("bytes sized", du=size)
+        return size
+
+def estimate_directory_size(path, threshold=None, rng=random, samples=ESTIMATE_FILE_SAMPLES):
+    """
+    Estimates the size of a directory tree without measuring every file.
+    Every directory is listed (cheap), but only a random sample of the files in
+    each one is stat'ed (what makes du slow on big caches); the rest of the
+    directory is extrapolated from that sample. Per-directory variances add up
+    to a ~99% confidence interval.
+    The part listed so far bounds the size from below, so a tree that is above
+    threshold is decided as soon as that bound passes it, without finishing the walk.
+    Returns (size, low, high); high is None when the walk stopped early.
+    """
+    with trace_span("estimate_directory_size", "size", path=path, threshold=threshold) as span:
+        size, low, high = _estimate_directory_size(path, threshold, rng, samples)
+        span.set(bytes=round(size), low=round(low), high=high and round(high))
+        return size, low, high
+
+def open_directory(path):
+    """
+    A file descriptor for listing path with os.scandir(fd). Entries listed that
+    way are stat'ed relative to it (fstatat), as du does, instead of resolving
+    their whole path again, which costs a lookup per component in deep trees.
+    """
+    return os.open(path, os.O_RDONLY | getattr(os, "O_DIRECTORY", 0))
+
+def _estimate_directory_size(path, threshold, rng, samples):
+    try:
+        measured = os.lstat(path).st_blocks * 512  # Bytes actually seen, never more than the true size
+    except OSError:
+        measured = 0
+    estimate = float(measured)  # Directories take space too, as du counts them
+    variance = 0.0
+    stack = [path]
+    while stack:
+        check_cancelled()
+        files = []
+        directory = stack.pop()
+        try:
+            fd = open_directory(directory)
+        except OSError:
+            continue
+        try:
+            with os.scandir(fd) as it:
+                for entry in it:
+                    trace_count("inodes visited", estimate=1)
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(os.path.join(directory, entry.name))
+                            blocks = entry.stat(follow_symlinks=False).st_blocks * 512
+                            estimate += blocks
+                            measured += blocks
+                        else:
+                            files.append(entry)
+                    except OSError:
+                        pass
+
+            n = len(files)
+            sample = files if n <= samples else rng.sample(files, samples)
+            sizes = []
+            for entry in sample:
+                try:
+                    sizes.append(entry.stat(follow_symlinks=False).st_blocks * 512)  # Like du
+                except OSError:
+                    sizes.append(0)  # Vanished since it was listed
+        except OSError:
+            continue
+        finally:
+            os.close(fd)
+        measured += sum(sizes)
+        trace_count("bytes scanned", estimate=sum(sizes))
+        if n == len(sample):
+            estimate += sum(sizes)
+        else:
+            k = len(sizes)
+            mean = sum(sizes) / k
+            estimate += n * mean
+            variance += n * n * (1 - k / n) * sum((x - mean) ** 2 for x in sizes) / (k - 1) / k
+
+        # What is still unlisted can only add to the size
+        low = max(estimate - ESTIMATE_Z * math.sqrt(variance), measured)
+        if threshold is not None and low > threshold:
+            return estimate, low, None
+
+    margin = ESTIMATE_Z * math.sqrt(variance)
+    return estimate, max(estimate - margin, measured), estimate + margin
+
+_estimate_sizes = False
+_size_pool = ThreadPoolExecutor(max_workers=COMMAND_CONCURRENCY, thread_name_prefix="du")  # du next to estimates
+
+def set_size_estimation(enabled):
+    """Turns sampled size estimates for threshold checks (--estimate) on or off."""
+    global _estimate_sizes
+    _estimate_sizes = enabled
+
+def measure_size(path, threshold):
+    """
+    Size of path for an "is it bigger than threshold" check.
+    With --estimate, directories are sampled and only sized exactly when the
+    estimate is too close to the threshold to call. du starts right away next to
+    the estimate and is killed once the estimate decides, so a tree close to the
+    threshold costs about one du rather than the estimate plus du.
+    Returns (size, low, high); low == high == size for exact sizes.
+    """
+    if _estimate_sizes and not os.path.isfile(path):
+        race = CancelToken(parent=current_cancel_token())
+        du = _size_pool.submit(with_cancel_token(race, get_directory_size), path)
+        try:
+            size, low, high = estimate_directory_size(str(path), threshold)
+            if low > threshold or (high is not None and high < threshold):
+                race.cancel("decided")
+                return int(size), low, high
+        except BaseException:
+            race.cancel()
+            raise
+        size = du.result()
+        return size, size, size
+    size = get_directory_size(path)
+    return size, size, size
+
+def estimate_fields(size, low, high):
+    """Extra item fields for a size that was estimated (see measure_size)."""
+    if low == high:
+        return {}
+    if high is None:
+        return {'estimated': True, 'size_text': f"≥{format_size(low)}"}
+    return {'estimated': True, 'size_text': f"~{format_size(size)} ±{format_size((high - low) / 2)}"}
 
 def get_installed_apps_info():
     """
@@ -64,12 +751,17 @@ def get_installed_apps_info():
     """
     apps = {}
     app_dirs = [
-        "/Applications", 
+        str(SYSTEM_ROOT / "Applications"),
         str(Path.home() / "Applications"),
-        "/System/Applications"
+        str(SYSTEM_ROOT / "System/Applications")
     ]
     
     print("🔍 Indexing installed applications...")
+    with trace_span("index applications", "stage"):
+        _index_apps(app_dirs, apps)
+    return apps
+
+def _index_apps(app_dirs, apps):
     for d in app_dirs:
         if os.path.exists(d):
             try:
@@ -83,7 +775,7 @@ def get_installed_apps_info():
                         plist_path = os.path.join(app_path, "Contents", "Info.plist")
                         if os.path.exists(plist_path):
                             try:
-                                with open(plist_path, 'rb') as fp:
+                                with open(plist_path, 'rb') as fp, trace_span("Info.plist", "plist", app=app_name):
                                     pl = plistlib.load(fp)
                                     if isinstance(pl, dict):
                                         bundle_id = pl.get("CFBundleIdentifier", "")
@@ -97,64 +789,308 @@ def get_installed_apps_info():
                         }
             except PermissionError:
                 pass
-    return apps
 
 def get_last_used_date(app_path):
     """Gets the last used date of an application using mdls."""
-    try:
-        if not os.path.exists(app_path): return 0
-        cmd = ["mdls", "-name", "kMDItemLastUsedDate", "-raw", app_path]
-        result = subprocess.check_output(cmd, stderr=subprocess.DEVNULL)
-        res_str = result.decode('utf-8').strip()
-        
-        if res_str and res_str != "(null)":
-            # kMDItemLastUsedDate format: 2023-10-27 10:00:00 +0000
-            # Simple parsing
-            date_part = res_str.split(" +")[0]
+    if not os.path.exists(app_path): return 0
+    cmd = ["mdls", "-name", "kMDItemLastUsedDate", "-raw", app_path]
+    res_str = get_executor().run(cmd).stdout.strip()
+    
+    if res_str and res_str != "(null)":
+        # kMDItemLastUsedDate format: 2023-10-27 10:00:00 +0000
+        # Simple parsing
+        date_part = res_str.split(" +")[0]
+        try:
             struct_time = time.strptime(date_part, "%Y-%m-%d %H:%M:%S")
             return time.mktime(struct_time)
-    except:
-        pass
+        except ValueError:
+            pass
     
     # Fallback to Access Time
     try:
         return os.path.getatime(app_path)
-    except:
+    except OSError:
         return 0
 
-def find_unused_apps(installed_apps_info):
-    """Finds applications not used in a long time."""
-    unused = []
+def iter_unused_apps(installed_apps_info):
+    """Yields applications not used in a long time, as they are sized."""
     now = time.time()
     
     # System apps are usually always "used" conceptually or shouldn't be touched
     # Filter by path starting with /System to skip system apps
     
-    for app_info in installed_apps_info.values():
+    system_apps = str(SYSTEM_ROOT / "System") + "/"
+    candidates = [a for a in installed_apps_info.values() if not a['path'].startswith(system_apps)]
+
+    def check(app_info):
         path = app_info['path']
-        if path.startswith("/System"): continue
-        
         last_used = get_last_used_date(path)
-        
-        if last_used > 0 and (now - last_used) > UNUSED_APP_THRESHOLD_SECONDS:
-            size = get_directory_size(path)
-            last_used_date = time.strftime('%Y-%m-%d', time.localtime(last_used))
-            unused.append({
-                'path': path,
-                'name': app_info['name'],
-                'size': size,
-                'info': f"Last used: {last_used_date}"
-            })
-            
-    return sorted(unused, key=lambda x: x['size'], reverse=True)
+        if not (last_used > 0 and (now - last_used) > UNUSED_APP_THRESHOLD_SECONDS):
+            return None
+        last_used_date = time.strftime('%Y-%m-%d', time.localtime(last_used))
+        return {
+            'path': path,
+            'name': app_info['name'],
+            'size': get_directory_size(path),
+            'info': f"Last used: {last_used_date}"
+        }
 
-def find_leftover_files(installed_apps_info):
+    # mdls and du calls are independent; the executor bounds how many run at once.
+    # Each app is yielded as soon as its own lookups are done.
+    with ThreadPoolExecutor(max_workers=get_executor().max_parallel) as pool:
+        check = with_cancel_token(current_cancel_token(), check)
+        pending = {pool.submit(check, app_info) for app_info in candidates}
+        try:
+            while pending:
+                done, pending = wait(pending, timeout=CANCEL_POLL_SECONDS, return_when=FIRST_COMPLETED)
+                check_cancelled()
+                for future in done:
+                    item = future.result()
+                    if item:
+                        yield item
+        finally:
+            for future in pending:
+                future.cancel()
+
+def find_unused_apps(installed_apps_info):
+    """Finds applications not used in a long time."""
+    return sorted(iter_unused_apps(installed_apps_info), key=lambda x: x['size'], reverse=True)
+
+def build_suffix_automaton(text):
+    """
+    Builds a suffix automaton for text.
+    Any substring of text can then be looked up in O(len(substring)).
+    """
+    trans = [{}]
+    link = [-1]
+    length = [0]
+    last = 0
+    for ch in text:
+        cur = len(trans)
+        trans.append({})
+        length.append(length[last] + 1)
+        link.append(0)
+        p = last
+        while p != -1 and ch not in trans[p]:
+            trans[p][ch] = cur
+            p = link[p]
+        if p != -1:
+            q = trans[p][ch]
+            if length[p] + 1 == length[q]:
+                link[cur] = q
+            else:
+                clone = len(trans)
+                trans.append(dict(trans[q]))
+                length.append(length[p] + 1)
+                link.append(link[q])
+                while p != -1 and trans[p].get(ch) == q:
+                    trans[p][ch] = clone
+                    p = link[p]
+                link[q] = clone
+                link[cur] = clone
+        last = cur
+    return trans
+
+def build_aho_corasick(patterns):
+    """
+    Builds an Aho-Corasick automaton over patterns.
+    Returns (goto, fail, terminal); terminal[state] is True when any pattern ends there.
+    """
+    goto = [{}]
+    terminal = [False]
+    for pattern in patterns:
+        state = 0
+        for ch in pattern:
+            nxt = goto[state].get(ch)
+            if nxt is None:
+                nxt = len(goto)
+                goto[state][ch] = nxt
+                goto.append({})
+                terminal.append(False)
+            state = nxt
+        terminal[state] = True
+
+    fail = [0] * len(goto)
+    queue = deque(goto[0].values())
+    while queue:
+        state = queue.popleft()
+        for ch, nxt in goto[state].items():
+            queue.append(nxt)
+            f = fail[state]
+            while f and ch not in goto[f]:
+                f = fail[f]
+            fail[nxt] = goto[f].get(ch, 0)
+            terminal[nxt] = terminal[nxt] or terminal[fail[nxt]]
+    return goto, fail, terminal
+
+def aho_corasick_search(automaton, text):
+    """Returns True if any pattern of the automaton occurs in text."""
+    goto, fail, terminal = automaton
+    if terminal[0]:
+        return True  # An empty pattern is contained in everything
+    state = 0
+    for ch in text:
+        while state and ch not in goto[state]:
+            state = fail[state]
+        state = goto[state].get(ch, 0)
+        if terminal[state]:
+            return True
+    return False
+
+class InstalledNameMatcher:
+    """
+    Answers "is this folder name related to an installed app name?" in O(len(name)).
+
+    Equivalent to checking `name in app_name or app_name in name` against every
+    installed name, but precomputed once per scan:
+    - a suffix automaton over all installed names finds folder names that are
+      substrings of an installed name ("zoom" folder, "zoom.us" app)
+    - an Aho-Corasick automaton over installed names finds installed names that
+      occur inside the folder name ("Slack" app, "Slack Helper" folder)
+    """
+    def __init__(self, installed_names):
+        names = sorted(installed_names)
+        # NUL never appears in a file name, so substrings never span two app names
+        self._substrings = build_suffix_automaton("\0".join(names)) if names else None
+        self._contained = build_aho_corasick(names)
+
+    def is_substring_of_app(self, name_lower):
+        trans = self._substrings
+        if trans is None:
+            return False  # Not even "" is a substring of an app name without apps
+        state = 0
+        for ch in name_lower:
+            state = trans[state].get(ch)
+            if state is None:
+                return False
+        return True
+
+    def contains_app(self, name_lower):
+        return aho_corasick_search(self._contained, name_lower)
+
+    def matches(self, name_lower):
+        return self.is_substring_of_app(name_lower) or self.contains_app(name_lower)
+
+RULE_MATCH_TYPES = {"name", "iname", "prefix", "contains", "regex"}
+LEADING_INLINE_FLAGS = re.compile(r"\(\?([aiLmsux]+)\)")
+
+def load_leftover_rules(path=LEFTOVER_RULES_PATH):
+    """
+    Parses a keep-rules file into (match, pattern, condition) tuples.
+    See cleaner-rules.tsv for the format.
+    """
+    rules = []
+    with open(path, encoding="utf-8") as fp:
+        for lineno, line in enumerate(fp, start=1):
+            line = line.rstrip("\n")
+            if not line.strip() or line.lstrip().startswith("#"):
+                continue
+            fields = line.split("\t")
+            if len(fields) != 3:
+                raise ValueError(f"{path}:{lineno}: expected 3 tab-separated fields, got {len(fields)}")
+            match, pattern, condition = fields
+            if match not in RULE_MATCH_TYPES:
+                raise ValueError(f"{path}:{lineno}: unknown match type '{match}'")
+            kind = condition.split(":", 1)[0]
+            if condition != "always" and kind not in ("app", "path", "which"):
+                raise ValueError(f"{path}:{lineno}: unknown condition '{condition}'")
+            if match == "regex":
+                try:
+                    re.compile(pattern)
+                except re.error as e:
+                    raise ValueError(f"{path}:{lineno}: bad regex '{pattern}': {e}")
+            rules.append((match, pattern, condition))
+    return rules
+
+def join_regexes(patterns):
+    """
+    Compiles regex rules into one alternation, plus one regex per rule that
+    can't join it: rules with groups (their numbers and names would clash) or
+    with leading global flags other than i, m and s. Those flags become scoped
+    flags, since (?i) is an error anywhere but the start: "(?i)^foo" joins as
+    "(?i:^foo)".
+    """
+    joined, separate = [], []
+    for pattern in patterns:
+        flags, body = "", pattern
+        while match := LEADING_INLINE_FLAGS.match(body):
+            flags, body = flags + match.group(1), body[match.end():]
+        if re.compile(pattern).groups or set(flags) - set("ims"):
+            separate.append(re.compile(pattern))
+        else:
+            joined.append(f"(?{flags}:{body})" if flags else f"(?:{body})")
+    if joined:
+        separate.insert(0, re.compile("|".join(joined)))
+    return separate
+
+class LeftoverRules:
+    """
+    Keep rules compiled into a single lookup structure.
+    Conditions are resolved when compiling, so skips() only looks at the name:
+    exact names are set lookups, prefixes one str.startswith call, substrings
+    one Aho-Corasick pass and regexes one alternation (see join_regexes).
+    Rules are unordered: an entry is kept if any rule whose condition holds
+    matches it. A name with two vendor keywords ("Adobe Unity Plugin") is kept
+    when either vendor's apps are installed, where the old if/elif chain only
+    looked at the first keyword it tested.
+    """
+    def __init__(self, rules, installed_names):
+        names, inames, prefixes, substrings, regexes = set(), set(), set(), set(), set()
+        condition_cache = {}
+
+        def holds(condition):
+            if condition not in condition_cache:
+                kind, _, arg = condition.partition(":")
+                if kind == "always":
+                    result = True
+                elif kind == "app":
+                    keywords = [k.strip().lower() for k in arg.split(",") if k.strip()]
+                    result = any(k in n for n in installed_names for k in keywords)
+                elif kind == "path":
+                    result = os.path.exists(arg)
+                else:
+                    result = check_command_exists(arg)
+                condition_cache[condition] = result
+            return condition_cache[condition]
+
+        for match, pattern, condition in rules:
+            if not holds(condition):
+                continue
+            if match == "name":
+                names.add(pattern)
+            elif match == "iname":
+                inames.add(pattern.lower())
+            elif match == "prefix":
+                prefixes.add(pattern.lower())
+            elif match == "contains":
+                substrings.add(pattern.lower())
+            else:
+                regexes.add(pattern)
+
+        self._names = names
+        self._inames = inames
+        self._prefixes = tuple(sorted(prefixes))
+        self._substrings = build_aho_corasick(sorted(substrings)) if substrings else None
+        self._regexes = tuple(join_regexes(sorted(regexes)))
+
+    def skips(self, item):
+        """Returns True if the Library entry named item must be kept."""
+        if item in self._names:
+            return True
+        name_lower = item.lower()
+        if name_lower in self._inames:
+            return True
+        if self._prefixes and name_lower.startswith(self._prefixes):
+            return True
+        if self._substrings and aho_corasick_search(self._substrings, name_lower):
+            return True
+        return any(regex.search(name_lower) for regex in self._regexes)
+
+def iter_leftover_files(installed_apps_info):
     """
     Scans Library folders for directories that do NOT match installed apps.
+    Yields each leftover as soon as it is sized.
     """
-    print("\n🔍 Scanning for leftover app data...")
-    leftovers = []
-    
     installed_ids = set()
     installed_names = set()
     
@@ -164,216 +1100,444 @@ def find_leftover_files(installed_apps_info):
         # Also add sanitized name (no spaces)
         installed_names.add(info['name'].lower().replace(" ", ""))
 
-
-    # Common development tools/commands to check for if folder matches
-    CLI_TOOLS_TO_CHECK = {"node", "npm", "pnpm", "python", "pip", "git", "cargo", "go", "code", "nvm"}
+    name_matcher = InstalledNameMatcher(installed_names)
+    keep_rules = LeftoverRules(load_leftover_rules(), installed_names)
 
     for lib_dir in LIBRARY_SCAN_DIRS:
         if not os.path.exists(lib_dir): continue
             
         try:
             for item in os.listdir(lib_dir):
+                check_cancelled()
                 if item.startswith('.'): continue
-                if item in IGNORE_NAMES: continue
-                
-                # Check 0: Can we find this command in PATH?
-                if item.lower() in CLI_TOOLS_TO_CHECK:
-                    if shutil.which(item.lower()):
-                        continue 
+                # System folders, CLI tools in PATH, vendor folders of installed apps
+                if keep_rules.skips(item): continue
 
                 full_path = os.path.join(lib_dir, item)
                 if not os.path.isdir(full_path): continue
                 
                 name_lower = item.lower()
-                
-                # Check 1: Vendor Specific / Heuristic Checks
-                # If ANY "adobe" string in installed apps, keep "Adobe" folder
-                # (Simple containment check across all installed names)
-                is_vendor_safe = False
-                
-                if "adobe" in name_lower:
-                    if any("adobe" in n for n in installed_names): is_vendor_safe = True
-                elif "unity" in name_lower:
-                    if any("unity" in n for n in installed_names): is_vendor_safe = True
-                    # Check common manual install paths for Unity
-                    if os.path.exists("/Applications/Unity Hub.app"): is_vendor_safe = True
-                elif "blackmagic" in name_lower or "davinci" in name_lower:
-                    if any("blackmagic" in n or "davinci" in n for n in installed_names): is_vendor_safe = True
-                elif "microsoft" in name_lower: 
-                     # Check commonly installed Office apps individually if "Microsoft" folder found
-                     if any("microsoft" in n or "office" in n or "word" in n or "excel" in n for n in installed_names): is_vendor_safe = True
-                elif "google" in name_lower:
-                     if any("google" in n or "chrome" in n for n in installed_names): is_vendor_safe = True
-                
-                if is_vendor_safe: continue
 
                 # Normal Exclusion Logic
-                is_known = False
-                
                 # Check 1: Bundle ID match
                 # If folder looks like "com.google.Chrome"
-                if "." in name_lower:
-                    # Check if exact match
-                    if name_lower in installed_ids:
-                        is_known = True
-                    else:
-                        # Check partial group match (e.g. com.adobe.*)
-                        # This is risky. "com.adobe.reader" folder vs "com.adobe.photoshop" app?
-                        # If ANY app has this prefix? No, too loose.
-                        pass
+                # (Partial group matches like com.adobe.* are too loose to trust)
+                is_known = "." in name_lower and name_lower in installed_ids
                 
                 # Check 2: Name match
+                # Folder "zoom" in App "zoom.us", App "Slack" in Folder "Slack"
+                # e.g. "Microsoft" folder, "Microsoft Word" app installed -> Keep
                 if not is_known:
-                    if name_lower in installed_names:
-                        is_known = True
-                    else:
-                        # Check "Adobe" vs "Adobe Photoshop"
-                        # If folder name is a prefix of an installed app name?
-                        # e.g. "Microsoft" folder, "Microsoft Word" app installed -> Keep
-                        for app_name in installed_names:
-                            if name_lower in app_name: # Folder "zoom" in App "zoom.us"
-                                is_known = True; break
-                            if app_name in name_lower: # App "Slack" in Folder "Slack"
-                                is_known = True; break
+                    is_known = name_matcher.matches(name_lower)
                 
                 if not is_known:
-                    # Heuristic: verify against system prefixes again to be safe
-                    if name_lower.startswith("com.apple."): continue
-                    
-                    size = get_directory_size(full_path)
+                    size, low, high = measure_size(full_path, 10 * 1024 * 1024)
                     if size > 10 * 1024 * 1024:  # Only suggest significant leftovers (>10MB)
-                        leftovers.append({
+                        yield {
                             'path': full_path,
                             'name': item,
                             'size': size,
-                            'info': "No matching app found"
-                        })
+                            'info': "No matching app found",
+                            **estimate_fields(size, low, high)
+                        }
                         
         except PermissionError:
             pass
-            
-    return sorted(leftovers, key=lambda x: x['size'], reverse=True)
+
+def find_leftover_files(installed_apps_info):
+    """Scans Library folders for directories that do NOT match installed apps."""
+    print("\n🔍 Scanning for leftover app data...")
+    return sorted(iter_leftover_files(installed_apps_info), key=lambda x: x['size'], reverse=True)
 
 
-def find_large_files():
-    """Finds large files using mdfind (Spotlight) for speed."""
-    print(f"\n🔍 Scanning for large files (> {format_size(LARGE_FILE_THRESHOLD_BYTES)})...")
-    large_files = []
-    
+def is_cloud_placeholder(path, stats):
+    """
+    Checks whether a file in Cloud Storage is a placeholder that is not downloaded.
+    On macOS APFS, sparse files or dataless files have fewer blocks allocated than size implies.
+    """
+    if not any(marker in path for marker in CLOUD_PATH_MARKERS):
+        return False
+    # st_blocks is number of 512-byte blocks. 
+    physical_size = stats.st_blocks * 512
+    logical_size = stats.st_size
+    # If physical size is significantly smaller (< 50%) than logical size, it's likely not fully downloaded
+    return logical_size > 0 and physical_size < (logical_size * 0.5)
+
+def large_file_item(path, size):
+    return {
+        'path': path,
+        'name': os.path.basename(path),
+        'size': size,
+        'info': "Large file"
+    }
+
+def iter_large_files_spotlight(threshold=LARGE_FILE_THRESHOLD_BYTES):
+    """
+    Yields large files found by mdfind (Spotlight).
+    Raises CommandFailed when Spotlight can't be queried.
+    """
     # mdfind "kMDItemFSSize > 500000000"
-    cmd = ["mdfind", f"kMDItemFSSize > {LARGE_FILE_THRESHOLD_BYTES}"]
+    result = get_executor().run(["mdfind", f"kMDItemFSSize > {threshold}"])
+    if not result.ok:
+        raise CommandFailed(result)
+    for p in result.stdout.strip().split('\n'):
+        check_cancelled()
+        if not p: continue
+        # Filter out system paths usually not touchable
+        if p.startswith(str(SYSTEM_ROOT / "System")): continue
+        try:
+            stats = os.stat(p)
+        except OSError:
+            continue  # Gone since Spotlight indexed it
+        if is_cloud_placeholder(p, stats): continue
+        yield large_file_item(p, stats.st_size)
+
+def is_deleted_dir(path):
+    """Whether path holds what was already deleted: the Trash, or a staging dir of DeletionEngine."""
+    return path == str(TRASH_DIR) or os.path.basename(path) == STAGING_DIR_NAME
+
+def scan_dir_for_large_files(path, floor):
+    """
+    Lists one directory for the native large-file finder.
+    floor[0] is the current minimum size worth reporting; it rises as the top-K heap fills up.
+    The Trash and staging dirs are not descended into: their files are deleted already.
+    Returns (subdirectories, large files).
+    """
+    subdirs = []
+    hits = []
+    visited = scanned = 0
+    cancel = current_cancel_token()
     try:
-        output = subprocess.check_output(cmd, text=True)
-        paths = output.strip().split('\n')
-        
-        for p in paths:
-            if not p: continue
-            if not os.path.exists(p): continue
-            
-            # Filter out system paths usually not touchable
-            if p.startswith("/System"):
-                continue 
-
-            # Filter out Cloud Storage placeholders (Box, Dropbox, OneDrive, Drive, iCloud)
-            # If the file is in CloudStorage, check if it's downloaded.
-            # On macOS APFS, sparse files or dataless files have fewer blocks allocated than size implies.
-            is_cloud_placeholder = False
-            if "Library/CloudStorage" in p or "Library/Mobile Documents" in p or ".tmp.driveupload" in p:
+        with os.scandir(path) as it:
+            for entry in it:
+                visited += 1
+                if visited % CANCEL_CHECK_ENTRIES == 0 and cancel.cancelled:
+                    break  # Huge directory in an abandoned scan
                 try:
-                    stats = os.stat(p)
-                    # st_blocks is number of 512-byte blocks. 
-                    physical_size = stats.st_blocks * 512
-                    logical_size = stats.st_size
-                    # If physical size is significantly smaller (< 50%) than logical size, it's likely not fully downloaded
-                    if logical_size > 0 and physical_size < (logical_size * 0.5):
-                        is_cloud_placeholder = True
-                except:
+                    if entry.is_dir(follow_symlinks=False):
+                        if not is_deleted_dir(entry.path):
+                            subdirs.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        stats = entry.stat(follow_symlinks=False)
+                        scanned += stats.st_size
+                        if stats.st_size <= floor[0]: continue
+                        if is_cloud_placeholder(entry.path, stats): continue
+                        hits.append(large_file_item(entry.path, stats.st_size))
+                except OSError:
                     pass
-            
-            if is_cloud_placeholder:
+    except OSError:
+        pass  # Permission denied, vanished directory, etc.
+    trace_count("inodes visited", large_files=visited)
+    trace_count("bytes scanned", large_files=scanned)
+    return subdirs, hits
+
+def iter_large_files_native(roots=None, threshold=LARGE_FILE_THRESHOLD_BYTES,
+                            top_k=LARGE_FILE_TOP_K, workers=LARGE_FILE_SCAN_WORKERS):
+    """
+    Walks roots in parallel with os.scandir and yields large files as they are found.
+    Works without Spotlight (and off macOS). Only the top_k largest files are kept:
+    once that many are found, smaller files are pruned in the walkers without
+    building an item for them. Yielded files may later be pushed out of the top_k.
+    """
+    roots = LARGE_FILE_SCAN_ROOTS if roots is None else roots
+    floor = [threshold]
+    heap = []  # (size, path) of the current top_k
+    scan_dir = with_cancel_token(current_cancel_token(), scan_dir_for_large_files)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool, trace_span("large-file walk", "walk"):
+        pending = {
+            pool.submit(scan_dir, str(r), floor)
+            for r in roots if os.path.isdir(r) and not str(r).startswith(str(SYSTEM_ROOT / "System"))
+        }
+        try:
+            while pending:
+                done, pending = wait(pending, timeout=CANCEL_POLL_SECONDS, return_when=FIRST_COMPLETED)
+                check_cancelled()
+                for future in done:
+                    subdirs, hits = future.result()
+                    for d in subdirs:
+                        pending.add(pool.submit(scan_dir, d, floor))
+                    for item in hits:
+                        if item['size'] <= floor[0]: continue
+                        entry = (item['size'], item['path'])
+                        if len(heap) < top_k:
+                            heapq.heappush(heap, entry)
+                        else:
+                            heapq.heapreplace(heap, entry)
+                        if len(heap) == top_k:
+                            floor[0] = max(threshold, heap[0][0])
+                        yield item
+        finally:
+            for future in pending:
+                future.cancel()
+
+def iter_large_files(engine="auto"):
+    """
+    Yields large files using mdfind (Spotlight) for speed.
+    Falls back to a native walk when Spotlight fails or has nothing indexed;
+    engine="spotlight" or engine="native" forces one of them.
+    """
+    found = False
+    if engine in ("auto", "spotlight"):
+        try:
+            for item in iter_large_files_spotlight():
+                found = True
+                yield item
+        except CommandFailed:
+            pass  # Spotlight unavailable; the native walk covers it
+
+    if engine == "native" or (engine == "auto" and not found):
+        yield from iter_large_files_native()
+
+def find_large_files(engine="auto"):
+    """Finds the largest files, see iter_large_files."""
+    print(f"\n🔍 Scanning for large files (> {format_size(LARGE_FILE_THRESHOLD_BYTES)})...")
+    return heapq.nlargest(LARGE_FILE_TOP_K, iter_large_files(engine), key=lambda x: x['size'])
+
+
+def iter_duplicate_candidates(roots=None, min_size=DUPLICATE_MIN_BYTES, workers=LARGE_FILE_SCAN_WORKERS):
+    """Yields (path, stat) of every file of at least min_size under roots."""
+    roots = LARGE_FILE_SCAN_ROOTS if roots is None else roots
+    floor = [min_size - 1]  # Fixed: all files count, not just the top K
+    scan_dir = with_cancel_token(current_cancel_token(), scan_dir_for_large_files)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = {pool.submit(scan_dir, str(r), floor) for r in roots if os.path.isdir(r)}
+        try:
+            while pending:
+                done, pending = wait(pending, timeout=CANCEL_POLL_SECONDS, return_when=FIRST_COMPLETED)
+                check_cancelled()
+                for future in done:
+                    subdirs, hits = future.result()
+                    for d in subdirs:
+                        pending.add(pool.submit(scan_dir, d, floor))
+                    for item in hits:
+                        try:
+                            yield item['path'], os.stat(item['path'])
+                        except OSError:
+                            pass
+        finally:
+            for future in pending:
+                future.cancel()
+
+def hash_file_edges(path, size, edge=DUPLICATE_EDGE_BYTES):
+    """Hashes the first and last edge bytes of a file. None if it can't be read."""
+    check_cancelled()
+    h = hashlib.blake2b(digest_size=16)
+    try:
+        with open(path, 'rb', buffering=0) as f:
+            h.update(f.read(edge))
+            if size > edge:
+                f.seek(max(size - edge, edge))
+                h.update(f.read(edge))
+    except OSError:
+        return None
+    trace_count("bytes hashed", edges=min(size, 2 * edge))
+    return h.digest()
+
+def split_identical_files(paths, size, chunk=DUPLICATE_CHUNK_BYTES):
+    """
+    Compares same-size files by hashing them in lockstep, one chunk at a time.
+    After every chunk the group is split by the running hash, and files that
+    no longer match any other are closed, so reading stops as soon as a file is unique.
+    Returns the lists of paths whose whole contents are identical.
+    """
+    with trace_span("compare identical-size files", "hash", files=len(paths), size=size) as span:
+        identical = _split_identical_files(paths, size, chunk)
+        span.set(identical=sum(len(group) for group in identical))
+        return identical
+
+def _split_identical_files(paths, size, chunk, max_open=DUPLICATE_OPEN_FILES):
+    # Members are [path, open file or None, hash]. At most max_open files stay
+    # open between chunks (macOS allows 256 per process by default); the others
+    # are reopened at the current offset for every chunk.
+    groups = [[[path, None, hashlib.blake2b()] for path in paths]]
+    open_files = 0
+    buf = bytearray(chunk)
+    offset = 0
+    try:
+        while offset < size and groups:
+            check_cancelled()
+            expected = min(chunk, size - offset)
+            next_groups = []
+            for group in groups:
+                by_state = {}
+                for member in group:
+                    path, f, h = member
+                    try:
+                        if f is None:
+                            f = open(path, 'rb', buffering=0)
+                            f.seek(offset)
+                            if open_files < max_open:
+                                member[1] = f
+                                open_files += 1
+                        n = f.readinto(buf)
+                    except OSError:
+                        n = -1
+                    if member[1] is None and f is not None:
+                        f.close()
+                    if n != expected:
+                        if member[1] is not None:
+                            member[1].close()  # Unreadable or changed size since it was listed
+                            member[1] = None
+                            open_files -= 1
+                        continue
+                    h.update(memoryview(buf)[:n])
+                    trace_count("bytes hashed", full=n)
+                    by_state.setdefault(h.copy().digest(), []).append(member)
+                for members in by_state.values():
+                    if len(members) > 1:
+                        next_groups.append(members)
+                    elif members[0][1] is not None:
+                        members[0][1].close()
+                        members[0][1] = None
+                        open_files -= 1
+            groups = next_groups
+            offset += expected
+    finally:
+        for group in groups:
+            for member in group:
+                if member[1] is not None:
+                    member[1].close()
+    return [[path for path, _, _ in group] for group in groups if len(group) > 1]
+
+def duplicate_items(paths, size, stats):
+    """
+    Builds the candidates for one set of identical files.
+    The copy to keep is the one with the most hard links (it can't be freed anyway),
+    then the oldest. Copies that have other hard links free nothing and aren't offered.
+    """
+    keep = max(paths, key=lambda p: (stats[p].st_nlink, -stats[p].st_mtime, p))
+    copies = [p for p in paths if p != keep and stats[p].st_nlink == 1]
+    reclaimable = format_size(size * len(copies))
+    return [{
+        'path': p,
+        'name': os.path.basename(p),
+        'size': size,
+        'keep': keep,
+        'info': f"Duplicate of {keep} ({len(paths)} copies, {reclaimable} reclaimable)"
+    } for p in copies]
+
+def iter_duplicate_files(roots=None, min_size=DUPLICATE_MIN_BYTES, workers=DUPLICATE_HASH_WORKERS):
+    """
+    Yields redundant copies of big files, one item per copy that can be deleted.
+    Files are grouped by size, then by a hash of their first and last blocks,
+    and only then compared in full. Hard links to the same file count once.
+    """
+    by_size = {}
+    for path, st in iter_duplicate_candidates(roots, min_size):
+        # Keyed by inode, so hard links of one file are a single candidate
+        by_size.setdefault(st.st_size, {}).setdefault((st.st_dev, st.st_ino), (path, st))
+    by_size = {size: list(files.values()) for size, files in by_size.items() if len(files) > 1}
+    if not by_size:
+        return
+
+    cancel = current_cancel_token()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        edge_jobs = {
+            pool.submit(with_cancel_token(cancel, hash_file_edges), path, size): (size, path, st)
+            for size, files in by_size.items() for path, st in files
+        }
+        by_edges = {}
+        for future, (size, path, st) in edge_jobs.items():
+            check_cancelled()
+            digest = future.result()
+            if digest is not None:
+                by_edges.setdefault((size, digest), []).append((path, st))
+
+        full_jobs = {}
+        for (size, _), files in by_edges.items():
+            if len(files) < 2:
                 continue
-                
-            try:
-                size = os.path.getsize(p)
-                large_files.append({
-                    'path': p,
-                    'name': os.path.basename(p),
-                    'size': size,
-                    'info': "Large file"
-                })
-            except:
-                pass
-    except subprocess.CalledProcessError:
-        print("mdfind failed. Skipping Spotlight search.")
-        
-    return sorted(large_files, key=lambda x: x['size'], reverse=True)
+            stats = dict(files)
+            if size <= 2 * DUPLICATE_EDGE_BYTES:
+                future = Future()  # The edges were the whole file
+                future.set_result([list(stats)])
+            else:
+                future = pool.submit(with_cancel_token(cancel, split_identical_files), list(stats), size)
+            full_jobs[future] = (size, stats)
+        pending = set(full_jobs)
+        try:
+            while pending:
+                done, pending = wait(pending, timeout=CANCEL_POLL_SECONDS, return_when=FIRST_COMPLETED)
+                check_cancelled()
+                for future in done:
+                    size, stats = full_jobs[future]
+                    for paths in future.result():
+                        yield from duplicate_items(paths, size, stats)
+        finally:
+            for future in pending:
+                future.cancel()
 
+def find_duplicate_files():
+    """Finds redundant copies of big files, largest first."""
+    print(f"\n🔍 Scanning for duplicate files (> {format_size(DUPLICATE_MIN_BYTES)})...")
+    return sorted(iter_duplicate_files(), key=lambda x: x['size'], reverse=True)
 
-def find_system_junk():
+def iter_system_junk():
     """
-    Finds common system junk locations that contribute to 'System Data'.
+    Yields common system junk locations that contribute to 'System Data'.
     Includes Caches, Logs, Xcode DerivedData, iOS Backups, etc.
     """
-    print("\n🔍 Scanning for System Junk (Caches, Logs, Developer Data)...")
-    junk_items = []
-
     # 1. Generic Cache/Log Locations
     # These are generally safe to delete, they will be regenerated.
     common_locations = [
         {"path": Path.home() / "Library/Caches", "name": "User Caches"},
         {"path": Path.home() / "Library/Logs", "name": "User Logs"},
-        {"path": "/Library/Caches", "name": "System Caches"},
-        {"path": "/Library/Logs", "name": "System Logs"},
+        {"path": SYSTEM_ROOT / "Library/Caches", "name": "System Caches"},
+        {"path": SYSTEM_ROOT / "Library/Logs", "name": "System Logs"},
     ]
 
     for loc in common_locations:
+        check_cancelled()
         p = loc["path"]
         if os.path.exists(p):
-            try:
-                size = get_directory_size(p)
-                if size > 100 * 1024 * 1024: # > 100MB
-                    junk_items.append({
-                        'path': str(p),
-                        'name': loc["name"],
-                        'size': size,
-                        'info': "Cache/Log files (Safe to clear, will regenerate)"
-                    })
-            except: pass
+            size, low, high = measure_size(p, 100 * 1024 * 1024)
+            if size > 100 * 1024 * 1024: # > 100MB
+                yield {
+                    'path': str(p),
+                    'name': loc["name"],
+                    'size': size,
+                    'info': "Cache/Log files (Safe to clear, will regenerate)",
+                    **estimate_fields(size, low, high)
+                }
 
     # 2. Developer Specifics (Xcode, etc)
     xcode_derived = Path.home() / "Library/Developer/Xcode/DerivedData"
     if os.path.exists(xcode_derived):
-        size = get_directory_size(xcode_derived)
+        size, low, high = measure_size(xcode_derived, 100 * 1024 * 1024)
         if size > 100 * 1024 * 1024:
-            junk_items.append({
+            yield {
                 'path': str(xcode_derived),
                 'name': "Xcode Derived Data",
                 'size': size,
-                'info': "Build artifacts (Safe to delete, will rebuild)"
-            })
+                'info': "Build artifacts (Safe to delete, will rebuild)",
+                **estimate_fields(size, low, high)
+            }
             
     xcode_archives = Path.home() / "Library/Developer/Xcode/Archives"
     if os.path.exists(xcode_archives):
-        size = get_directory_size(xcode_archives)
+        size, low, high = measure_size(xcode_archives, 500 * 1024 * 1024)
         if size > 500 * 1024 * 1024: # > 500MB
-             junk_items.append({
+             yield {
                 'path': str(xcode_archives),
                 'name': "Xcode Archives",
                 'size': size,
-                'info': "Old App Builds (Delete old ones manually inside)"
-            })
+                'info': "Old App Builds (Delete old ones manually inside)",
+                **estimate_fields(size, low, high)
+            }
             
     # 3. iOS Backups
     ios_backups = Path.home() / "Library/Application Support/MobileSync/Backup"
     if os.path.exists(ios_backups):
-        size = get_directory_size(ios_backups)
+        size, low, high = measure_size(ios_backups, 1 * 1024 * 1024 * 1024)
         if size > 1 * 1024 * 1024 * 1024: # > 1GB
-             junk_items.append({
+             yield {
                 'path': str(ios_backups),
                 'name': "iOS Backups",
                 'size': size,
-                'info': "Old Device Backups (Check before deleting)"
-            })
+                'info': "Old Device Backups (Check before deleting)",
+                **estimate_fields(size, low, high)
+            }
 
     # 4. Adobe Media Cache (Common culprit for huge System Data)
     adobe_common = Path.home() / "Library/Application Support/Adobe/Common"
@@ -382,27 +1546,29 @@ def find_system_junk():
         for subdir in ["Media Cache Files", "Media Cache", "Disk Cache"]:
             p = adobe_common / subdir
             if os.path.exists(p):
-                size = get_directory_size(p)
+                size, low, high = measure_size(p, 500 * 1024 * 1024)
                 if size > 500 * 1024 * 1024:
-                    junk_items.append({
+                    yield {
                         'path': str(p),
                         'name': f"Adobe {subdir}",
                         'size': size,
-                        'info': "Video editing cache. Safe to delete."
-                    })
+                        'info': "Video editing cache. Safe to delete.",
+                        **estimate_fields(size, low, high)
+                    }
 
     # 6. Package Manager Caches (Homebrew, npm, pip, pnpm)
     # Homebrew
     brew_cache = Path.home() / "Library/Caches/Homebrew"
     if os.path.exists(brew_cache):
-         size = get_directory_size(brew_cache)
+         size, low, high = measure_size(brew_cache, 1 * 1024 * 1024 * 1024)
          if size > 1 * 1024 * 1024 * 1024:
-             junk_items.append({
+             yield {
                  'path': "(Manual Action Required)",
                  'name': "Homebrew Cache",
                  'size': size,
-                 'info': "Run 'brew cleanup -s' in terminal"
-             })
+                 'info': "Run 'brew cleanup -s' in terminal",
+                 **estimate_fields(size, low, high)
+             }
 
     # pnpm / npm
     pkg_caches = [
@@ -414,144 +1580,667 @@ def find_system_junk():
     ]
     for p, label in pkg_caches:
         if os.path.exists(p):
-            size = get_directory_size(p)
+            size, low, high = measure_size(p, 1 * 1024 * 1024 * 1024)
             if size > 1 * 1024 * 1024 * 1024:
-                junk_items.append({
+                yield {
                     'path': str(p),
                     'name': label,
                     'size': size,
-                    'info': "Dev package cache. Delete if you need space (will re-download)."
-                })
+                    'info': "Dev package cache. Delete if you need space (will re-download).",
+                    **estimate_fields(size, low, high)
+                }
 
     # 7. Time Machine Local Snapshots (Often the hidden 'System Data' giant)
     if os.geteuid() == 0:
+        # Shared with the cleanup step, which then doesn't list them again
         try:
-            # Check roughly how many snapshots exist
-            tm_out = subprocess.check_output(["tmutil", "listlocalsnapshots", "/"], stderr=subprocess.DEVNULL)
-            snapshot_lines = tm_out.decode('utf-8').strip().split('\n')
-            snapshot_count = len([l for l in snapshot_lines if "com.apple.TimeMachine" in l])
+            snapshot_count = len(get_snapshot_manager().list())
+        except CommandFailed:
+            snapshot_count = 0
             
-            if snapshot_count > 0:
-                 # Give it a fake heavy size so it floats to top of list
-                 junk_items.append({
-                    'path': "(Manual Action Required)",
-                    'name': f"Time Machine Snapshots ({snapshot_count} found)",
-                    'size': 999999999999, # Fake entry to ensure visibility at top
-                    'info': f"System Data often grows after deletion due to snapshots. Run 'tmutil deletelocalsnapshots /' manually."
-                 })
-        except:
-            pass
+        if snapshot_count > 0:
+             # Their size is only known once they are deleted; pin the entry to the top of the list
+             yield {
+                'path': "(Manual Action Required)",
+                'name': f"Time Machine Snapshots ({snapshot_count} found)",
+                'size': 0,
+                'size_text': "size unknown",
+                'pinned': True,
+                'info': "System Data often grows after deletion due to snapshots. The snapshot step below can delete them and report the space reclaimed."
+             }
             
     # 8. System Diagnostic Reports / Core Dumps
-    sys_diag = Path("/Library/Logs/DiagnosticReports")
+    sys_diag = SYSTEM_ROOT / "Library/Logs/DiagnosticReports"
     if os.path.exists(sys_diag):
-        size = get_directory_size(sys_diag)
+        size, low, high = measure_size(sys_diag, 500 * 1024 * 1024)
         if size > 500 * 1024 * 1024:
-            junk_items.append({
+            yield {
                 'path': str(sys_diag),
                 'name': "System Diagnostic Reports",
                 'size': size,
-                'info': "Crash reports. Safe to delete."
-            })
+                'info': "Crash reports. Safe to delete.",
+                **estimate_fields(size, low, high)
+            }
 
-    return sorted(junk_items, key=lambda x: x['size'], reverse=True)
+def find_system_junk():
+    """Finds common system junk locations that contribute to 'System Data'."""
+    print("\n🔍 Scanning for System Junk (Caches, Logs, Developer Data)...")
+    return sorted(iter_system_junk(), key=item_sort_key, reverse=True)
 
 
-def list_and_delete(items, title):
-    if not items:
-        return
+class StageScan:
+    """
+    Runs a scan stage (any iterable of candidate items) in a background thread.
+    Items are available through top() while the scan is still running.
+    With a budget (seconds) the stage is cancelled when it runs out of time and
+    its results so far become final, even if the scan is stuck in a system call.
+    """
+    def __init__(self, items, budget=None, name="scan"):
+        self.name = name
+        self._lock = threading.Lock()
+        self._items = []
+        self._deleted = set()
+        self._deleted_prefixes = ()
+        self._scanning = True
+        self._refreshing = 0
+        self._completed = False
+        self.token = CancelToken(budget)
+        self.budget = budget
+        self.started = time.monotonic()
+        self.finished = None
+        self.done = threading.Event()  # Set once the results are final
+        self.error = None
+        self.found = 0  # Items the scan turned up, including any deleted or discarded since
+        self.version = 0  # Bumped whenever the results change
+        self._thread = threading.Thread(target=self._run, args=(items,), daemon=True, name=f"scan: {name}")
+        self._thread.start()
+        if budget:
+            timer = threading.Timer(budget, self._expire)
+            timer.daemon = True
+            timer.start()
 
-    print(f"\n⚠️  {title} ({len(items)} found):")
-    
-    # Show top 10
-    display_count = min(len(items), 15)
-    for i in range(display_count):
-        item = items[i]
+    def _run(self, items):
+        _stage_context.token = self.token
+        with trace_span(f"scan: {self.name}", "stage") as span:
+            self._collect(items)
+            span.set(found=self.found, status=self.status)
+
+    def _collect(self, items):
+        try:
+            for item in items:
+                with self._lock:
+                    if self.token.cancelled:
+                        break
+                    if not self._is_deleted(item.get('path', '')):
+                        self._items.append(item)
+                        self.found += 1
+                        self.version += 1
+            else:
+                self._completed = True
+        except StageCancelled:
+            pass
+        except Exception as e:
+            self.error = e
+        finally:
+            if hasattr(items, 'close'):
+                try:
+                    items.close()
+                except StageCancelled:
+                    pass
+            with self._lock:
+                self._finish()
+
+    def _expire(self):
+        with self._lock:
+            if self.finished is not None:
+                return
+            self.token.cancel("timed out")
+            self._finish()
+
+    def _finish(self):
+        if self.finished is None:
+            self.finished = time.monotonic()
+            self._scanning = False
+            self.version += 1
+            self._update_done()
+
+    @property
+    def incomplete(self):
+        """Why the results are partial ("timed out", "interrupted", ...), or None."""
+        if self.finished is None or self._completed or self.error:
+            return None
+        return self.token.reason or "stopped"
+
+    @property
+    def status(self):
+        if self.error:
+            return f"failed: {self.error}"
+        if self.finished is None:
+            return "running"
+        return self.incomplete or "complete"
+
+    @property
+    def elapsed(self):
+        return (self.finished or time.monotonic()) - self.started
+
+    def _update_done(self):
+        if self._scanning or self._refreshing:
+            self.done.clear()
+        else:
+            self.done.set()
+
+    def stop(self, reason="stopped"):
+        """Cancels the scan; it stops at its next check and keeps what it found."""
+        self.token.cancel(reason)
+
+    def top(self, n=DISPLAY_COUNT):
+        """Returns (largest n items so far, total found so far)."""
+        with self._lock:
+            return heapq.nlargest(n, self._items, key=item_sort_key), len(self._items)
+
+    def discard(self, paths):
+        """Drops items whose path was handled (e.g. deleted) by the user."""
+        with self._lock:
+            self._items = [i for i in self._items if i.get('path') not in paths]
+            self.version += 1
+
+    def _is_deleted(self, path):
+        return path in self._deleted or path.startswith(self._deleted_prefixes)
+
+    def invalidate(self, deleted_paths):
+        """
+        Updates the results after the user deleted paths in another stage.
+        Items inside a deleted path are dropped (also when they are found later);
+        items that contain a deleted path are re-sized in the background.
+        """
+        if not deleted_paths:
+            return
+        with self._lock:
+            self._deleted.update(deleted_paths)
+            self._deleted_prefixes = tuple(p.rstrip('/') + '/' for p in self._deleted)
+            self._items = [i for i in self._items if not self._is_deleted(i.get('path', ''))]
+            stale = [
+                i for i in self._items
+                if any(d.startswith(i.get('path', '').rstrip('/') + '/') for d in deleted_paths)
+            ]
+            self.version += 1
+            if stale:
+                self._refreshing += 1
+                self._update_done()
+        if stale:
+            threading.Thread(target=self._refresh, args=(stale,), daemon=True).start()
+
+    def _refresh(self, stale):
+        try:
+            for item in stale:
+                size = get_directory_size(item['path'])
+                with self._lock:
+                    item['size'] = size
+                    if item.pop('estimated', False):
+                        item.pop('size_text', None)
+                    self.version += 1
+        finally:
+            with self._lock:
+                self._refreshing -= 1
+                self._update_done()
+
+def format_item_lines(shown, total, title, scanning, incomplete=None):
+    """Renders the candidate list of a stage."""
+    status = f"{total} found so far, still scanning..." if scanning else f"{total} found"
+    if incomplete and not scanning:
+        status += f", scan {incomplete}: results are partial"
+    lines = [f"⚠️  {title} ({status}):"]
+    for i, item in enumerate(shown):
         path_name = item.get('path', 'Unknown')
         name_only = item.get('name', '')
         info_txt = item.get('info', '')
-        size_txt = format_size(item['size'])
+        size_txt = item.get('size_text') or format_size(item['size'])
         
         # Nicer formatting
         if path_name == "(Manual Action Required)":
-             print(f"  [{i+1}]\t{name_only}: {path_name} ({size_txt}) - {info_txt}")
+             lines.append(f"  [{i+1}]\t{name_only}: {path_name} ({size_txt}) - {info_txt}")
         else:
-             print(f"  [{i+1}]\t{path_name} ({size_txt}) - {info_txt}")
+             lines.append(f"  [{i+1}]\t{path_name} ({size_txt}) - {info_txt}")
         
-    if len(items) > display_count:
-        print(f"  ... and {len(items) - display_count} more (hidden).")
+    if total > len(shown):
+        lines.append(f"  ... and {total - len(shown)} more (hidden).")
 
-    print("\n---------------------------------------------------------")
-    print("Options: [s]elect numbers to delete, [a]ll shown, [n]one")
-    choice = input("Your choice: ").strip().lower()
-
-    to_delete = []
-    if choice == 'a':
-        to_delete = items[:display_count]
-    elif choice == 's':
-        nums = input("Enter numbers (e.g. 1 3): ").split()
-        for n in nums:
-            try:
-                idx = int(n) - 1
-                if 0 <= idx < display_count:
-                    to_delete.append(items[idx])
-            except ValueError:
-                pass
-    
-    if not to_delete:
-        print("No actions taken.")
-        return
+    lines.append("")
+    lines.append("---------------------------------------------------------")
+    lines.append("Options: [s]elect numbers to delete, [a]ll shown, [n]one")
+    return lines
+
+def prompt_for_choice(scan, title):
+    """
+    Shows the largest candidates found so far and waits for the user's choice.
+    On a terminal the list is redrawn in place while the scan runs, so the user
+    can answer before it finishes. Returns (items shown, choice), or None if the
+    stage found nothing.
+    """
+    prompt = "Your choice: "
+    if not (sys.stdin.isatty() and sys.stdout.isatty()):
+        scan.done.wait()
+        shown, total = scan.top()
+        if not total: return None
+        print("\n" + "\n".join(format_item_lines(shown, total, title, False, scan.incomplete)))
+        return shown, ask(prompt).strip().lower()
+
+    width = max(shutil.get_terminal_size().columns - 1, 20)
+    drawn_lines = 0
+    drawn_state = None
+    print()
+    while True:
+        scanning = not scan.done.is_set()
+        state = (scan.version, scanning)
+        if state != drawn_state:
+            shown, total = scan.top()
+            if not scanning and not total:
+                # Nothing found: remove the progress line and skip the stage
+                if drawn_lines:
+                    sys.stdout.write(f"\033[{drawn_lines}F\033[J")
+                sys.stdout.flush()
+                return None
+            # Clip lines to the terminal width so the redraw can count them
+            lines = format_item_lines(shown, total, title, scanning, scan.incomplete)
+            lines = [l.expandtabs()[:width] for l in lines]
+            if drawn_lines:
+                sys.stdout.write(f"\033[{drawn_lines}F\033[J")
+            sys.stdout.write("\n".join(lines) + "\n" + prompt)
+            sys.stdout.flush()
+            drawn_lines = len(lines)
+            drawn_state = state
 
-    print(f"Deleting {len(to_delete)} items...")
-    for item in to_delete:
-        path = item.get('path', '')
-        # Check for Manual Action flags
-        if path == "(Manual Action Required)":
-            print(f"  Skipped {item.get('name', 'item')} (Requires manual action)")
+        ready, _, _ = select.select([sys.stdin], [], [], LIVE_REFRESH_SECONDS)
+        if not ready:
             continue
+        choice = sys.stdin.readline().strip().lower()
+        if choice or not scanning:
+            return shown, choice
+        # Plain Enter while scanning just refreshes; the echoed newline moved the cursor down
+        drawn_lines += 1
+        drawn_state = None
+
+def find_mount_point(path):
+    path = os.path.realpath(path)
+    while not os.path.ismount(path):
+        parent = os.path.dirname(path)
+        if parent == path: break
+        path = parent
+    return path
+
+def rmtree_collecting(path, failures):
+    """shutil.rmtree that carries on past errors, appending them to failures."""
+    if sys.version_info >= (3, 12):
+        shutil.rmtree(path, onexc=lambda func, failed_path, exc: failures.append(f"{failed_path}: {exc}"))
+    else:
+        shutil.rmtree(path, onerror=lambda func, failed_path, exc_info: failures.append(f"{failed_path}: {exc_info[1]}"))
+
+class DeletionEngine:
+    """
+    Deletes items in two phases.
+    1. stage() renames the item into a staging directory on the same volume.
+       That is O(1) whatever the size, and the journal entry is synced first.
+    2. A background pool purges staged items in parallel, counting freed bytes
+       and capturing errors per item. Entries that were not purged (crash,
+       Ctrl-C, errors) are picked up again by resume().
+    """
+    def __init__(self, journal_dir=PURGE_JOURNAL_DIR, workers=PURGE_WORKERS):
+        self.session = time.strftime("%Y%m%d-%H%M%S") + f"-{os.getpid()}"
+        self.journal_path = Path(journal_dir) / f"{self.session}.jsonl"
+        self._journal = None
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers)
+        self._futures = []
+        self._staging_dirs = {}  # st_dev -> session staging dir
+        self._counter = 0
+        self.total = 0
+        self.purged = 0
+        self.bytes_freed = 0
+        self.errors = []  # (path, message)
+        self.removed = {}  # path -> (bytes it frees, is a folder), for the usage tree
+
+    def _log(self, record, sync=False):
+        with self._lock:
+            if self._journal is None:
+                self.journal_path.parent.mkdir(parents=True, exist_ok=True)
+                self._journal = open(self.journal_path, "a", encoding="utf-8")
+            self._journal.write(json.dumps(record) + "\n")
+            self._journal.flush()
+            if sync:
+                os.fsync(self._journal.fileno())
+
+    def _staging_dir(self, device, path):
+        """Session staging directory on the volume of path (~/.Trash on the home volume)."""
+        if device not in self._staging_dirs:
+            try:
+                on_home_volume = os.stat(TRASH_DIR).st_dev == device
+            except OSError:
+                on_home_volume = False
+            base = TRASH_DIR / "mac_cleaner" if on_home_volume else Path(find_mount_point(path)) / STAGING_DIR_NAME
+            staging = base / self.session
+            try:
+                staging.mkdir(parents=True, exist_ok=True)
+            except OSError:
+                staging = None  # Read-only volume or no permission: purge in place
+            self._staging_dirs[device] = staging
+        return self._staging_dirs[device]
+
+    def stage(self, path, size=0):
+        """Moves path out of the way and queues it for purging. Raises OSError on failure."""
+        stats = os.lstat(path)
+        device = stats.st_dev
+        staging = self._staging_dir(device, path)
+        if staging is None:
+            staged = path
+        else:
+            with self._lock:
+                self._counter += 1
+                staged = str(staging / f"{self._counter}-{os.path.basename(path.rstrip('/'))}")
+        # Write ahead: after a crash the journal tells where the item went
+        with trace_span("stage for deletion", "delete", path=path, bytes=size):
+            self._log({'op': 'staged', 'path': path, 'staged': staged, 'size': size}, sync=True)
+            if staged != path:
+                os.rename(path, staged)
+        self._queue(path, staged, size)
+        is_dir = stat.S_ISDIR(stats.st_mode)
+        # A file with other hard links frees nothing
+        self.removed[path] = (size if is_dir or stats.st_nlink == 1 else 0, is_dir)
+        return staged
+
+    def _queue(self, path, staged, size):
+        with self._lock:
+            self.total += 1
+        self._futures.append(self._pool.submit(self._purge, path, staged, size))
+
+    def _purge(self, path, staged, size):
+        failures = []
+        with trace_span("purge", "delete", path=path, bytes=size):
+            try:
+                if os.path.isdir(staged) and not os.path.islink(staged):
+                    rmtree_collecting(staged, failures)
+                elif os.path.lexists(staged):
+                    os.remove(staged)
+            except OSError as e:
+                failures.append(str(e))
+            # Only what is really gone counts; what is left is retried next run
+            left = get_directory_size(staged) if failures and os.path.lexists(staged) else 0
+        with self._lock:
+            if failures:
+                self.errors.append((path, failures[0] + (f" (+{len(failures) - 1} more)" if len(failures) > 1 else "")))
+            else:
+                self.purged += 1
+            self.bytes_freed += max(size - left, 0)
+        if failures:
+            self._log({'op': 'failed', 'staged': staged, 'size': left})
+        else:
+            self._log({'op': 'purged', 'staged': staged})
+
+    def progress(self):
+        """One line on the purges so far, e.g. "3/5 items, 1.2 GB freed"."""
+        with self._lock:
+            finished = self.purged + len(self.errors)
+            return f"{finished}/{self.total} items, {format_size(self.bytes_freed)} freed"
+
+    def report_progress(self):
+        """Prints how the background purges are doing, if there are any."""
+        if self.total:
+            print(f"🗑️  Purging in the background: {self.progress()}")
+
+    def resume(self):
+        """Re-queues items that earlier sessions staged but did not purge. Returns their count."""
+        resumed = 0
+        journal_dir = self.journal_path.parent
+        if not journal_dir.exists():
+            return 0
+        for journal in sorted(journal_dir.glob("*.jsonl")):
+            if journal == self.journal_path: continue
+            pending = {}
+            try:
+                with open(journal, encoding="utf-8") as fp:
+                    for line in fp:
+                        try:
+                            record = json.loads(line)
+                        except ValueError:
+                            continue  # Torn last line
+                        if record.get('op') == 'staged':
+                            pending[record['staged']] = record
+                        elif record.get('op') == 'purged':
+                            pending.pop(record.get('staged'), None)
+                        elif record.get('op') == 'failed' and record.get('staged') in pending:
+                            # Only what was left over is still to be freed
+                            pending[record['staged']]['size'] = record.get('size', 0)
+            except OSError:
+                continue
+            for staged, record in pending.items():
+                if not os.path.lexists(staged):
+                    continue  # Crashed before the rename, or purged before it was logged
+                self._log(record, sync=True)
+                self._queue(record['path'], staged, record.get('size', 0))
+                resumed += 1
+            journal.unlink()
+        return resumed
+
+    def wait(self):
+        """Waits for queued purges, showing progress. Returns True if everything was purged."""
+        if not self._futures:
+            return True
+        with trace_span("wait for purges", "delete", items=self.total):
+            while True:
+                print(f"\r🗑️  Purging: {self.progress()}", end="", flush=True)
+                if all(f.done() for f in self._futures): break
+                time.sleep(0.2)
+        print()
+        self._pool.shutdown(wait=True)
+        for staging in self._staging_dirs.values():
+            if staging is None: continue
+            try:
+                staging.rmdir()
+            except OSError:
+                pass  # Something could not be purged and is still in there
+        with self._lock:
+            if self._journal:
+                self._journal.close()
+                self._journal = None
+        if self.errors:
+            print(f"⚠️  {len(self.errors)} items could not be fully deleted (retried next run):")
+            for path, message in self.errors:
+                print(f"  {path}: {message}")
+            return False
+        if self.journal_path.exists():
+            self.journal_path.unlink()
+        return True
+
+_deletion_engine = None
+
+def get_deletion_engine():
+    global _deletion_engine
+    if _deletion_engine is None:
+        _deletion_engine = DeletionEngine()
+    return _deletion_engine
+
+_dry_run = False
+
+def set_dry_run(enabled):
+    """Turns dry runs (--dry-run, implied by --fake-commands) on or off: nothing is deleted."""
+    global _dry_run
+    _dry_run = enabled
+
+def delete_items(to_delete, deleted=None):
+    """
+    Moves the given items out of the way and purges them in the background.
+    Returns the paths that were removed (appended to deleted, if given, as they go).
+    In a dry run the items are only reported, but still returned as removed so
+    the rest of the session plays out as it would.
+    """
+    engine = get_deletion_engine()
+    deleted = [] if deleted is None else deleted
+    print(f"{'Dry run, not deleting' if _dry_run else 'Deleting'} {len(to_delete)} items...")
+    with trace_span("delete_items", "delete", items=len(to_delete)):
+        for item in to_delete:
+            path = item.get('path', '')
+            # Check for Manual Action flags
+            if path == "(Manual Action Required)":
+                print(f"  Skipped {item.get('name', 'item')} (Requires manual action)")
+                continue
+            if 'keep' in item and not os.path.lexists(item['keep']):
+                print(f"  Skipped {path} (the copy it duplicates is gone: {item['keep']})")
+                continue
             
-        try:
-            if os.path.exists(path):
-                if os.path.isdir(path):
-                    shutil.rmtree(path)
-                else:
-                    os.remove(path)
-                print(f"  Deleted: {path}")
-        except Exception as e:
-            print(f"  Error: {e}")
+            if _dry_run:
+                print(f"  Would delete: {path}")
+                deleted.append(path)
+                continue
+            try:
+                if os.path.lexists(path):
+                    size = item.get('size', 0)
+                    if item.get('estimated'):
+                        size = get_directory_size(path)  # Estimates aren't good enough for accounting
+                    engine.stage(path, size)
+                    print(f"  Deleted: {path}")
+                    deleted.append(path)
+            except OSError as e:
+                print(f"  Error: {e}")
+    return deleted
+
+def list_and_delete(items, title):
+    """
+    Lists the largest candidates of a stage and deletes the ones the user selects.
+    items may be a list, a generator still producing candidates, or a StageScan.
+    While the scan runs the list updates live; after acting on it the user gets
+    the remaining candidates until the scan is finished or they choose [n]one.
+    Ctrl-C ends the stage (not the session).
+    Returns the paths that were deleted.
+    """
+    scan = items if isinstance(items, StageScan) else StageScan(items)
+    deleted = []
+    try:
+        while True:
+            with trace_span(f"review: {title}", "interactive"):
+                result = prompt_for_choice(scan, title)
+            if result is None:
+                break
+            shown, choice = result
+
+            to_delete = []
+            if choice == 'a':
+                to_delete = shown
+            elif choice == 's':
+                nums = ask("Enter numbers (e.g. 1 3): ").split()
+                for n in nums:
+                    try:
+                        idx = int(n) - 1
+                        if 0 <= idx < len(shown):
+                            to_delete.append(shown[idx])
+                    except ValueError:
+                        pass
+            
+            if not to_delete:
+                print("No actions taken.")
+                break
+
+            delete_items(to_delete, deleted)
+            scan.discard({item.get('path') for item in to_delete})
+            if scan.done.is_set():
+                break
+            print("\nStill scanning, showing the remaining candidates...")
+    except KeyboardInterrupt:
+        scan.stop("interrupted")
+        print("\n⏹️  Stage interrupted, moving on to the next one.")
+    finally:
+        scan.stop()
+    if scan.error:
+        # A crashed scan would otherwise just look like one that found nothing
+        print(f"⚠️  The scan failed, so this list may be incomplete: {scan.error}")
+    return deleted
 
 def get_disk_usage_summary():
     """Print disk usage for major categories."""
     print("\n📊 Disk Usage Summary:")
     
+    executor = get_executor()
+
     # Simple df output for main volume
-    try:
-        df = subprocess.check_output("df -h /", shell=True).decode('utf-8').split('\n')[1]
-        print(f"  Volume /: {df}")
-    except:
-        pass
+    df = executor.run(['df', '-h', '/']).stdout.split('\n')
+    if len(df) > 1 and df[1]:
+        print(f"  Volume /: {df[1]}")
 
-    dirs_to_check = {
-        "Applications": "/Applications",
-        "User Applications": str(Path.home() / "Applications"),
-        "Library": "/Library",
-        "User Library": str(Path.home() / "Library"),
-        "System": "/System",
-        "Users": "/Users",
-        "Home": str(Path.home())
-    }
-    
-    for label, path in dirs_to_check.items():
-        if os.path.exists(path):
-            try:
-                # du -sh is fast enough for top level
-                res = subprocess.check_output(['du', '-sh', path], stderr=subprocess.DEVNULL).decode('utf-8').split()[0]
-                # If du returns empty or weird output, skip
-                if not res: continue
-                print(f"  {label:<20}: {res}")
-            except:
-                # Permission denied or other error -> Skip silently
-                pass
+    existing = {label: str(path) for label, path in DISK_USAGE_DIRS.items() if os.path.exists(path)}
+    # du -sh is fast enough for top level; run them side by side
+    results = executor.run_many(['du', '-sh', path] for path in existing.values())
+    for label, result in zip(existing, results):
+        # Permission denied or other error -> du reports what it could, or nothing
+        res = result.stdout.split()
+        # If du returns empty or weird output, skip
+        if not res: continue
+        print(f"  {label:<20}: {res[0]}")
+
+class SnapshotManager:
+    """
+    Local Time Machine snapshots of one volume.
+    The list is fetched once and shared by the junk scan and the cleanup step.
+    """
+    SNAPSHOT_RE = re.compile(r"com\.apple\.TimeMachine\.(\d{4}-\d{2}-\d{2}-\d{6})")
+
+    def __init__(self, volume="/"):
+        self.volume = volume
+
+    def list(self, refresh=False):
+        """Returns the snapshot names. Raises CommandFailed if tmutil fails."""
+        executor = get_executor()
+        if refresh:
+            executor.forget("tmutil", "listlocalsnapshots")
+        result = executor.run(["tmutil", "listlocalsnapshots", self.volume], memo=True)
+        if not result.ok:
+            raise CommandFailed(result)
+        return [l.strip() for l in result.stdout.split('\n') if "com.apple.TimeMachine" in l]
+
+    def free_bytes(self):
+        """Free space on the volume according to df, or None."""
+        lines = get_executor().run(["df", "-k", self.volume]).stdout.strip().split('\n')
+        try:
+            return int(lines[-1].split()[3]) * 1024
+        except (IndexError, ValueError):
+            return None
+
+    def delete_all(self):
+        """
+        Deletes every local snapshot and verifies the result.
+        First one tmutil call for the whole volume; whatever survives it (older
+        macOS, snapshots that were busy) is deleted by date, several at a time.
+        Returns (deleted count, names still present, bytes reclaimed or None, seconds).
+        """
+        with trace_span("delete snapshots", "delete") as span:
+            result = self._delete_all()
+            span.set(deleted=result[0], remaining=len(result[1]), reclaimed=result[2])
+            return result
+
+    def _delete_all(self):
+        start = time.monotonic()
+        free_before = self.free_bytes()
+        snapshots = self.list()
+
+        executor = get_executor()
+        executor.run(["tmutil", "deletelocalsnapshots", self.volume])
+        remaining = self.list(refresh=True)
+        if remaining:
+            dates = [m.group(1) for m in map(self.SNAPSHOT_RE.search, remaining) if m]
+            executor.run_many(["tmutil", "deletelocalsnapshots", d] for d in dates)
+            remaining = self.list(refresh=True)
+
+        free_after = self.free_bytes()
+        reclaimed = None
+        if free_before is not None and free_after is not None:
+            reclaimed = max(free_after - free_before, 0)
+        deleted = len(set(snapshots) - set(remaining))
+        return deleted, remaining, reclaimed, time.monotonic() - start
+
+_snapshot_manager = None
+
+def get_snapshot_manager():
+    global _snapshot_manager
+    if _snapshot_manager is None:
+        _snapshot_manager = SnapshotManager()
+    return _snapshot_manager
 
 def suggest_snapshot_cleanup():
     """
@@ -566,139 +2255,765 @@ def suggest_snapshot_cleanup():
     print("Files you deleted may still be taking up space as Time Machine Local Snapshots.")
     print("Deleting these snapshots will free up space immediately but remove recent local history.")
     
+    manager = get_snapshot_manager()
     try:
-        # Check count
-        tm_out = subprocess.check_output(["tmutil", "listlocalsnapshots", "/"], stderr=subprocess.DEVNULL)
-        lines = tm_out.decode('utf-8').strip().split('\n')
-        snapshots = [l.strip() for l in lines if "com.apple.TimeMachine" in l]
-        count = len(snapshots)
-        
-        if count == 0:
-            print("✅ No local snapshots found. You are good.")
-            return
-            
-        print(f"⚠️  Found {count} local Time Machine snapshots.")
-        choice = input("Do you want to delete these snapshots to reclaim space? (y/n): ").strip().lower()
+        snapshots = manager.list()
+    except CommandFailed as e:
+        print(f"Error checking snapshots: {e}")
+        return
+
+    if not snapshots:
+        print("✅ No local snapshots found. You are good.")
+        return
         
-        if choice == 'y':
-            print("Deleting snapshots (this may take a moment)...")
-            count_deleted = 0
-            for snap in snapshots:
-                # Extract date part
-                # com.apple.TimeMachine.2023-10-25-100000 -> 2023-10-25-100000
-                if "com.apple.TimeMachine." in snap:
-                    try:
-                        date_str = snap.split("com.apple.TimeMachine.")[1]
-                        print(f"  Deleting snapshot {date_str}...")
-                        subprocess.run(["tmutil", "deletelocalsnapshots", date_str], stderr=subprocess.DEVNULL)
-                        count_deleted += 1
-                    except IndexError:
-                        pass
-            
-            print(f"✅ {count_deleted} Snapshots cleared.")
+    print(f"⚠️  Found {len(snapshots)} local Time Machine snapshots.")
+    choice = ask("Do you want to delete these snapshots to reclaim space? (y/n): ").strip().lower()
+    if choice != 'y':
+        print("Skipped snapshot cleanup.")
+        return
+
+    if _dry_run:
+        print(f"Dry run, {len(snapshots)} snapshots would be deleted.")
+        return
+
+    print("Deleting snapshots (this may take a moment)...")
+    try:
+        deleted, remaining, reclaimed, elapsed = manager.delete_all()
+    except CommandFailed as e:
+        print(f"Error deleting snapshots: {e}")
+        return
+    reclaimed_txt = format_size(reclaimed) if reclaimed is not None else "unknown space"
+    print(f"✅ {deleted} Snapshots cleared in {elapsed:.1f}s, reclaimed {reclaimed_txt}.")
+    if remaining:
+        print(f"⚠️  {len(remaining)} snapshots could not be deleted:")
+        for name in remaining:
+            print(f"  {name}")
+
+class UsageNode:
+    """
+    A directory in the usage tree.
+    size is inclusive (everything below), own_size counts files directly inside.
+    Subfolders smaller than the collapse threshold are not kept as nodes; their
+    bytes and count are folded into other_size/other_count so nothing is lost.
+    """
+    __slots__ = ('name', 'path', 'size', 'own_size', 'other_size', 'other_count', 'children')
+
+    def __init__(self, name, path):
+        self.name = name
+        self.path = path
+        self.size = 0
+        self.own_size = 0
+        self.other_size = 0
+        self.other_count = 0
+        self.children = []
+
+    def sorted_children(self):
+        return sorted(self.children, key=lambda c: c.size, reverse=True)
+
+def scan_usage_dir(node, device, seen_inodes):
+    """Adds the files directly in node to own_size and returns its subdirectory paths."""
+    subdirs = []
+    visited = 0
+    cancel = current_cancel_token()
+    try:
+        with os.scandir(node.path) as it:
+            for entry in it:
+                visited += 1
+                if visited % CANCEL_CHECK_ENTRIES == 0 and cancel.cancelled:
+                    break
+                try:
+                    stats = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    # Stay on one volume, like du -x
+                    if stats.st_dev == device:
+                        subdirs.append(entry)
+                    continue
+                if stats.st_nlink > 1:
+                    # Count hard-linked files once
+                    key = (stats.st_dev, stats.st_ino)
+                    if key in seen_inodes: continue
+                    seen_inodes.add(key)
+                # Allocated size, like du (cloud placeholders take no space)
+                node.own_size += stats.st_blocks * 512
+    except OSError:
+        pass  # Permission denied, vanished directory, etc.
+    trace_count("inodes visited", usage_tree=visited)
+    trace_count("bytes scanned", usage_tree=node.own_size)
+    return subdirs
+
+def build_usage_tree(path, collapse_bytes=USAGE_COLLAPSE_BYTES, seen_inodes=None):
+    """
+    Walks path once and returns its UsageNode tree.
+    Memory stays bounded: finished subtrees below collapse_bytes are folded into
+    their parent, so only folders worth looking at are kept.
+    If the stage is cancelled the walk stops and the sizes found so far are kept.
+    """
+    path = str(path)
+    seen_inodes = set() if seen_inodes is None else seen_inodes
+    try:
+        device = os.stat(path).st_dev
+    except OSError:
+        return None
+    with trace_span("usage tree walk", "walk", path=path) as span:
+        root = _walk_usage_tree(path, device, collapse_bytes, seen_inodes)
+        span.set(bytes=root.size)
+        return root
+
+def _walk_usage_tree(path, device, collapse_bytes, seen_inodes):
+    root = UsageNode(os.path.basename(path.rstrip('/')) or path, path)
+    stack = [(root, scan_usage_dir(root, device, seen_inodes))]
+    cancel = current_cancel_token()
+    while stack:
+        node, pending = stack[-1]
+        if pending and cancel.cancelled:
+            pending.clear()
+        if pending:
+            entry = pending.pop()
+            child = UsageNode(entry.name, entry.path)
+            stack.append((child, scan_usage_dir(child, device, seen_inodes)))
+            continue
+        stack.pop()
+        node.size = node.own_size + node.other_size + sum(c.size for c in node.children)
+        if stack:
+            parent = stack[-1][0]
+            if node.size < collapse_bytes:
+                parent.other_size += node.size
+                parent.other_count += 1
+            else:
+                parent.children.append(node)
+    return root
+
+def build_usage_forest(roots=None, collapse_bytes=USAGE_COLLAPSE_BYTES):
+    """Builds one usage tree over several roots, under a virtual top node."""
+    top = UsageNode("System Data locations", "")
+    seen_inodes = set()
+    for root in (USAGE_TREE_ROOTS if roots is None else roots):
+        if current_cancel_token().cancelled: break
+        if not os.path.exists(root): continue
+        node = build_usage_tree(root, collapse_bytes, seen_inodes)
+        if node is not None:
+            top.children.append(node)
+    top.size = sum(c.size for c in top.children)
+    return top
+
+def find_usage_path(top, path):
+    """Returns the chain of nodes from top to the deepest node containing path."""
+    chain = [top]
+    while True:
+        node = chain[-1]
+        for child in node.children:
+            if path == child.path or path.startswith(child.path.rstrip('/') + '/'):
+                chain.append(child)
+                break
         else:
-             print("Skipped snapshot cleanup.")
-            
-    except Exception as e:
-        print(f"Error checking snapshots: {e}")
+            return chain
+
+def remove_usage_paths(top, deleted_paths, removed=None):
+    """
+    Updates the tree after paths were deleted.
+    A deleted folder node is dropped. Anything deeper (a plain file, or
+    something inside a collapsed subtree) is subtracted from the deepest known
+    node using the size it had when it was deleted (removed: path ->
+    (bytes freed, is a folder), by default what the deletion engine staged).
+    Re-walking that node instead would count hard links found elsewhere again.
+    """
+    removed = get_deletion_engine().removed if removed is None else removed
+    for path in deleted_paths:
+        chain = find_usage_path(top, path)
+        if len(chain) < 2: continue  # Not under any scanned root
+        node = chain[-1]
+        if node.path == path:
+            chain[-2].children.remove(node)
+            delta = -node.size
+        else:
+            size, is_dir = removed.get(path, (0, False))
+            if os.path.dirname(path) == node.path and not is_dir:
+                delta = -min(size, node.own_size)
+                node.own_size += delta
+            else:
+                delta = -min(size, node.other_size)
+                node.other_size += delta
+                if is_dir and os.path.dirname(path) == node.path:
+                    node.other_count = max(node.other_count - 1, 0)
+        for ancestor in chain:
+            ancestor.size += delta
+
+def find_usage_hotspots(top, min_bytes=USAGE_HOTSPOT_BYTES):
+    """
+    Returns the deepest folders of at least min_bytes, largest first.
+    None of them contains another, so their sizes never double-count.
+    """
+    hotspots = []
+    stack = list(top.children)
+    while stack:
+        node = stack.pop()
+        if node.size < min_bytes: continue
+        big_children = [c for c in node.children if c.size >= min_bytes]
+        if big_children:
+            stack.extend(big_children)
+        else:
+            hotspots.append(node)
+    return sorted(hotspots, key=lambda n: n.size, reverse=True)
+
+def format_usage_level(node):
+    """Renders one level of the tree; the lines add up to the node's size."""
+    lines = [f"📂 {node.path or node.name} ({format_size(node.size)})"]
+    children = node.sorted_children()
+    for i, child in enumerate(children):
+        share = (child.size / node.size * 100) if node.size else 0
+        marker = "/" if child.children else ""
+        lines.append(f"  [{i+1}]\t{format_size(child.size):>10}  {share:5.1f}%  {child.name}{marker}")
+    if node.own_size:
+        lines.append(f"      \t{format_size(node.own_size):>10}          (files directly in here)")
+    if node.other_count:
+        lines.append(f"      \t{format_size(node.other_size):>10}          ({node.other_count} smaller folders)")
+    return lines, children
 
-def analyze_library_bloat():
+def browse_usage_tree(top):
+    """Lets the user drill down into the usage tree and delete folders from it."""
+    chain = [top]
+    while True:
+        node = chain[-1]
+        lines, children = format_usage_level(node)
+        print("\n" + "\n".join(lines))
+        print("\nOptions: number to open, [u]p, [d]elete folders from this list, [q]uit")
+        choice = ask("Your choice: ").strip().lower()
+        if choice in ('q', ''):
+            return
+        if choice == 'u':
+            if len(chain) > 1: chain.pop()
+        elif choice == 'd':
+            items = [{
+                'path': c.path,
+                'name': c.name,
+                'size': c.size,
+                'info': f"Folder in {node.name}"
+            } for c in children if c.path]
+            deleted = list_and_delete(items, f"Folders in {node.path or node.name} (DELETE CAREFULLY)")
+            remove_usage_paths(top, deleted)
+        elif choice.isdigit() and 1 <= int(choice) <= len(children):
+            child = children[int(choice) - 1]
+            if child.children or child.own_size or child.other_count:
+                chain.append(child)
+
+def analyze_library_bloat(tree=None):
     """
     Deep scan of ~/Library and /Library to find what is actually taking up space.
     This is often where 'System Data' lives.
+    tree is an already built (or building) usage tree, as returned by
+    build_usage_forest() or a Future of it.
     """
     print("\n---------------------------------------------------------")
     print("🕵️  Deep Scan: Analyzing 'System Data' locations...")
-    
-    # Locations to analyze (Where System Data Hides)
-    scan_roots = [
-        Path.home() / "Library",
-        Path.home() / "Library/Application Support",
-        Path.home() / "Library/Containers",
-        Path.home() / "Library/Group Containers",
-        Path.home() / "Library/Caches",
-        Path.home() / "Library/Developer",
-        Path("/Library"),
-        Path("/Library/Application Support"),
-        Path("/Users/Shared")
-    ]
-    
-    bloat_items = []
-    
-    for root in scan_roots:
-        if not os.path.exists(root): continue
-        if not os.access(root, os.R_OK): continue
-        
-        try:
-            # Check immediate children size
-            for item in os.listdir(root):
-                full_path = os.path.join(root, item)
-                if not os.path.isdir(full_path): continue
-                if item.startswith('.'): continue
-                
-                # Skip if size calculation fails (permission)
-                try:
-                    size = get_directory_size(full_path)
-                    # Filter: Only show "Big" folders > 1GB
-                    if size > 1 * 1024 * 1024 * 1024:
-                        bloat_items.append({
-                            'path': full_path,
-                            'name': item,
-                            'size': size,
-                            'info': f"Large Folder in {os.path.basename(root)}"
-                        })
-                except:
-                    pass
-        except:
-             pass
-             
-    # Sort by size descending
-    bloat_items.sort(key=lambda x: x['size'], reverse=True)
-    
-    # Deduplication logic
-    # If we have:
-    # 1. ~/Library/Application Support (5GB)
-    # 2. ~/Library/Application Support/SomeApp (4GB)
-    # The parent (1) includes the child (2). 
-    # We prefer seeing the specific child (2) if it explains most of the parent's size.
-    # But seeing both confusingly implies 9GB total.
-    
-    # Simple Dedupe: Remove parent if child is present? 
-    # Or just list top items and let user see.
-    # Let's clean up by removing duplicates if path is exact same (not happening due to scan roots)
-    # But if path A is inside path B, maybe flag it?
-    
-    final_list = []
-    for i, item in enumerate(bloat_items):
-        is_child = False
-        # Check if this item is a parent of another item higher up? No, smaller children.
-        # Check if this item is a child of another item in the list
-        # If so, keep it, but maybe mark parent as "Contains..."
-        final_list.append(item)
+
+    if tree is None:
+        tree = build_usage_forest()
+    elif hasattr(tree, 'result'):
+        tree = tree.result()
+
+    hotspots = find_usage_hotspots(tree)[:20]
+    if not hotspots:
+        return
+
+    print(f"\n📦 Largest 'System Data' Folders (no folder contains another):")
+    for i, node in enumerate(hotspots):
+        print(f"  [{i+1}] {node.path} ({format_size(node.size)})")
+    for root in tree.sorted_children():
+        print(f"      {root.path}: {format_size(root.size)} in total")
         
-    # Take top 20 unique paths
-    # Use a dictionary to avoid exact duplicates
-    unique_paths = {}
-    for item in final_list:
-        if item['path'] not in unique_paths:
-             unique_paths[item['path']] = item
-             
-    top_items = sorted(unique_paths.values(), key=lambda x: x['size'], reverse=True)[:20]
+    print("\nNOTE: These folders are the biggest contributors to storage usage.")
+    print("      Some are system critical, others are app data you might not need.")
     
-    if top_items:
-        print(f"\n📦 Top 20 Largest 'System Data' Folders:")
-        for i, item in enumerate(top_items):
-            print(f"  [{i+1}] {item['path']} ({format_size(item['size'])})")
+    # Interactive browse/delete option
+    choice = ask("\nDo you want to browse and manage these folders? (y/n): ").strip().lower()
+    if choice == 'y':
+        browse_usage_tree(tree)
             
-        print("\nNOTE: These folders are the biggest contributors to storage usage.")
-        print("      Some are system critical, others are app data you might not need.")
-        
-        # Interactive delete option
-        choice = input("\nDo you want to manage these folders? (y/n): ").strip().lower()
-        if choice == 'y':
-            list_and_delete(top_items, "Large System Data Folders (DELETE CAREFULLY)")
-            
-def main():
+class SizeHistory:
+    """
+    Append-only store of folder size snapshots (--snapshot / --diff).
+    sizes.gz holds one gzip member per snapshot (concatenated members are still a
+    valid gzip file) and index.tsv one line per snapshot with the offset and length
+    of its member, so reading a snapshot never decompresses the others.
+    A snapshot is a JSON header line followed by "parent<TAB>size<TAB>name" lines,
+    parents first; parent is the line number of the parent folder, or -1 for a root
+    (named by its full path).
+    cache.json.gz keeps every folder's mtime, file bytes and subfolder names for the
+    next snapshot; unlike the rest it is rewritten each time.
+    """
+    def __init__(self, directory=SIZE_HISTORY_DIR):
+        self.directory = Path(directory)
+        self.data_path = self.directory / "sizes.gz"
+        self.index_path = self.directory / "index.tsv"
+        self.cache_path = self.directory / "cache.json.gz"
+
+    def entries(self):
+        """Returns (time, offset, length, folders, bytes) per snapshot, oldest first."""
+        entries = []
+        try:
+            with open(self.index_path, encoding="utf-8") as f:
+                for line in f:
+                    fields = line.split('\t')
+                    # A line cut short by a crash has no newline and is ignored
+                    if not line.endswith('\n') or len(fields) != 5: continue
+                    entries.append((float(fields[0]), int(fields[1]), int(fields[2]), int(fields[3]), int(fields[4])))
+        except OSError:
+            pass
+        return entries
+
+    def append(self, header, lines):
+        """Appends one snapshot. The data is synced before the index points to it."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        member = gzip.compress("\n".join([json.dumps(header)] + lines + [""]).encode("utf-8"))
+        with open(self.data_path, "ab") as f:
+            offset = f.seek(0, os.SEEK_END)
+            f.write(member)
+            f.flush()
+            os.fsync(f.fileno())
+        with open(self.index_path, "a+b") as f:
+            end = f.seek(0, os.SEEK_END)
+            f.seek(max(0, end - 4096))
+            tail = f.read()
+            if tail and not tail.endswith(b"\n"):
+                f.truncate(end - len(tail) + tail.rfind(b"\n") + 1)
+            f.write(f"{header['time']}\t{offset}\t{len(member)}\t{header['folders']}\t{header['bytes']}\n".encode("utf-8"))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def load(self, entry):
+        """Returns the header and {path: size} of one snapshot."""
+        with open(self.data_path, "rb") as f:
+            f.seek(entry[1])
+            lines = gzip.decompress(f.read(entry[2])).decode("utf-8").split("\n")
+        header = json.loads(lines[0])
+        paths, sizes = [], {}
+        for line in lines[1:]:
+            if not line: continue
+            parent, size, name = line.split("\t", 2)
+            parent = int(parent)
+            path = json.loads(name)
+            if parent >= 0:
+                path = os.path.join(paths[parent], path)
+            paths.append(path)
+            sizes[path] = int(size)
+        return header, sizes
+
+    def load_cache(self):
+        try:
+            with gzip.open(self.cache_path, "rt", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, EOFError, ValueError):
+            return None
+
+    def save_cache(self, cache):
+        temp = self.cache_path.with_name(self.cache_path.name + ".tmp")
+        with gzip.open(temp, "wt", encoding="utf-8") as f:
+            json.dump(cache, f, separators=(",", ":"))
+        os.replace(temp, self.cache_path)
+
+def scan_size_dir(path, device, seen_inodes):
+    """
+    Returns the allocated bytes of the files directly in path, its subfolders as
+    (name, mtime_ns) and its large files as [name, allocated bytes].
+    """
+    own_size = 0
+    subdirs = []
+    large = []
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    stats = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    if stats.st_dev == device:
+                        subdirs.append((entry.name, stats.st_mtime_ns))
+                    continue
+                if stats.st_nlink > 1:
+                    key = (stats.st_dev, stats.st_ino)
+                    if key in seen_inodes: continue
+                    seen_inodes.add(key)
+                elif stats.st_blocks * 512 >= SIZE_HISTORY_RESTAT_BYTES:
+                    large.append([entry.name, stats.st_blocks * 512])
+                own_size += stats.st_blocks * 512
+    except OSError:
+        pass
+    return own_size, subdirs, large
+
+def scan_size_tree(root, roots, depth, cache, new_cache, seen_inodes, counts):
+    """
+    Walks root on its own volume and returns the recorded folders as nested
+    [name, size, children] lists: everything down to depth levels below root, or
+    below any of roots met on the way.
+    A folder whose mtime matches cache is not listed again; its file bytes and
+    subfolder names come from the cache, so it costs one stat per subfolder instead
+    of one per entry. Files that grow in place (VM images, Docker.raw, logs) leave
+    the mtime alone, so its large files are stat'ed again too. Every folder walked
+    goes into new_cache.
+    """
+    try:
+        stats = os.stat(root)
+    except OSError:
+        return None
+    device = stats.st_dev
+
+    def enter(path, mtime):
+        cached = cache.get(path)
+        # Caches from before large files were tracked have three fields
+        if cached is not None and cached[0] == mtime and len(cached) > 3:
+            own_size, subdirs, large = cached[1], [], []
+            for name in cached[2]:
+                try:
+                    sub = os.lstat(os.path.join(path, name))
+                except OSError:
+                    continue
+                subdirs.append((name, sub.st_mtime_ns))
+            for name, size in cached[3]:
+                try:
+                    size_now = os.lstat(os.path.join(path, name)).st_blocks * 512
+                except OSError:
+                    size_now = 0
+                own_size += size_now - size
+                large.append([name, size_now])
+            counts['reused'] += 1
+        else:
+            own_size, subdirs, large = scan_size_dir(path, device, seen_inodes)
+            counts['listed'] += 1
+        new_cache[path] = [mtime, own_size, [name for name, _ in subdirs], large]
+        return own_size, subdirs
+
+    own_size, subdirs = enter(root, stats.st_mtime_ns)
+    top = [root, own_size, []]
+    stack = [(top, root, depth, subdirs)]
+    while stack:
+        node, path, remaining, pending = stack[-1]
+        if pending:
+            name, mtime = pending.pop()
+            child_path = os.path.join(path, name)
+            own_size, subdirs = enter(child_path, mtime)
+            child_remaining = depth if child_path in roots else remaining - 1
+            stack.append(([name, own_size, []], child_path, child_remaining, subdirs))
+            continue
+        stack.pop()
+        if stack:
+            parent = stack[-1][0]
+            parent[1] += node[1]
+            if remaining >= 0 or node[2]:
+                parent[2].append(node)
+    return top
+
+def size_history_roots():
+    """The folders whose subtrees are recorded, in DISK_USAGE_DIRS then LIBRARY_SCAN_DIRS order."""
+    roots = []
+    for path in list(DISK_USAGE_DIRS.values()) + LIBRARY_SCAN_DIRS:
+        path = str(path)
+        if path not in roots and os.path.isdir(path):
+            roots.append(path)
+    return roots
+
+def record_size_snapshot(history=None, depth=SIZE_HISTORY_DEPTH):
+    """
+    Appends a snapshot of the size history roots to history and returns its header.
+    Files that grow in place (logs, databases) leave their folder's mtime alone,
+    so the cache is dropped once it is SIZE_HISTORY_RESCAN_DAYS old and everything
+    is listed again.
+    """
+    history = history or SizeHistory()
+    started = time.time()
+    roots = size_history_roots()
+    # Nested roots (~/Library inside the home folder) are walked as part of the outer one
+    outer = [r for r in roots if not any(r.startswith(o.rstrip('/') + '/') for o in roots)]
+    cache = history.load_cache()
+    if cache is None or started - cache['time'] > SIZE_HISTORY_RESCAN_DAYS * 24 * 60 * 60:
+        cache = {'time': started, 'folders': {}}
+    new_cache = {'time': cache['time'], 'folders': {}}
+    counts = {'listed': 0, 'reused': 0}
+    seen_inodes = set()
+    lines = []
+    total = 0
+    with trace_span("size snapshot", "walk") as span:
+        for root in outer:
+            tree = scan_size_tree(root, set(roots), depth, cache['folders'], new_cache['folders'], seen_inodes, counts)
+            if tree is None: continue
+            total += tree[1]
+            stack = [(tree, -1)]
+            while stack:
+                (name, size, children), parent = stack.pop()
+                lines.append(f"{parent}\t{size}\t{json.dumps(name)}")
+                stack.extend((child, len(lines) - 1) for child in reversed(children))
+        span.set(bytes=total, **counts)
+    header = {
+        'time': started,
+        'depth': depth,
+        'roots': roots,
+        'folders': len(lines),
+        'bytes': total,
+        'listed': counts['listed'],
+        'reused': counts['reused'],
+        'seconds': round(time.time() - started, 3),
+    }
+    history.append(header, lines)
+    history.save_cache(new_cache)
+    return header
+
+def format_snapshot_time(timestamp):
+    return time.strftime("%Y-%m-%d %H:%M", time.localtime(timestamp))
+
+def format_change(size_bytes):
+    return ("+" if size_bytes >= 0 else "-") + format_size(abs(size_bytes))
+
+def print_size_history(entries):
+    print("\nSnapshots in the size history:")
+    for i, (timestamp, _, _, folders, size) in enumerate(entries):
+        print(f"  [{i+1}] {format_snapshot_time(timestamp)}  {format_size(size):>10} in {folders} folders")
+
+def find_size_snapshot(entries, ref):
+    """A snapshot by number (1 is the oldest, -1 the newest) or the latest one whose date/time starts with ref."""
+    try:
+        number = int(ref)
+    except ValueError:
+        matches = [e for e in entries if format_snapshot_time(e[0]).startswith(ref)]
+        return matches[-1] if matches else None
+    if 0 < number <= len(entries):
+        return entries[number - 1]
+    if 0 < -number <= len(entries):
+        return entries[number]
+    return None
+
+def size_growth(old, new, comparable):
+    """
+    Returns {path: growth} between two {path: size} snapshots.
+    A folder missing from one side counts as empty there only if both were taken
+    with the same roots and depth; otherwise it may just not have been recorded.
+    """
+    if comparable:
+        return {path: new.get(path, 0) - old.get(path, 0) for path in old.keys() | new.keys()}
+    return {path: new[path] - old[path] for path in old.keys() & new.keys()}
+
+def rank_growing_folders(growth, share=SIZE_HISTORY_SHARE):
+    """
+    Folders that grew, largest growth first. A folder is left out when one of its
+    subfolders accounts for share of its growth, so the list points at the folder
+    that actually grew rather than at all its parents.
+    """
+    children = {}
+    for path in growth:
+        children.setdefault(os.path.dirname(path), []).append(path)
+    ranked = []
+    for path, change in growth.items():
+        if change <= 0: continue
+        if any(growth[child] >= share * change for child in children.get(path, ())): continue
+        ranked.append((change, path))
+    ranked.sort(reverse=True)
+    return ranked
+
+def diff_size_snapshots(old_ref="-2", new_ref="-1", history=None, top=SIZE_HISTORY_TOP):
+    """Prints the fastest-growing folders between two snapshots. Returns False if one is missing."""
+    history = history or SizeHistory()
+    entries = history.entries()
+    if len(entries) < 2:
+        print(f"Need at least two snapshots to compare, found {len(entries)}. Run with --snapshot first.")
+        return False
+    old_entry, new_entry = find_size_snapshot(entries, old_ref), find_size_snapshot(entries, new_ref)
+    for ref, entry in ((old_ref, old_entry), (new_ref, new_entry)):
+        if entry is None:
+            print(f"❌ No snapshot matches {ref!r}.")
+            print_size_history(entries)
+            return False
+    old_header, old = history.load(old_entry)
+    new_header, new = history.load(new_entry)
+    comparable = old_header['roots'] == new_header['roots'] and old_header['depth'] == new_header['depth']
+    ranked = rank_growing_folders(size_growth(old, new, comparable))
+
+    days = (new_header['time'] - old_header['time']) / (24 * 60 * 60)
+    print(f"\n📈 Folder growth from {format_snapshot_time(old_header['time'])} "
+          f"to {format_snapshot_time(new_header['time'])} ({days:.1f} days):")
+    print(f"  Total: {format_change(new_header['bytes'] - old_header['bytes'])}")
+    if not comparable:
+        print("  ⚠️  The snapshots were taken with different folders or depths; only folders in both are compared.")
+    if new_header.get('reused'):
+        print(f"  Unchanged folders came from the cache: files under {format_size(SIZE_HISTORY_RESTAT_BYTES)} "
+              f"that grew in place may show up only after the next full walk (every {SIZE_HISTORY_RESCAN_DAYS} days).")
+    if not ranked:
+        print("  Nothing grew.")
+    for i, (change, path) in enumerate(ranked[:top]):
+        rate = f"  ({format_size(change / days)}/day)" if days >= 1 else ""
+        print(f"  [{i+1}] {format_change(change):>11}{rate}  {path}")
+    return True
+
+def run_size_history(snapshot, diff_refs, depth=SIZE_HISTORY_DEPTH):
+    """--snapshot records a snapshot, --diff compares two (after recording, if both are given)."""
+    history = SizeHistory()
+    if snapshot:
+        header = record_size_snapshot(history, depth)
+        walked = header['listed'] + header['reused']
+        print(f"📸 Recorded {header['folders']} folders ({format_size(header['bytes'])}) in {header['seconds']:.1f}s; "
+              f"{header['reused']} of {walked} folders unchanged since the last snapshot.")
+    if diff_refs is not None:
+        return diff_size_snapshots(*(diff_refs or ["-2"]), history=history)
+    return True
+
+STAGE_TITLES = {
+    'unused': "Unused applications",
+    'leftovers': "Leftover app data",
+    'large': "Large files",
+    'duplicates': "Duplicate files",
+    'junk': "System junk",
+    'usage': "Deep scan",
+}
+
+def wait_for_stage(future, token, grace=5):
+    """
+    Waits for a stage running in the background (a Future) within its budget.
+    On timeout or Ctrl-C the stage is cancelled and gets grace seconds to hand
+    back what it has. Returns its result, or None.
+    """
+    try:
+        return future.result(timeout=token.remaining())
+    except TimeoutError:
+        token.cancel("timed out")
+    except KeyboardInterrupt:
+        token.cancel("interrupted")
+        print("\n⏹️  Stage interrupted, moving on.")
+    try:
+        return future.result(timeout=grace)
+    except (TimeoutError, StageCancelled):
+        return None
+
+def print_stage_summary(rows):
+    """Prints how each scan stage did against its budget: (stage, budget, elapsed, status, found)."""
+    print("\n⏱️  Scan stages:")
+    for stage, budget, elapsed, status, found in rows:
+        limit = f"of {budget:g}s" if budget else "(no limit)"
+        found_txt = f", {found} found" if found is not None else ""
+        print(f"  {STAGE_TITLES.get(stage, stage):<20} {elapsed:7.1f}s {limit:<11} {status}{found_txt}")
+
+def parse_budget(value):
+    """argparse type for --budget: "SECONDS" (every stage) or "STAGE=SECONDS"."""
+    stage, _, seconds = value.rpartition('=')
+    if stage and stage not in STAGE_BUDGET_SECONDS:
+        raise argparse.ArgumentTypeError(
+            f"unknown stage {stage!r}, expected one of {', '.join(STAGE_BUDGET_SECONDS)}")
+    try:
+        seconds = float(seconds)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"not a number of seconds: {seconds!r}")
+    if seconds < 0:
+        raise argparse.ArgumentTypeError("a budget can't be negative")
+    return stage or None, seconds
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="mac_cleaner",
+        description="Find and remove unused apps, leftovers, large files and system junk",
+    )
+    parser.add_argument(
+        "--record-commands",
+        metavar="FILE",
+        help="Record the output of every external command (du, mdls, ...) into FILE",
+    )
+    parser.add_argument(
+        "--fake-commands",
+        action="store_true",
+        help="Emulate du/mdls/mdfind/tmutil/df instead of running them (works off macOS); implies --dry-run",
+    )
+    parser.add_argument(
+        "--replay-commands",
+        metavar="FILE",
+        help="Answer external commands from a recording made with --record-commands (implies --fake-commands)",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Go through every stage but delete nothing, only list what would be deleted",
+    )
+    parser.add_argument(
+        "--estimate",
+        action="store_true",
+        help="Size folders by sampling where only a threshold matters: ~40-75%% of du's time unless a "
+        "folder is within 0.8-1.25x of the threshold, where du runs anyway (about one du)",
+    )
+    parser.add_argument(
+        "--trace",
+        metavar="FILE",
+        help="Write a Chrome trace (spans for stages, commands and walks, plus counters) to FILE; open it in Perfetto",
+    )
+    parser.add_argument(
+        "--budget",
+        metavar="[STAGE=]SECONDS",
+        type=parse_budget,
+        action="append",
+        default=[],
+        help=f"Time limit for every scan stage, or for one of: {', '.join(STAGE_BUDGET_SECONDS)}. "
+             "0 means no limit. May be given several times",
+    )
+    parser.add_argument(
+        "--snapshot",
+        action="store_true",
+        help="Record folder sizes into the size history and exit. Unchanged folders are skipped, "
+             "so it is cheap enough to run daily from a LaunchAgent",
+    )
+    parser.add_argument(
+        "--diff",
+        nargs="*",
+        metavar="SNAPSHOT",
+        help="Show the fastest-growing folders between two size history snapshots and exit "
+             "(default: the last two; one SNAPSHOT is compared with the newest). "
+             "A SNAPSHOT is a number (1 = oldest, -1 = newest) or a date like 2026-10-12",
+    )
+    parser.add_argument(
+        "--depth",
+        type=int,
+        default=SIZE_HISTORY_DEPTH,
+        help=f"Folder levels recorded by --snapshot below each location (default {SIZE_HISTORY_DEPTH})",
+    )
+    args = parser.parse_args(argv)
+    if args.diff is not None and len(args.diff) > 2:
+        parser.error("--diff takes at most two snapshots")
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    recorder = None
+    if args.replay_commands or args.fake_commands:
+        set_command_backend(FakeBackend(args.replay_commands))
+        # Sizes and dates are made up, so decisions based on them must not touch real files
+        set_dry_run(True)
+    elif args.record_commands:
+        recorder = RecordingBackend(args.record_commands)
+        set_command_backend(recorder)
+    if args.dry_run:
+        set_dry_run(True)
+    set_size_estimation(args.estimate)
+    budgets = dict(STAGE_BUDGET_SECONDS)
+    for stage, seconds in args.budget:
+        if stage is None:
+            budgets = dict.fromkeys(budgets, seconds)
+        else:
+            budgets[stage] = seconds
+
+    tracer = set_tracer(Tracer(args.trace)) if args.trace else None
+
+    try:
+        if args.snapshot or args.diff is not None:
+            if not run_size_history(args.snapshot, args.diff, args.depth):
+                sys.exit(1)
+        else:
+            with trace_span("session", "stage"):
+                run_session(budgets)
+    finally:
+        get_executor().report_failures()
+        if recorder:
+            recorder.save()
+        if tracer:
+            tracer.save()
+            print(f"Trace written to {args.trace} (open it in https://ui.perfetto.dev)")
+
+def run_session(budgets=None):
+    budgets = STAGE_BUDGET_SECONDS if budgets is None else budgets
     if os.geteuid() != 0:
         print("⚠️  Warning: script running without sudo/root privileges.")
         print("    System-wide cleanup will be limited.")
@@ -706,32 +3021,98 @@ def main():
 
     get_disk_usage_summary()
 
+    engine = get_deletion_engine()
+    resumed = engine.resume()
+    if resumed:
+        print(f"\n🗑️  Resuming {resumed} interrupted deletions in the background.")
+
     apps = get_installed_apps_info()
+
+    # Start every read-only scan now. They run in the background while the
+    # user reviews the earlier stages, so the session takes about as long as
+    # the slowest scan instead of the sum of all of them.
+    # Each stage has its own time budget; one that runs out offers what it found so far.
+    scans = {
+        'unused': StageScan(iter_unused_apps(apps), budgets.get('unused'), 'unused'),
+        'leftovers': StageScan(iter_leftover_files(apps), budgets.get('leftovers'), 'leftovers'),
+        'large': StageScan(iter_large_files(), budgets.get('large'), 'large'),
+        'duplicates': StageScan(iter_duplicate_files(), budgets.get('duplicates'), 'duplicates'),
+        'junk': StageScan(iter_system_junk(), budgets.get('junk'), 'junk'),
+    }
+    usage_token = CancelToken(budgets.get('usage'))
+    usage_started = time.monotonic()
+
+    def walk_usage():
+        # When the walk ended and whether it was cut short travel with the tree
+        tree = build_usage_forest()
+        return tree, time.monotonic(), usage_token.cancelled
+
+    tree_pool = ThreadPoolExecutor(max_workers=1)
+    usage_tree = tree_pool.submit(with_cancel_token(usage_token, walk_usage))
+    tree_pool.shutdown(wait=False)
+    deleted_paths = []
+
+    def review(stage, title):
+        engine.report_progress()
+        deleted = list_and_delete(scans[stage], title)
+        # Later stages must not offer (or count) what is already gone
+        for scan in scans.values():
+            scan.invalidate(deleted)
+        deleted_paths.extend(deleted)
+        return deleted
     
     # 1. Unused Apps
-    unused = find_unused_apps(apps)
-    list_and_delete(unused, "Unused Applications (Verified via LastUsedDate)")
+    deleted_apps = review('unused', "Unused Applications (Verified via LastUsedDate)")
+    if deleted_apps:
+        # Data of the removed apps only counts as leftover once they are out of the index
+        apps = {k: v for k, v in apps.items() if v['path'] not in deleted_apps}
+        scans['leftovers'].stop()
+        scans['leftovers'] = StageScan(iter_leftover_files(apps), budgets.get('leftovers'), 'leftovers')
     
     # 2. Leftovers
-    leftovers = find_leftover_files(apps)
-    list_and_delete(leftovers, "Potential Leftover App Data in Library")
+    print("\n🔍 Scanning for leftover app data...")
+    review('leftovers', "Potential Leftover App Data in Library")
     
     # 3. Large Files
-    large = find_large_files()
-    list_and_delete(large, "Large Files")
+    print(f"\n🔍 Scanning for large files (> {format_size(LARGE_FILE_THRESHOLD_BYTES)})...")
+    review('large', "Large Files")
     
-    # 4. System Junk (Caches, Xcode, etc)
-    junk = find_system_junk()
-    list_and_delete(junk, "System Junk (Caches, Logs, Developer Data)")
+    # 4. Duplicates
+    print(f"\n🔍 Scanning for duplicate files (> {format_size(DUPLICATE_MIN_BYTES)})...")
+    review('duplicates', "Duplicate Files (the oldest copy is kept)")
     
-    # 5. Snapshots
-    suggest_snapshot_cleanup()
+    # 5. System Junk (Caches, Xcode, etc)
+    print("\n🔍 Scanning for System Junk (Caches, Logs, Developer Data)...")
+    review('junk', "System Junk (Caches, Logs, Developer Data)")
     
-    # 6. Deep Analysis
-    # analyze_library_bloat() # We replaced the old function with the logic inside main or called here
-    # Since I overwrote the function definition, just calling it is fine.
-    analyze_library_bloat()
+    # 6. Snapshots
+    try:
+        suggest_snapshot_cleanup()
+    except KeyboardInterrupt:
+        print("\n⏹️  Snapshot cleanup interrupted, moving on.")
+    
+    # 7. Deep Analysis
+    usage = wait_for_stage(usage_tree, usage_token)
+    tree, usage_end, usage_cancelled = usage or (None, time.monotonic(), True)
+    usage_status = "complete" if not usage_cancelled else (usage_token.reason or "failed")
+    if tree is not None:
+        if usage_cancelled:
+            print(f"\n⚠️  Deep scan {usage_token.reason}: folder sizes below are partial.")
+        remove_usage_paths(tree, deleted_paths)
+        try:
+            analyze_library_bloat(tree)
+        except KeyboardInterrupt:
+            print("\n⏹️  Deep scan interrupted.")
+
+    rows = [(stage, scan.budget, scan.elapsed, scan.status, scan.found) for stage, scan in scans.items()]
+    if usage_tree.done() and usage_tree.exception():
+        usage_status = f"failed: {usage_tree.exception()}"
+    rows.append(('usage', budgets.get('usage'), usage_end - usage_started, usage_status, None))
+    print_stage_summary(rows)
     
+    engine.wait()
+    if engine.bytes_freed:
+        print(f"✅ Freed {format_size(engine.bytes_freed)} in {engine.purged} items.")
     print("\nDone. Consider empty Trash manually.")
 
 if __name__ == "__main__":
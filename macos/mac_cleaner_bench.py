@@ -0,0 +1,615 @@
+#!/usr/bin/env python3
+"""
+Benchmarks mac_cleaner.py stages on a synthetic home and system volume.
+
+Works off a Mac: the fixture is a fake home plus a fake "/" (mac_cleaner's
+SYSTEM_ROOT), and mdls/mdfind/tmutil/du are stub executables answering from
+the fixture through mac_cleaner.FakeBackend.
+
+    mac_cleaner_bench.py run --scales 1 2 4 --output results.json
+    mac_cleaner_bench.py generate /tmp/fixture --scale 4
+    mac_cleaner_bench.py measure /tmp/fixture
+
+Single parts of the cleaner are measured on their own by:
+
+    mac_cleaner_bench.py matcher --folders 5000 --apps 1000
+    mac_cleaner_bench.py dedup --mb 256
+    mac_cleaner_bench.py estimate --scale 1 --cold
+"""
+
+import os
+import sys
+import io
+import json
+import time
+import random
+import hashlib
+import shutil
+import argparse
+import platform
+import plistlib
+import subprocess
+import tempfile
+import contextlib
+from pathlib import Path
+
+MACOS_DIR = Path(__file__).resolve().parent
+STUB_COMMANDS = ["mdls", "mdfind", "tmutil", "du"]
+DAY = 24 * 60 * 60
+
+STUB_TEMPLATE = """#!{python}
+# Stub {name} for mac_cleaner_bench.py, answering from the fixture manifest
+import json, os, sys
+sys.path.insert(0, {macos_dir!r})
+from mac_cleaner import FakeBackend
+
+with open({manifest!r}, encoding="utf-8") as fp:
+    manifest = json.load(fp)
+backend = FakeBackend(last_used=manifest["last_used"], snapshots=manifest["snapshots"],
+                      spotlight_roots=manifest["spotlight_roots"])
+returncode, stdout = backend.run([{name!r}] + sys.argv[1:], timeout=None)
+sys.stdout.write(stdout)
+sys.exit(returncode)
+"""
+
+class FixtureBuilder:
+    """Writes one fixture; counts what it creates."""
+    def __init__(self, root, rng):
+        self.root = Path(root)
+        self.home = self.root / "home"
+        self.system = self.root / "system"
+        self.rng = rng
+        self.files = 0
+        self.bytes = 0
+        self.last_used = {}
+
+    def write(self, path, size):
+        """A file with size real bytes."""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "wb") as fp:
+            fp.write(b"\0" * size)
+        self.files += 1
+        self.bytes += size
+
+    def sparse(self, path, size):
+        """A file of size bytes that takes no space, like a large download or a cloud placeholder."""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "wb") as fp:
+            fp.truncate(size)
+        self.files += 1
+
+    def small_files(self, directory, count, low=1024, high=64 * 1024):
+        for i in range(count):
+            self.write(directory / f"file{i:04d}.dat", self.rng.randint(low, high))
+
+    def app(self, apps_dir, name, bundle_id, last_used_days=None):
+        """An .app bundle with an Info.plist; last_used_days=None means never used."""
+        app = apps_dir / f"{name}.app"
+        contents = app / "Contents"
+        contents.mkdir(parents=True, exist_ok=True)
+        with open(contents / "Info.plist", "wb") as fp:
+            plistlib.dump({"CFBundleIdentifier": bundle_id, "CFBundleName": name}, fp)
+        self.files += 1
+        self.write(contents / "MacOS" / name, 64 * 1024)
+        self.small_files(contents / "Resources", 10, 512, 8 * 1024)
+        if last_used_days is not None:
+            when = time.gmtime(time.time() - last_used_days * DAY)
+            self.last_used[str(app)] = time.strftime("%Y-%m-%d %H:%M:%S +0000", when)
+        return app
+
+def generate_fixture(root, scale=1, seed=0):
+    """
+    Builds a fake home and system volume under root, sized by scale.
+    Returns the manifest, which is also saved as root/manifest.json.
+    """
+    b = FixtureBuilder(root, random.Random(seed))
+    home, system, rng = b.home, b.system, b.rng
+    library = home / "Library"
+
+    # Applications: a third recently used, a third unused for years, a third never
+    installed = []
+    for i in range(30 * scale):
+        name = f"Vendor{i % 7} App{i:04d}"
+        bundle_id = f"com.vendor{i % 7}.app{i:04d}"
+        b.app(system / "Applications", name, bundle_id, [3, 700, None][i % 3])
+        installed.append((name, bundle_id))
+    for i in range(3 * scale):
+        b.app(home / "Applications", f"Tool{i:03d}", f"org.tools.tool{i:03d}", 10)
+    for name in ["Safari", "Mail", "Notes", "Photos", "Music"]:
+        b.app(system / "System/Applications", name, f"com.apple.{name.lower()}", 1)
+
+    # Application Support and Caches: half belongs to installed apps, half is left over
+    for base, count in [("Application Support", 200 * scale), ("Caches", 300 * scale)]:
+        for i in range(count):
+            if i % 10 == 0:
+                name = f"com.apple.service{i}"
+            elif i % 2:
+                app_name, bundle_id = installed[i % len(installed)]
+                name = bundle_id if (i // 2) % 2 else app_name
+            else:
+                name = f"Orphan Vendor {i:05d}"
+            b.small_files(library / base / name, rng.randint(1, 6))
+        for i in range(2 * scale):
+            b.write(library / base / f"Orphan Big {i:03d}" / "blob.bin", 12 * 1024 * 1024)
+    b.write(library / "Caches/com.example.huge/cache.db", 110 * 1024 * 1024)  # Over the 100 MB junk threshold
+
+    # Containers: thousands of small files
+    for i in range(150 * scale):
+        b.small_files(library / "Containers" / f"com.vendor{i % 7}.container{i:04d}/Data/Library/Caches", 10, 512, 4096)
+    for i in range(400 * scale):
+        b.write(library / "Preferences" / f"com.vendor{i % 7}.prefs{i:04d}.plist", 2048)
+    b.small_files(library / "Logs/SomeApp", 50 * scale, 1024, 16 * 1024)
+
+    # Developer and package manager caches
+    for project in range(5 * scale):
+        b.small_files(library / f"Developer/Xcode/DerivedData/Project{project}-abc/Build/Intermediates.noindex", 50, 4096, 32 * 1024)
+    for cache in ["Library/Caches/pnpm/v3/files", ".npm/_cacache/content-v2/sha512", ".gradle/caches/modules-2/files-2.1"]:
+        for bucket in range(16 * scale):
+            b.small_files(home / cache / f"{bucket:02x}", 20, 1024, 16 * 1024)
+
+    # Large files: real-looking downloads, and cloud placeholders that must be skipped
+    for i in range(2 * scale):
+        b.sparse(home / "Movies" / f"Recording {i:03d}.mov", 600 * 1024 * 1024)
+        b.sparse(library / "CloudStorage/Box-Box/Videos" / f"Shared {i:03d}.mov", 800 * 1024 * 1024)
+        b.sparse(library / "Mobile Documents/com~apple~CloudDocs" / f"Backup {i:03d}.zip", 700 * 1024 * 1024)
+
+    # The system side
+    for i in range(50 * scale):
+        b.small_files(system / "Library/Application Support" / f"Orphan System {i:04d}", 2)
+        b.small_files(system / "Library/Caches" / f"com.vendor{i % 7}.daemon{i:04d}", 2)
+    b.small_files(system / "Library/Logs/DiagnosticReports", 20 * scale)
+    b.small_files(system / "Users/Shared/Installers", 20 * scale, 64 * 1024, 256 * 1024)
+
+    # Stubs: one script per command, answering from the manifest
+    bin_dir = b.root / "bin"
+    bin_dir.mkdir(parents=True, exist_ok=True)
+    manifest = {
+        "scale": scale,
+        "seed": seed,
+        "home": str(home),
+        "system_root": str(system),
+        "bin": str(bin_dir),
+        "files": b.files,
+        "bytes": b.bytes,
+        "last_used": b.last_used,
+        "snapshots": [f"com.apple.TimeMachine.2024-01-{d:02d}-120000.local" for d in range(1, 4)],
+        "spotlight_roots": [str(home)],
+    }
+    manifest_path = b.root / "manifest.json"
+    with open(manifest_path, "w", encoding="utf-8") as fp:
+        json.dump(manifest, fp, indent=1)
+    for name in STUB_COMMANDS:
+        stub = bin_dir / name
+        stub.write_text(STUB_TEMPLATE.format(python=sys.executable, name=name,
+                                             macos_dir=str(MACOS_DIR), manifest=str(manifest_path)))
+        stub.chmod(0o755)
+    return manifest
+
+def measure(fixture, backend="stubs"):
+    """
+    Runs the cleaner's stages non-interactively against a fixture.
+    mac_cleaner reads its roots at import time, so this must run in a fresh
+    process (see run_benchmarks). backend is "stubs" (stub executables on
+    PATH) or "fake" (the same emulation in-process, no subprocesses).
+    """
+    with open(Path(fixture) / "manifest.json", encoding="utf-8") as fp:
+        manifest = json.load(fp)
+    os.environ["HOME"] = manifest["home"]
+    os.environ["MAC_CLEANER_ROOT"] = manifest["system_root"]
+    os.environ["PATH"] = manifest["bin"] + os.pathsep + os.environ.get("PATH", "")
+    sys.path.insert(0, str(MACOS_DIR))
+    import mac_cleaner
+
+    if backend == "fake":
+        mac_cleaner.set_command_backend(mac_cleaner.FakeBackend(
+            last_used=manifest["last_used"], snapshots=manifest["snapshots"],
+            spotlight_roots=manifest["spotlight_roots"]))
+    mac_cleaner.ask = lambda prompt: "n"  # Decline the deep scan's browser
+    executor = mac_cleaner.get_executor()
+
+    steps = []
+    def step(name, fn):
+        counts_before = dict(executor.counts)
+        failures_before = len(executor.failures)
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = fn()
+        elapsed = time.perf_counter() - start
+        steps.append({
+            "name": name,
+            "seconds": round(elapsed, 4),
+            "found": len(result) if result is not None else None,
+            "subprocesses": {p: n - counts_before.get(p, 0) for p, n in executor.counts.items()
+                             if n != counts_before.get(p, 0)},
+            "failed_commands": len(executor.failures) - failures_before,
+        })
+        return result
+
+    apps = step("get_installed_apps_info", mac_cleaner.get_installed_apps_info)
+    step("find_unused_apps", lambda: mac_cleaner.find_unused_apps(apps))
+    step("find_leftover_files", lambda: mac_cleaner.find_leftover_files(apps))
+    step("find_large_files", mac_cleaner.find_large_files)
+    step("find_system_junk", mac_cleaner.find_system_junk)
+    step("analyze_library_bloat", mac_cleaner.analyze_library_bloat)
+    return {
+        "scale": manifest["scale"],
+        "backend": backend,
+        "fixture": {"files": manifest["files"], "bytes": manifest["bytes"]},
+        "total_seconds": round(sum(s["seconds"] for s in steps), 4),
+        "steps": steps,
+    }
+
+def run_benchmarks(scales, backends, workdir=None, keep=False):
+    """
+    Generates a fixture per scale and measures each backend on it in a fresh process.
+    Without keep, cleans up only what it made: its own temporary directory, or
+    the scale-N fixtures it generated inside a given workdir.
+    """
+    own_workdir = workdir is None
+    workdir = Path(workdir or tempfile.mkdtemp(prefix="mac_cleaner_bench-"))
+    generated = []
+    runs = []
+    try:
+        for scale in scales:
+            fixture = workdir / f"scale-{scale}"
+            if not (fixture / "manifest.json").exists():
+                print(f"Generating scale {scale} fixture in {fixture}...", file=sys.stderr)
+                generated.append(fixture)
+                generate_fixture(fixture, scale)
+            for backend in backends:
+                print(f"Measuring scale {scale} with {backend}...", file=sys.stderr)
+                out = subprocess.run([sys.executable, __file__, "measure", str(fixture), "--backend", backend],
+                                     stdout=subprocess.PIPE, text=True, check=True).stdout
+                runs.append(json.loads(out))
+    finally:
+        if not keep:
+            for path in [workdir] if own_workdir else generated:
+                shutil.rmtree(path, ignore_errors=True)
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "runs": runs,
+    }
+
+def random_word(rng, low=3, high=9):
+    return "".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(low, high)))
+
+def bench_matcher(folders=5000, apps=1000, seed=0, repeat=3):
+    """
+    Times InstalledNameMatcher against the loop it replaced (every folder name
+    against every installed name, both ways) on made-up Library folder names.
+    A quarter of the folders belong to an app, a quarter are part of an app's
+    name, the rest are unrelated. Both must agree on every folder.
+    """
+    sys.path.insert(0, str(MACOS_DIR))
+    import mac_cleaner
+
+    rng = random.Random(seed)
+    app_names = [f"{random_word(rng)} {random_word(rng)}" for _ in range(apps)]
+    installed_names = {n for name in app_names for n in (name, name.replace(" ", ""))}
+    names = []
+    for i in range(folders):
+        app = rng.choice(app_names)
+        if i % 4 == 0:
+            names.append(f"{app} helper")
+        elif i % 4 == 1:
+            names.append(app.split(" ")[rng.randint(0, 1)])
+        else:
+            names.append(f"com.{random_word(rng)}.{random_word(rng)}")
+
+    def naive(name_lower):
+        return name_lower in installed_names or any(
+            name_lower in app_name or app_name in name_lower for app_name in installed_names)
+
+    def best_of(fn):
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = fn()
+            times.append(time.perf_counter() - start)
+        return min(times), result
+
+    build_seconds, matcher = best_of(lambda: mac_cleaner.InstalledNameMatcher(installed_names))
+    match_seconds, matched = best_of(lambda: [matcher.matches(n) for n in names])
+    naive_seconds, expected = best_of(lambda: [naive(n) for n in names])
+    return {
+        "folders": folders,
+        "installed_names": len(installed_names),
+        "matched": sum(matched),
+        "agrees": matched == expected,
+        "build_seconds": round(build_seconds, 4),
+        "match_seconds": round(match_seconds, 4),
+        "naive_seconds": round(naive_seconds, 4),
+    }
+
+def print_matcher(result):
+    print(f"{result['folders']} folders x {result['installed_names']} installed names, "
+          f"{result['matched']} matched, {'same as' if result['agrees'] else 'DIFFERENT FROM'} the loop")
+    print(f"  matcher: {result['build_seconds'] * 1000:8.1f} ms build + {result['match_seconds'] * 1000:.1f} ms match")
+    print(f"  loop:    {result['naive_seconds'] * 1000:8.1f} ms")
+
+def write_copies(paths, size, rng, change_at=None):
+    """Writes size random bytes to every path; with change_at, each copy differs in that byte."""
+    chunk = 8 * 1024 * 1024
+    files = [open(path, "wb") for path in paths]
+    try:
+        for offset in range(0, size, chunk):
+            data = bytearray(rng.randbytes(min(chunk, size - offset)))
+            for i, fp in enumerate(files):
+                if change_at is not None and offset <= change_at < offset + len(data):
+                    data[change_at - offset] = i
+                fp.write(data)
+    finally:
+        for fp in files:
+            fp.close()
+
+def generate_dedup_set(root, mb=256, seed=0):
+    """
+    The duplicate stage's test set under root, sized by mb (the size of the big
+    files): 4 identical files, 4 same-size files that differ mid-file, 8 files of
+    unique sizes, and a file with a hard link plus one copy.
+    """
+    rng = random.Random(seed)
+    size = mb * 1024 * 1024
+    root = Path(root)
+    root.mkdir(parents=True, exist_ok=True)
+    write_copies([root / f"same-{i}.bin" for i in range(4)], size, rng)
+    write_copies([root / f"mid-{i}.bin" for i in range(4)], size + 4096, rng, change_at=(size + 4096) // 2)
+    for i in range(8):
+        write_copies([root / f"unique-{i}.bin"], size - (i + 1) * 4096, rng)
+    write_copies([root / "linked.bin", root / "linked-copy.bin"], size + 8192, rng)
+    os.link(root / "linked.bin", root / "linked-hardlink.bin")
+
+def bench_dedup(workdir=None, mb=256, keep=False):
+    """
+    Times the duplicate stage on generate_dedup_set against hashing every file
+    in full, and counts the bytes each reads. Reads come from the page cache
+    after the first pass, so the bytes are the number to compare across machines.
+    """
+    sys.path.insert(0, str(MACOS_DIR))
+    import mac_cleaner
+
+    own_workdir = workdir is None
+    root = Path(workdir or tempfile.mkdtemp(prefix="mac_cleaner_bench-dedup-")) / f"dedup-{mb}"
+    generated = not root.exists()
+    try:
+        if generated:
+            print(f"Generating the duplicate set in {root}...", file=sys.stderr)
+            generate_dedup_set(root, mb)
+        files = {}
+        for path in sorted(root.iterdir()):
+            st = path.stat()
+            files.setdefault((st.st_dev, st.st_ino), (path, st.st_size))
+
+        start = time.perf_counter()
+        read = 0
+        for path, size in files.values():
+            h = hashlib.blake2b()
+            with open(path, "rb", buffering=0) as fp:
+                while chunk := fp.read(mac_cleaner.DUPLICATE_CHUNK_BYTES):
+                    h.update(chunk)
+                    read += len(chunk)
+        full_seconds = time.perf_counter() - start
+
+        tracer = mac_cleaner.set_tracer(mac_cleaner.Tracer(os.devnull))
+        try:
+            start = time.perf_counter()
+            items = list(mac_cleaner.iter_duplicate_files([root], min_size=1))
+            staged_seconds = time.perf_counter() - start
+        finally:
+            mac_cleaner.set_tracer(None)
+        hashed = tracer.totals("bytes hashed")
+    finally:
+        # Like run_benchmarks, only what this run made
+        if not keep and (own_workdir or generated):
+            shutil.rmtree(root.parent if own_workdir else root, ignore_errors=True)
+    return {
+        "mb": mb,
+        "files": len(files),
+        "bytes": sum(size for _, size in files.values()),
+        "duplicates": sorted(item["name"] for item in items),
+        "staged_seconds": round(staged_seconds, 3),
+        "staged_bytes_read": hashed.get("edges", 0) + hashed.get("full", 0),
+        "full_seconds": round(full_seconds, 3),
+        "full_bytes_read": read,
+    }
+
+def print_dedup(result):
+    mb = 1024 * 1024
+    print(f"{result['files']} files, {result['bytes'] // mb} MB; copies offered: {', '.join(result['duplicates'])}")
+    print(f"  staged:    {result['staged_seconds']:7.2f}s, {result['staged_bytes_read'] // mb} MB read")
+    print(f"  full hash: {result['full_seconds']:7.2f}s, {result['full_bytes_read'] // mb} MB read")
+
+ESTIMATE_TREES = [("deep", 5_000), ("deep", 15_000), ("deep", 40_000), ("deep", 81_000),
+                  ("cache", 32_000), ("cache", 80_000), ("cache", 154_000)]
+ESTIMATE_RATIOS = [0.25, 0.5, 0.8, 0.9, 1.1, 1.25, 2, 4]
+
+def generate_estimate_tree(root, kind, files, rng):
+    """
+    One tree for the --estimate benchmark, with Pareto-distributed file sizes.
+    "deep" trees grow new folders under recent ones, up to 16 levels, so they
+    are deep and uneven; "cache" trees are content-addressed: files named by a hash in
+    256 two-hex-digit buckets, like the npm or pnpm stores.
+    """
+    b = FixtureBuilder(root, rng)
+    dirs = [b.root]
+    depth = {b.root: 0}
+    for i in range(files):
+        size = min(int(4096 * rng.paretovariate(1.3)), 64 * 1024 * 1024)
+        if kind == "cache":
+            name = f"{rng.getrandbits(128):032x}"
+            b.write(b.root / name[:2] / name[2:], size)
+            continue
+        if rng.random() < 0.03:
+            parent = rng.choice([d for d in dirs[-10:] if depth[d] < 16] or dirs[:1])
+            dirs.append(parent / f"d{len(dirs):05d}")
+            depth[dirs[-1]] = depth[parent] + 1
+        b.write(rng.choice(dirs) / f"f{i:06d}.dat", size)
+    return b
+
+def drop_caches():
+    """Empties the page cache (needs root); False when that is not possible here."""
+    if sys.platform == "darwin":
+        return subprocess.run(["purge"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL).returncode == 0
+    os.sync()
+    try:
+        with open("/proc/sys/vm/drop_caches", "w") as fp:
+            fp.write("3\n")
+        return True
+    except OSError:
+        return False
+
+def bench_estimate(workdir=None, scale=1.0, seed=0, cold=False, keep=False):
+    """
+    Checks --estimate's measure_size against du on synthetic trees, at thresholds
+    set relative to each tree's true size (ESTIMATE_RATIOS). A check is decided
+    when the estimate puts the tree clearly above or below the threshold;
+    otherwise it waits for the du that runs next to the estimate. With cold, the
+    page cache is dropped before every timed walk.
+    """
+    sys.path.insert(0, str(MACOS_DIR))
+    import mac_cleaner
+    mac_cleaner.set_size_estimation(True)
+
+    own_workdir = workdir is None
+    root = Path(workdir or tempfile.mkdtemp(prefix="mac_cleaner_bench-estimate-")) / f"estimate-{scale:g}"
+    generated = not root.exists()
+    if cold and not drop_caches():
+        print("Cannot drop the page cache here (needs root); timing a warm cache", file=sys.stderr)
+        cold = False
+
+    def timed(fn):
+        if cold:
+            drop_caches()
+        start = time.perf_counter()
+        result = fn()
+        return time.perf_counter() - start, result
+
+    trees = []
+    checks = []
+    try:
+        rng = random.Random(seed)
+        for i, (kind, files) in enumerate(ESTIMATE_TREES):
+            tree = root / f"{kind}-{i}"
+            if generated:
+                print(f"Generating {tree}...", file=sys.stderr)
+                generate_estimate_tree(tree, kind, max(1, int(files * scale)), rng)
+            du_seconds, true_size = timed(lambda: mac_cleaner.get_directory_size(str(tree)))
+            trees.append({"name": tree.name, "files": sum(len(f) for _, _, f in os.walk(tree)),
+                          "bytes": true_size, "du_seconds": round(du_seconds, 4)})
+            for ratio in ESTIMATE_RATIOS:
+                threshold = true_size * ratio
+                random.seed(seed)  # measure_size samples with the module's generator
+                seconds, (size, low, high) = timed(lambda: mac_cleaner.measure_size(str(tree), threshold))
+                above, below = low > threshold, high is not None and high < threshold
+                checks.append({
+                    "tree": tree.name,
+                    "ratio": ratio,
+                    "decided": low != high,
+                    "wrong": (above and true_size <= threshold) or (below and true_size >= threshold),
+                    "stopped_early": high is None,
+                    "seconds": round(seconds, 4),
+                    "du_seconds": round(du_seconds, 4),
+                    # A walk that stopped early has only seen part of the tree; du is exact
+                    "rel_error": None if high is None or low == high else abs(size - true_size) / true_size,
+                })
+    finally:
+        # Like run_benchmarks, only what this run made
+        if not keep and (own_workdir or generated):
+            shutil.rmtree(root.parent if own_workdir else root, ignore_errors=True)
+    return {"scale": scale, "cold": cold, "trees": trees, "checks": checks}
+
+def print_estimate(result):
+    mb = 1024 * 1024
+    print(f"{len(result['trees'])} trees, {'cold' if result['cold'] else 'warm'} page cache")
+    for tree in result["trees"]:
+        print(f"  {tree['name']:<8} {tree['files']:>7} files {tree['bytes'] // mb:>6} MB  du {tree['du_seconds']:.3f}s")
+    print("\n  thr/true  decided  wrong  stopped early  time vs du  rel err")
+    for ratio in ESTIMATE_RATIOS:
+        checks = [c for c in result["checks"] if c["ratio"] == ratio]
+        decided = [c for c in checks if c["decided"]]
+        time_vs_du = sum(c["seconds"] for c in checks) / max(sum(c["du_seconds"] for c in checks), 1e-9)
+        finished = [c["rel_error"] for c in decided if c["rel_error"] is not None]
+        rel_error = f"{sum(finished) / len(finished):>7.1%}" if finished else "      -"
+        print(f"  {ratio:<8g}  {len(decided):>3}/{len(checks):<3} {sum(c['wrong'] for c in checks):>5} "
+              f"{sum(c['stopped_early'] for c in checks):>9}      {time_vs_du:>8.0%}  {rel_error}")
+
+def report(result, printer, as_json=False):
+    if as_json:
+        print(json.dumps(result, indent=1))
+    else:
+        printer(result)
+
+def print_table(results):
+    for run in results["runs"]:
+        print(f"\nscale {run['scale']} ({run['fixture']['files']} files), {run['backend']}: {run['total_seconds']:.2f}s")
+        for s in run["steps"]:
+            procs = ", ".join(f"{p} {n}" for p, n in sorted(s["subprocesses"].items())) or "-"
+            print(f"  {s['name']:<24} {s['seconds']:8.3f}s  found {s['found']!s:>5}  commands: {procs}")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="mac_cleaner_bench", description=__doc__.strip().split("\n")[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="Generate fixtures and benchmark every scale")
+    run.add_argument("--scales", type=int, nargs="+", default=[1, 2, 4])
+    run.add_argument("--backends", nargs="+", choices=["stubs", "fake"], default=["stubs", "fake"])
+    run.add_argument("--workdir", help="Where fixtures go (default: a temporary directory)")
+    run.add_argument("--keep", action="store_true", help="Keep the fixtures afterwards")
+    run.add_argument("--output", metavar="FILE", help="Write the results as JSON to FILE")
+
+    gen = sub.add_parser("generate", help="Build one fixture")
+    gen.add_argument("root")
+    gen.add_argument("--scale", type=int, default=1)
+    gen.add_argument("--seed", type=int, default=0)
+
+    meas = sub.add_parser("measure", help="Benchmark one fixture, print JSON")
+    meas.add_argument("root")
+    meas.add_argument("--backend", choices=["stubs", "fake"], default="stubs")
+
+    matcher = sub.add_parser("matcher", help="Time the leftover stage's installed-name matching")
+    matcher.add_argument("--folders", type=int, default=5000)
+    matcher.add_argument("--apps", type=int, default=1000)
+    matcher.add_argument("--seed", type=int, default=0)
+    matcher.add_argument("--json", action="store_true", help="Print the result as JSON")
+
+    dedup = sub.add_parser("dedup", help="Time the duplicate stage against hashing every file in full")
+    dedup.add_argument("--mb", type=int, default=256, help="Size of the big files in MB (default 256, 4.7 GB in all)")
+    dedup.add_argument("--workdir", help="Where the files go (default: a temporary directory)")
+    dedup.add_argument("--keep", action="store_true", help="Keep the files afterwards")
+    dedup.add_argument("--json", action="store_true", help="Print the result as JSON")
+
+    estimate = sub.add_parser("estimate", help="Check --estimate's size estimates against du")
+    estimate.add_argument("--scale", type=float, default=1.0,
+                          help="Fraction of the file counts to generate (default 1: 5k-154k files per tree)")
+    estimate.add_argument("--seed", type=int, default=0)
+    estimate.add_argument("--cold", action="store_true", help="Drop the page cache before every timed walk (needs root)")
+    estimate.add_argument("--workdir", help="Where the trees go (default: a temporary directory)")
+    estimate.add_argument("--keep", action="store_true", help="Keep the trees afterwards")
+    estimate.add_argument("--json", action="store_true", help="Print the result as JSON")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == "generate":
+        manifest = generate_fixture(args.root, args.scale, args.seed)
+        print(f"{manifest['files']} files, {manifest['bytes'] // (1024 * 1024)} MB in {args.root}")
+    elif args.command == "measure":
+        print(json.dumps(measure(args.root, args.backend), indent=1))
+    elif args.command == "matcher":
+        report(bench_matcher(args.folders, args.apps, args.seed), print_matcher, args.json)
+    elif args.command == "dedup":
+        report(bench_dedup(args.workdir, args.mb, args.keep), print_dedup, args.json)
+    elif args.command == "estimate":
+        report(bench_estimate(args.workdir, args.scale, args.seed, args.cold, args.keep), print_estimate, args.json)
+    else:
+        results = run_benchmarks(args.scales, args.backends, args.workdir, args.keep)
+        print_table(results)
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as fp:
+                json.dump(results, fp, indent=1)
+            print(f"\nResults written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""Tests for jdlint on temporary JD trees. Run with: python -m unittest discover macos"""
+
+from __future__ import annotations
+
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+import jdlint  # noqa: E402
+
+
+class TreeCase(unittest.TestCase):
+    """A temporary folder for each test."""
+
+    def setUp(self) -> None:
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = Path(tmp.name)
+
+    def make(self, *paths: str) -> None:
+        """Folders, or files for paths with a size after a colon ("a/b.txt:100")."""
+        for spec in paths:
+            (path, _, size) = spec.partition(":")
+            full = self.root / path
+            if size:
+                full.parent.mkdir(parents=True, exist_ok=True)
+                full.write_bytes(b"x" * int(size))
+            else:
+                full.mkdir(parents=True, exist_ok=True)
+
+
+class DirUsageTest(TreeCase):
+    def usage(self, path: Path, cache: dict[str, list] | None = None) -> tuple[jdlint.Usage, dict[str, list]]:
+        new_cache: dict[str, list] = {}
+        usage = jdlint._dir_usage(str(path), path.stat().st_mtime_ns, [], None, cache or {}, new_cache)
+        return (usage, new_cache)
+
+    def test_counts_every_file_below(self) -> None:
+        self.make("id/a.txt:10", "id/sub/b.txt:10", "id/sub/deeper/c.txt:10", "id/empty")
+        (usage, new_cache) = self.usage(self.root / "id")
+        self.assertEqual(usage.files, 3)
+        self.assertEqual(len(new_cache), 4)
+
+    def test_entry_vanishing_mid_listing(self) -> None:
+        self.make("id/a.txt:10", "id/gone.txt:10", "id/z.txt:10", "id/sub/b.txt:10")
+        scandir = os.scandir
+
+        class Vanished:
+            def __init__(self, entry: os.DirEntry) -> None:
+                self.name, self.path = (entry.name, entry.path)
+
+            def stat(self, follow_symlinks: bool = True) -> os.stat_result:
+                raise FileNotFoundError(self.path)
+
+            def is_dir(self, follow_symlinks: bool = True) -> bool:
+                return False
+
+        class Listing:
+            def __init__(self, path: str) -> None:
+                self.it = scandir(path)
+
+            def __enter__(self) -> Listing:
+                return self
+
+            def __exit__(self, *exc: object) -> None:
+                self.it.close()
+
+            def __iter__(self):
+                return (Vanished(e) if e.name == "gone.txt" else e for e in self.it)
+
+        with mock.patch.object(jdlint.os, "scandir", Listing):
+            (usage, new_cache) = self.usage(self.root / "id")
+        # The rest of the folder still counts, and its cache entry is complete
+        self.assertEqual(usage.files, 3)
+        self.assertEqual(new_cache[str(self.root / "id")][2], 2)
+        self.assertEqual(new_cache[str(self.root / "id")][5], ["sub"])
+
+    def test_unlistable_folder_is_not_cached(self) -> None:
+        self.make("id/a.txt:10", "id/locked/b.txt:10")
+        scandir = os.scandir
+        locked = str(self.root / "id/locked")
+
+        def listing(path: str):
+            if path == locked:
+                raise PermissionError(path)
+            return scandir(path)
+
+        with mock.patch.object(jdlint.os, "scandir", listing):
+            (usage, new_cache) = self.usage(self.root / "id")
+        self.assertEqual(usage.files, 1)
+        self.assertNotIn(locked, new_cache)
+        (usage, _) = self.usage(self.root / "id", new_cache)
+        self.assertEqual(usage.files, 2)
+
+    def test_deeper_than_the_recursion_limit(self) -> None:
+        deep = self.root / "id" / os.path.join(*["d"] * 300)
+        deep.mkdir(parents=True)
+        (deep / "bottom.txt").write_bytes(b"x")
+        # Paths can't be long enough to nest past the default limit, so lower it
+        self.addCleanup(sys.setrecursionlimit, sys.getrecursionlimit())
+        sys.setrecursionlimit(200)
+        (usage, _) = self.usage(self.root / "id")
+        self.assertEqual(usage.files, 1)
+
+
+class FixTest(TreeCase):
+    def setUp(self) -> None:
+        super().setUp()
+        journals = tempfile.TemporaryDirectory()
+        self.addCleanup(journals.cleanup)
+        patcher = mock.patch.object(jdlint._batchrename(), "JOURNAL_DIR", Path(journals.name))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        redirect = contextlib.redirect_stdout(io.StringIO())
+        redirect.__enter__()
+        self.addCleanup(redirect.__exit__, None, None, None)
+
+    def plan(self) -> tuple[list[jdlint.Fix], dict[str, str]]:
+        """The fixes for the tree, and why each refused error's file can't be fixed, by path under root."""
+        results = jdlint.lint_dir(self.root)
+        fixes, unfixable = jdlint.plan_fixes(results, results.errors)
+        return (fixes, {str(Path(e.files[0].full_path).relative_to(self.root)): why for e, why in unfixable})
+
+    def summary(self, results: jdlint.LintResults) -> tuple[list[tuple[str, str]], dict[str, list[tuple[str, str]]]]:
+        """Errors and used numbers, independent of listing order."""
+        errors = sorted((e.type(), e.display()) for e in results.errors)
+        used = {
+            f"{kind}:{key}": sorted((name, f.full_path) for name, f in entries)
+            for kind, used in [("a", results.used_areas), ("c", results.used_categories), ("i", results.used_ids)]
+            for key, entries in used.items()
+        }
+        return (errors, used)
+
+    def test_refusals(self) -> None:
+        self.make(
+            "10-19 Projects/11 Alpha/11.02 Kept",
+            "10-19 Projects/11 Alpha/13.05 Orphan",
+            "10-19 Projects/11 Alpha/12.01 Dup",
+            "10-19 Projects/12 Beta/12.01 Real",
+            "10-19 Projects/11 Alpha/12.02 Taken",
+            "10-19 Projects/12 Beta/12.02 Taken:1",
+            "10-19 Projects/11 Alpha/12.03 Note",
+            "20-29 Other/21 Gamma/12.03 NOTE",
+            "10-19 Projects/11 Alpha/12.04 Fine",
+            "10-19 Projects/35 Stray",
+            "20-29 Other/12 Copy",
+        )
+        (fixes, unfixable) = self.plan()
+        self.assertEqual(
+            [(f.src, f.dst) for f in fixes],
+            [(self.root / "10-19 Projects/11 Alpha/12.04 Fine", self.root / "10-19 Projects/12 Beta/12.04 Fine")],
+        )
+        self.assertEqual(
+            unfixable,
+            {
+                "10-19 Projects/11 Alpha/13.05 Orphan": "there is no single category 13 to move it to",
+                "10-19 Projects/11 Alpha/12.01 Dup": "ID 12.01 is already used",
+                "10-19 Projects/11 Alpha/12.02 Taken": "12.02 Taken already exists there",
+                # Different names, but the same folder on a case-insensitive file system
+                "10-19 Projects/11 Alpha/12.03 Note": "another fix claims the same name or number as 12.03 Note",
+                "20-29 Other/21 Gamma/12.03 NOTE": "another fix claims the same name or number as 12.03 NOTE",
+                "10-19 Projects/35 Stray": f"there is no single area {jdlint._print_area('3')} to move it to",
+                "20-29 Other/12 Copy": "category 12 is already used",
+            },
+        )
+
+    def test_case_only_difference_is_a_collision(self) -> None:
+        self.make("10-19 Projects/11 Alpha/11.02 Draft", "10-19 Projects/11 Alpha/11.03 Old")
+        results = jdlint.lint_dir(self.root)
+        folders = {f.name: f for entries in results.used_ids.values() for _, f in entries}
+        errors = [
+            jdlint.Error(jdlint.IdDifferentFromJDex(id="11.02", jdex_name="11.02 Plans"), [folders["11.02 Draft"]]),
+            jdlint.Error(jdlint.IdDifferentFromJDex(id="11.03", jdex_name="11.02 PLANS"), [folders["11.03 Old"]]),
+        ]
+        (fixes, unfixable) = jdlint.plan_fixes(results, errors)
+        self.assertEqual(fixes, [])
+        self.assertEqual(
+            [why for _, why in unfixable],
+            [
+                "another fix claims the same name or number as 11.02 Plans",
+                "another fix claims the same name or number as 11.02 PLANS",
+            ],
+        )
+
+    def test_relint_matches_a_full_lint(self) -> None:
+        self.make(
+            "10-19 Projects/11 Alpha/11.01 Inbox/note.txt:1",
+            "10-19 Projects/11 Alpha/12.02 Misfiled/a.txt:1",
+            "10-19 Projects/12 Beta/12.01 Real",
+            "10-19 Projects/21 Stray/21.01 Inside",
+            "20-29 Other/22 Kept/22.01 Kept",
+            "30-39 Untouched/31 Cat/bad name",
+        )
+        results = jdlint.lint_dir(self.root)
+        fixes, unfixable = jdlint.plan_fixes(results, results.errors)
+        self.assertEqual((len(fixes), unfixable), (2, []))
+        self.assertEqual(jdlint.apply_fixes(fixes), fixes)
+        self.assertTrue((self.root / "10-19 Projects/12 Beta/12.02 Misfiled/a.txt").exists())
+        self.assertTrue((self.root / "20-29 Other/21 Stray/21.01 Inside").is_dir())
+
+        areas = {jdlint._area_of(self.root, p) for fix in fixes for p in (fix.src, fix.dst)}
+        self.assertEqual(areas, {"10-19 Projects", "20-29 Other"})
+        relinted = jdlint.relint_areas(self.root, results, areas)
+        self.assertEqual(self.summary(relinted), self.summary(jdlint.lint_dir(self.root)))
+        # The errors left are the ones no fix was for
+        self.assertEqual(sorted(e.type() for e in relinted.errors), ["INVALID_ID_NAME", "NONEMPTY_INBOX"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,446 @@
+"""Tests for mac_cleaner on a synthetic home. Run with: python -m unittest discover macos"""
+
+import io
+import json
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+# mac_cleaner reads its roots at import time, so the fake home comes first
+HOME = Path(tempfile.mkdtemp(prefix="mac_cleaner-test-"))
+os.environ["HOME"] = str(HOME)
+os.environ["MAC_CLEANER_ROOT"] = str(HOME / "system")
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+import mac_cleaner  # noqa: E402
+
+
+def tearDownModule():
+    shutil.rmtree(HOME, ignore_errors=True)
+
+
+def write(path: Path, size: int, fill: bytes = b"x") -> Path:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(fill * size)
+    return path
+
+
+class HomeCase(unittest.TestCase):
+    """A fresh fake home, with a Trash so staging lands on the home volume."""
+
+    def setUp(self):
+        for path in HOME.iterdir():
+            shutil.rmtree(path)
+        (HOME / ".Trash").mkdir()
+        self.journals = HOME / "purges"
+
+
+class DeletionEngineTest(HomeCase):
+    def stage_without_purging(self, engine: "mac_cleaner.DeletionEngine", *paths: Path):
+        """Stages paths the way a session does right before it crashes: journaled and renamed, never purged."""
+        engine._queue = lambda path, staged, size: None
+        return [engine.stage(str(path), mac_cleaner.get_directory_size(str(path))) for path in paths]
+
+    def journal_records(self, path: Path) -> list[dict]:
+        return [json.loads(line) for line in path.read_text().splitlines()]
+
+    def test_stage_then_purge(self):
+        folder = HOME / "Library/Caches/com.example.app"
+        write(folder / "a.bin", 40_000)
+        write(folder / "sub/b.bin", 20_000)
+        big = write(HOME / "Downloads/big.dmg", 100_000)
+        sizes = {str(p): mac_cleaner.get_directory_size(str(p)) for p in [folder, big]}
+
+        engine = mac_cleaner.DeletionEngine(self.journals)
+        staged = [engine.stage(path, size) for path, size in sizes.items()]
+        self.assertFalse(folder.exists() or big.exists())
+        for path in staged:
+            self.assertTrue(path.startswith(str(HOME / ".Trash/mac_cleaner" / engine.session)))
+        self.assertEqual([r["op"] for r in self.journal_records(engine.journal_path)][:2], ["staged", "staged"])
+
+        self.assertTrue(engine.wait())
+        self.assertEqual((engine.purged, engine.total), (2, 2))
+        self.assertEqual(engine.bytes_freed, sum(sizes.values()))
+        self.assertFalse(any(os.path.lexists(path) for path in staged))
+        self.assertFalse((HOME / ".Trash/mac_cleaner" / engine.session).exists())
+        self.assertFalse(engine.journal_path.exists())
+        self.assertEqual(engine.removed[str(big)], (sizes[str(big)], False))
+
+    def test_hard_linked_file_frees_nothing(self):
+        original = write(HOME / "Movies/clip.mov", 50_000)
+        os.link(original, HOME / "Movies/clip-link.mov")
+        engine = mac_cleaner.DeletionEngine(self.journals)
+        engine.stage(str(original), 50_000)
+        self.assertTrue(engine.wait())
+        self.assertEqual(engine.removed[str(original)], (0, False))
+        self.assertTrue((HOME / "Movies/clip-link.mov").exists())
+
+    def test_resume_after_crash(self):
+        folders = [write(HOME / f"Library/Caches/app{i}/cache.db", 30_000 * (i + 1)).parent for i in range(3)]
+        sizes = [mac_cleaner.get_directory_size(str(folder)) for folder in folders]
+        crashed = mac_cleaner.DeletionEngine(self.journals)
+        crashed.journal_path = self.journals / "crashed.jsonl"
+        staged = self.stage_without_purging(crashed, *folders)
+        shutil.rmtree(staged[0])
+        crashed._log({'op': 'purged', 'staged': staged[0]})
+        # A crash between the journal entry and the rename, then a torn last line
+        crashed._log({'op': 'staged', 'path': str(HOME / "never-moved"), 'staged': str(HOME / "gone"), 'size': 1})
+        with open(crashed.journal_path, "a") as fp:
+            fp.write('{"op": "purged", "sta')
+
+        engine = mac_cleaner.DeletionEngine(self.journals)
+        self.assertEqual(engine.resume(), 2)
+        self.assertFalse(crashed.journal_path.exists())
+        replayed = {r["staged"] for r in self.journal_records(engine.journal_path) if r["op"] == "staged"}
+        self.assertEqual(replayed, set(staged[1:]))
+        self.assertTrue(engine.wait())
+        self.assertEqual(engine.purged, 2)
+        self.assertEqual(engine.bytes_freed, sum(sizes[1:]))
+        self.assertFalse(any(os.path.lexists(path) for path in staged))
+        self.assertFalse(engine.journal_path.exists())
+
+    def test_resume_counts_only_what_a_failed_purge_left(self):
+        folder = HOME / "Library/Caches/com.example.big"
+        write(folder / "a.bin", 80_000)
+        write(folder / "b.bin", 40_000)
+        crashed = mac_cleaner.DeletionEngine(self.journals)
+        crashed.journal_path = self.journals / "crashed.jsonl"
+        (staged,) = self.stage_without_purging(crashed, folder)
+        # The first purge got through a.bin and failed on b.bin
+        os.remove(os.path.join(staged, "a.bin"))
+        left = mac_cleaner.get_directory_size(staged)
+        crashed._log({'op': 'failed', 'staged': staged, 'size': left})
+
+        engine = mac_cleaner.DeletionEngine(self.journals)
+        self.assertEqual(engine.resume(), 1)
+        self.assertTrue(engine.wait())
+        self.assertEqual(engine.bytes_freed, left)
+        self.assertFalse(os.path.lexists(staged))
+
+
+class DeletedFilesSkippedTest(HomeCase):
+    def test_walkers_skip_trash_and_staging(self):
+        size = 2 * 1024 * 1024
+        write(HOME / "Downloads/kept.iso", size)
+        write(HOME / ".Trash/old.iso", size)
+        write(HOME / ".Trash/mac_cleaner/20240101-000000-1/1-staged.iso", size)
+        write(HOME / "Volumes/External" / mac_cleaner.STAGING_DIR_NAME / "s/1-staged.iso", size)
+        large = mac_cleaner.iter_large_files_native(roots=[HOME], threshold=size - 1)
+        self.assertEqual([item["name"] for item in large], ["kept.iso"])
+        candidates = mac_cleaner.iter_duplicate_candidates(roots=[HOME], min_size=size)
+        self.assertEqual([os.path.basename(path) for path, _ in candidates], ["kept.iso"])
+
+
+class DuplicateFilesTest(HomeCase):
+    SIZE = 300_000  # Over the two 64 KB edges, so contents are compared in full
+
+    def content(self, seed: int = 0, change_at=None) -> bytes:
+        data = bytearray(random.Random(seed).randbytes(self.SIZE))
+        if change_at is not None:
+            data[change_at] ^= 0xFF
+        return bytes(data)
+
+    def duplicates(self) -> dict[str, str]:
+        """Offered copy -> the copy kept, by name."""
+        items = mac_cleaner.iter_duplicate_files(roots=[HOME], min_size=self.SIZE)
+        return {item['name']: os.path.basename(item['keep']) for item in items}
+
+    def test_hard_links_are_one_file(self):
+        original = write(HOME / "Movies/a.mov", 1, self.content())
+        os.link(original, HOME / "Movies/a-link.mov")
+        self.assertEqual(self.duplicates(), {})
+        write(HOME / "Downloads/a-copy.mov", 1, self.content())
+        (copy, keep) = self.duplicates().popitem()
+        # The linked file is kept: deleting it would free nothing
+        self.assertEqual(copy, "a-copy.mov")
+        self.assertIn(keep, {"a.mov", "a-link.mov"})
+
+    def test_same_size_files_that_differ(self):
+        write(HOME / "Downloads/a.bin", 1, self.content())
+        write(HOME / "Downloads/b.bin", 1, self.content())
+        write(HOME / "Downloads/middle.bin", 1, self.content(change_at=self.SIZE // 2))
+        write(HOME / "Downloads/tail.bin", 1, self.content(change_at=self.SIZE - 1))
+        write(HOME / "Downloads/other.bin", 1, self.content(seed=1))
+        self.assertEqual(self.duplicates(), {"b.bin": "a.bin"})
+
+    def test_more_files_than_may_stay_open(self):
+        chunk, max_open = 4096, 4
+        paths = [str(write(HOME / f"same/{i:02d}", 1, self.content())) for i in range(10)]
+        paths += [str(write(HOME / f"middle/{i}", 1, self.content(change_at=150_001))) for i in range(3)]
+        paths.append(str(write(HOME / "other/tail", 1, self.content(change_at=self.SIZE - 1))))
+        paths.append(str(write(HOME / "other/shorter", 1, self.content()[:-1])))
+
+        class Tracked(io.FileIO):
+            live = peak = 0
+
+            def __init__(self, path, mode="rb", buffering=0):
+                super().__init__(path, mode)
+                Tracked.live += 1
+                Tracked.peak = max(Tracked.peak, Tracked.live)
+
+            def close(self):
+                if not self.closed:
+                    Tracked.live -= 1
+                super().close()
+
+        with mock.patch.object(mac_cleaner, "open", Tracked, create=True):
+            groups = mac_cleaner._split_identical_files(paths, self.SIZE, chunk, max_open)
+        self.assertEqual(sorted(groups), [paths[10:13], paths[:10]])
+        # One file more than the cap is open while it is read and closed again
+        self.assertLessEqual(Tracked.peak, max_open + 1)
+        self.assertEqual(Tracked.live, 0)
+
+
+class StageScanTest(unittest.TestCase):
+    def test_found_counts_items_handled_since(self):
+        items = [{'path': f"/fake/item{i}", 'name': f"item{i}", 'size': i} for i in range(3)]
+        scan = mac_cleaner.StageScan(iter(items), name="test")
+        self.assertTrue(scan.done.wait(5))
+        scan.discard({"/fake/item0", "/fake/item1"})
+        scan.invalidate(["/fake/item2"])
+        self.assertEqual(scan.top(0)[1], 0)
+        self.assertEqual(scan.found, 3)
+        self.assertEqual(scan.status, "complete")
+
+    def test_items_deleted_by_another_stage_are_not_found(self):
+        started = threading.Event()
+
+        def items():
+            started.wait(5)
+            yield {'path': "/fake/kept", 'size': 1}
+            scan.invalidate(["/fake/gone"])
+            yield {'path': "/fake/gone/inside", 'size': 1}
+
+        scan = mac_cleaner.StageScan(items(), name="test")
+        started.set()
+        self.assertTrue(scan.done.wait(5))
+        self.assertEqual(scan.found, 1)
+
+
+class InstalledNameMatcherTest(unittest.TestCase):
+    def assert_like_naive(self, installed_names, names):
+        matcher = mac_cleaner.InstalledNameMatcher(installed_names)
+        for name in names:
+            naive = any(name in app or app in name for app in installed_names)
+            self.assertEqual(matcher.matches(name), naive, (name, installed_names))
+
+    def test_edge_cases(self):
+        installed = {"zoom.us", "slack", "slack helper", "code", "visual studio code", "xcode", "aab", "aba"}
+        self.assert_like_naive(installed, [
+            "zoom", "zoom.us", "zoom.us.backup", "us.z", "slack", "slack helper (gpu)", "helper",
+            "code", "codex", "studio", "studio code", "xcode-select", "ab", "abab", "aabab", "b", "",
+            "slack\0zoom", "k\0z", "Slack", "ZOOM",
+        ])
+
+    def test_empty_installed_set(self):
+        self.assert_like_naive(set(), ["", "zoom", "a"])
+
+    def test_empty_app_name_is_in_everything(self):
+        self.assert_like_naive({""}, ["", "zoom"])
+
+    def test_random_names(self):
+        rng = random.Random(0)
+
+        def word(longest):
+            return "".join(rng.choice("aAb.") for _ in range(rng.randint(0, longest)))
+
+        for _ in range(200):
+            installed = {word(6) for _ in range(rng.randint(0, 5))}
+            self.assert_like_naive(installed, [word(8) for _ in range(20)])
+
+
+class LeftoverRulesTest(unittest.TestCase):
+    NAMES = [
+        "com.apple.Safari", "Safari", "safari", "Caches", "Node", "node", "Adobe", "Adobe Unity Plugin",
+        "Unity", "Microsoft Edge", "FooBar", "foo", "aa", "ab", "x\ny", "logs-2024", "", "Google.Chrome",
+    ]
+
+    def naive_skips(self, rules, installed_names, item):
+        """The rules one at a time, as the file describes them."""
+        for match, pattern, condition in rules:
+            kind, _, arg = condition.partition(":")
+            if kind == "app":
+                holds = any(k.strip() in n for n in installed_names for k in arg.lower().split(","))
+            elif kind == "path":
+                holds = os.path.exists(arg)
+            elif kind == "which":
+                holds = mac_cleaner.check_command_exists(arg)
+            else:
+                holds = True
+            lower = item.lower()
+            matched = {
+                "name": item == pattern,
+                "iname": lower == pattern.lower(),
+                "prefix": lower.startswith(pattern.lower()),
+                "contains": pattern.lower() in lower,
+                "regex": re.search(pattern, lower) is not None,
+            }[match]
+            if holds and matched:
+                return True
+        return False
+
+    def assert_like_naive(self, rules, installed_names):
+        compiled = mac_cleaner.LeftoverRules(rules, installed_names)
+        for item in self.NAMES:
+            self.assertEqual(compiled.skips(item), self.naive_skips(rules, installed_names, item), item)
+
+    def test_shipped_rules(self):
+        rules = mac_cleaner.load_leftover_rules()
+        for installed_names in [set(), {"unity hub"}, {"adobe photoshop", "google chrome"}]:
+            self.assert_like_naive(rules, installed_names)
+
+    def test_any_rule_keeps(self):
+        rules = [("contains", "adobe", "app:adobe"), ("contains", "unity", "app:unity")]
+        compiled = mac_cleaner.LeftoverRules(rules, {"unity hub"})
+        # The old if/elif chain stopped at "adobe" and dropped this folder
+        self.assertTrue(compiled.skips("Adobe Unity Plugin"))
+        self.assertFalse(compiled.skips("Adobe Reader"))
+        self.assertEqual(compiled.skips("Adobe Unity Plugin"),
+                         mac_cleaner.LeftoverRules(rules[::-1], {"unity hub"}).skips("Adobe Unity Plugin"))
+
+    def test_regexes_join_into_one_alternation(self):
+        patterns = ["(?i)^FOO", "(?s)^x.y$", "^(a)\\1$", "(?x) ^ l o g s", "^caches$"]
+        regexes = mac_cleaner.join_regexes(patterns)
+        # The group reference and the verbose flag can't join; the rest can
+        self.assertEqual(len(regexes), 3)
+        self.assertEqual(regexes[0].pattern, "(?i:^FOO)|(?s:^x.y$)|(?:^caches$)")
+        self.assert_like_naive([("regex", pattern, "always") for pattern in patterns], set())
+
+
+class SnapshotBackend(mac_cleaner.FakeBackend):
+    """Snapshots that a whole-volume delete leaves (busy), or that no delete removes (stuck)."""
+
+    def __init__(self, snapshots, busy=(), stuck=()):
+        super().__init__(snapshots=snapshots, snapshot_bytes=1024 * 1024)
+        self.busy, self.stuck = set(busy), set(stuck)
+        self.calls = []
+
+    def _fake_tmutil(self, args):
+        with self._lock:
+            self.calls.append(args)
+            if args[:1] == ["deletelocalsnapshots"]:
+                if args[1].startswith("/"):  # Whole volume
+                    kept = lambda s: s in self.busy or s in self.stuck
+                else:
+                    kept = lambda s: args[1] not in s or s in self.stuck
+                self.snapshots = [s for s in self.snapshots if kept(s)]
+                return 0, ""
+        return super()._fake_tmutil(args)
+
+    def _fake_df(self, args):
+        # A volume of its own: the real one's free space moves with whatever else writes to it
+        with self._lock:
+            free = 10 * 1024 ** 3 - len(self.snapshots) * self.snapshot_bytes
+        return 0, f"Filesystem 1024-blocks Used Available Capacity Mounted on\nfake 0 0 {free // 1024} 0% {args[-1]}\n"
+
+
+class SnapshotManagerTest(unittest.TestCase):
+    NAMES = [f"com.apple.TimeMachine.2024-01-0{day}-120000.local" for day in range(1, 6)]
+
+    def use(self, backend):
+        self.addCleanup(setattr, mac_cleaner, "_executor", mac_cleaner.get_executor())
+        mac_cleaner.set_command_backend(backend)
+        return mac_cleaner.SnapshotManager(str(HOME))
+
+    def test_list_is_fetched_once(self):
+        backend = SnapshotBackend(self.NAMES)
+        manager = self.use(backend)
+        self.assertEqual(manager.list(), self.NAMES)
+        backend.snapshots = self.NAMES[:2]
+        self.assertEqual(manager.list(), self.NAMES)
+        self.assertEqual(len(backend.calls), 1)
+        self.assertEqual(manager.list(refresh=True), self.NAMES[:2])
+        self.assertEqual(len(backend.calls), 2)
+
+    def test_survivors_of_the_volume_delete_go_by_date(self):
+        backend = SnapshotBackend(self.NAMES, busy=self.NAMES[1:3])
+        manager = self.use(backend)
+        manager.list()  # As the junk scan does first
+        deleted, remaining, reclaimed, _ = manager.delete_all()
+        self.assertEqual((deleted, remaining), (5, []))
+        deletes = [args[1] for args in backend.calls if args[0] == "deletelocalsnapshots"]
+        self.assertEqual(deletes[0], str(HOME))
+        self.assertEqual(sorted(deletes[1:]), ["2024-01-02-120000", "2024-01-03-120000"])
+        # Free space from df before and after: five snapshots of 1 MB
+        self.assertEqual(reclaimed, 5 * 1024 * 1024)
+
+    def test_snapshots_that_stay_are_reported(self):
+        backend = SnapshotBackend(self.NAMES, busy=self.NAMES[:1], stuck=self.NAMES[4:])
+        deleted, remaining, reclaimed, _ = self.use(backend).delete_all()
+        self.assertEqual((deleted, remaining), (4, self.NAMES[4:]))
+        self.assertEqual(reclaimed, 4 * 1024 * 1024)
+
+
+class EstimateTest(HomeCase):
+    def disk_usage(self, root: Path) -> int:
+        """What du counts: the blocks of every file and folder below root, root included."""
+        paths = [root] + [Path(d) / name for d, dirs, files in os.walk(root) for name in dirs + files]
+        return sum(os.lstat(path).st_blocks * 512 for path in paths)
+
+    def make_tree(self, folders: int, files: int) -> Path:
+        rng = random.Random(0)
+        root = HOME / "Library/Caches/tree"
+        for i in range(folders):
+            for j in range(files):
+                write(root / f"d{i}/f{j}", 4096 * rng.randint(1, 20))
+        return root
+
+    def test_small_folders_are_exact(self):
+        root = self.make_tree(3, mac_cleaner.ESTIMATE_FILE_SAMPLES)
+        size, low, high = mac_cleaner.estimate_directory_size(str(root))
+        self.assertEqual((size, low, high), (self.disk_usage(root),) * 3)
+
+    def test_confidence_interval(self):
+        root = self.make_tree(3, 150)
+        true = self.disk_usage(root)
+        runs = [mac_cleaner.estimate_directory_size(str(root), rng=random.Random(seed)) for seed in range(300)]
+        # The interval is ~99%: allow for the sample variance being an estimate too
+        covered = sum(low <= true <= high for _, low, high in runs)
+        self.assertGreaterEqual(covered / len(runs), 0.9)
+        # Unbiased, and the variance it reports is the one the estimates actually have
+        sizes = [size for size, _, _ in runs]
+        mean = sum(sizes) / len(sizes)
+        self.assertAlmostEqual(mean / true, 1, delta=0.01)
+        spread = sum((size - mean) ** 2 for size in sizes) / (len(sizes) - 1)
+        reported = sum(((high - low) / 2 / mac_cleaner.ESTIMATE_Z) ** 2 for _, low, high in runs) / len(runs)
+        self.assertAlmostEqual(reported / spread, 1, delta=0.3)
+
+    def test_stops_once_the_lower_bound_passes_the_threshold(self):
+        root = self.make_tree(20, 30)
+        true = self.disk_usage(root)
+        size, low, high = mac_cleaner.estimate_directory_size(str(root), threshold=true // 10)
+        self.assertIsNone(high)
+        self.assertTrue(true // 10 < low <= true)
+
+    def test_measure_size_races_du(self):
+        root = self.make_tree(3, 150)
+        true = self.disk_usage(root)
+        mac_cleaner.set_size_estimation(True)
+        self.addCleanup(mac_cleaner.set_size_estimation, False)
+        killed = threading.Event()
+
+        def slow_du(path):
+            while not mac_cleaner.current_cancel_token().cancelled:
+                time.sleep(0.01)
+            killed.set()
+            return 0
+
+        with mock.patch.object(mac_cleaner, "get_directory_size", slow_du):
+            size, low, high = mac_cleaner.measure_size(str(root), true // 2)
+        self.assertLess(true // 2, low)
+        self.assertTrue(killed.wait(5))
+
+        # Too close to call: du's exact size wins
+        with mock.patch.object(mac_cleaner, "get_directory_size", lambda path: 12345):
+            self.assertEqual(mac_cleaner.measure_size(str(root), true), (12345, 12345, 12345))
+
+
+if __name__ == "__main__":
+    unittest.main()
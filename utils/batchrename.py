@@ -1,38 +1,1314 @@
 import os
 import re
-from pathlib import Path
+import sys
+import time
+import json
+import glob
+import errno
+import bisect
+import shutil
+import string
+import hashlib
+import argparse
+import itertools
+import threading
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path, PurePath
+from typing import Callable, Optional
 
-PATTERN = re.compile(r"^(?P<prefix>\d{2}\.)\d{2}\s+(?P<label>.+)$")
+# The area/category grammar is jdlint's
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "macos"))
+import jdlint  # noqa: E402
 
-def renumber_subfolders(base: Path, start: int = 11, prefix: str = "15.", dry_run: bool = True):
+PATTERN = re.compile(r"^(?P<prefix>\d{2}\.)(?P<number>\d{2})\s+(?P<label>.+)$")
+MAX_NUMBER = 99  # IDs have two digits; minimal numbering stays below this when the folders fit
+RENAME_WORKERS = 4  # Categories renamed at once by the tree command
+RENAME_ATTEMPTS = 3  # Cloud mounts (Drive, Box) fail renames now and then
+RENAME_RETRY_SECONDS = 0.5  # Doubles after every failed attempt
+RETRY_ERRNOS = {errno.EAGAIN, errno.EBUSY, errno.EINTR, errno.EIO, errno.ETIMEDOUT}
+# Every batch of renames is journaled here first, for undo and recover
+JOURNAL_DIR = Path.home() / "Library/Application Support/batchrename/journals"
+# An ID line of a single-file JDex ("15.12 Foo  // comment"), as jdlint reads them
+JDEX_ID_LINE_RE = re.compile(r"^([ \t]*)([0-9][0-9]\.[0-9][0-9])(?= )", re.MULTILINE)
+# An ID mentioned in a note ("see 15.12", "[[15.12 Foo]]"), not part of a longer number like 115.12 or 15.12.3
+ID_REFERENCE_RE = re.compile(r"(?<![\w.])([0-9][0-9]\.[0-9][0-9])(?!\w|\.[0-9])")
+VAULT_SUFFIXES = (".md",)  # Notes whose ID references are rewritten
+VAULT_WORKERS = 8
+NAME_MAX_BYTES = 255  # APFS, HFS+ and most Linux file systems
+# A file extension as the rules see it; "15.12 Foo" has none
+EXTENSION_RE = re.compile(r"\.\w{1,10}$")
+
+
+class RenamePlanError(ValueError):
+    """A set of renames that can't be done safely. Raised before anything is renamed."""
+
+
+def name_key(path: Path) -> tuple[str, str]:
+    """Identity of a name as APFS/HFS+ see it: case- and normalization-insensitive."""
+    parent, name = os.path.split(path)
+    return parent, unicodedata.normalize("NFC", name).casefold()
+
+
+def temporary_path(path: Path, taken: set) -> Path:
+    """A free hidden name next to path for parking it while a cycle is broken."""
+    for n in itertools.count():
+        candidate = path.with_name(f".{path.name}.renaming-{n}")
+        if name_key(candidate) not in taken and not os.path.lexists(candidate):
+            taken.add(name_key(candidate))
+            return candidate
+
+
+def plan_renames(mapping: dict[Path, Path]) -> list[tuple[Path, Path]]:
+    """
+    Orders the renames in mapping (old path -> new path) so that none of them
+    lands on a name that is still in use.
+
+    Every name is the target of at most one rename, so the renames form chains
+    and cycles. A chain is done from its free end; a cycle is opened by parking
+    one folder under a temporary name. A chain of n renames takes n steps, a
+    cycle n + 1.
+
+    The whole plan is checked first: missing sources, two sources with the same
+    target, and targets taken by something that is not being renamed away all
+    raise RenamePlanError.
+    """
+    moves = {}
+    for src, dst in mapping.items():
+        if src == dst:
+            continue
+        key = name_key(src)
+        if key in moves:
+            raise RenamePlanError(f"'{src}' and '{moves[key][0]}' are the same name.")
+        if not os.path.lexists(src):
+            raise RenamePlanError(f"'{src}' does not exist.")
+        moves[key] = (src, dst)
+
+    targets = {}
+    for key, (src, dst) in moves.items():
+        dst_key = name_key(dst)
+        if dst_key in targets:
+            raise RenamePlanError(f"'{targets[dst_key]}' and '{src}' would both become '{dst.name}'.")
+        targets[dst_key] = src
+        if dst_key == key:
+            # Case-only change: fine unless a case-sensitive volume holds both spellings
+            if os.path.lexists(dst) and not os.path.samefile(src, dst):
+                raise RenamePlanError(f"'{dst}' already exists.")
+        elif dst_key not in moves and os.path.lexists(dst):
+            raise RenamePlanError(f"'{dst}' already exists.")
+
+    # following[k]: the rename that has to move out of the way before k can happen
+    following = {}
+    for key, (src, dst) in moves.items():
+        dst_key = name_key(dst)
+        if dst_key in moves and dst_key != key:
+            following[key] = dst_key
+    previous = {nxt: key for key, nxt in following.items()}
+
+    steps = []
+    done = set()
+    for key in moves:
+        if key in following:
+            continue
+        # Free end of a chain: walk back along it
+        while key is not None:
+            steps.append(moves[key])
+            done.add(key)
+            key = previous.get(key)
+
+    taken = set(moves) | set(targets)
+    for start in moves:
+        if start in done:
+            continue
+        # What is left are cycles
+        src, dst = moves[start]
+        parked = temporary_path(src, taken)
+        steps.append((src, parked))
+        key = previous[start]
+        while key != start:
+            steps.append(moves[key])
+            done.add(key)
+            key = previous[key]
+        steps.append((parked, dst))
+        done.add(start)
+    return steps
+
+
+def rename_with_retry(src: Path, dst: Path, attempts: int = RENAME_ATTEMPTS, delay: float = RENAME_RETRY_SECONDS):
+    """os.rename, retrying errors that a slow or busy cloud mount reports."""
+    for attempt in range(attempts):
+        try:
+            os.rename(src, dst)
+            return
+        except OSError as e:
+            # A timed-out rename on a network mount may still have happened
+            if not os.path.lexists(src) and os.path.lexists(dst):
+                return
+            if e.errno not in RETRY_ERRNOS or attempt == attempts - 1:
+                raise
+            time.sleep(delay * 2 ** attempt)
+
+
+def apply_renames(steps: list[tuple[Path, Path]], attempts: int = RENAME_ATTEMPTS,
+                  on_done: Optional[Callable[[int], None]] = None):
+    """
+    Runs a plan from plan_renames, refusing to replace anything that appeared since.
+    on_done(i) is called after step i.
+    """
+    for done, (src, dst) in enumerate(steps):
+        if os.path.lexists(dst) and name_key(src) != name_key(dst):
+            raise FileExistsError(f"'{dst}' appeared after planning; stopped after {done} of {len(steps)} renames.")
+        rename_with_retry(src, dst, attempts)
+        if on_done:
+            on_done(done)
+
+
+class RenameJournal:
+    """
+    Write-ahead log of one batch of renames, one JSON object per line: a "begin"
+    record with every step, synced before the first rename, a "done" record per
+    step right after it happened, and an "end" record once the batch is over.
+    A batch without "end" was interrupted; recover_batch() finishes or rolls it back.
+    A batch that renumbers IDs may also rewrite a single-file JDex after its
+    renames: "jdex-planned" holds the hash of the new index before it replaces
+    the old one, "jdex" says it did. References in a notes vault are rewritten
+    last, with a "rewrite" record (path and new hash) ahead of every changed
+    note and "vault" once all are done.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._file = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def create(cls, steps: list[tuple[Path, Path]], kind: str = "rename", undoes: Optional[str] = None,
+               directory: Optional[Path] = None, jdex: Optional[dict] = None,
+               vault: Optional[dict] = None) -> "RenameJournal":
+        directory = Path(directory or JOURNAL_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S") + f"-{os.getpid()}"
+        for n in itertools.count():
+            batch = stamp if n == 0 else f"{stamp}.{n}"
+            try:
+                # Claim the name: batches started within the same second get a suffix
+                open(directory / f"{batch}.jsonl", "x").close()
+                break
+            except FileExistsError:
+                continue
+        journal = cls(directory / f"{batch}.jsonl")
+        journal.write({
+            "op": "begin",
+            "batch": batch,
+            "time": time.time(),
+            "kind": kind,
+            "undoes": undoes,
+            "steps": [[os.path.abspath(src), os.path.abspath(dst)] for src, dst in steps],
+            "jdex": jdex,
+            "vault": vault,
+        }, sync=True)
+        return journal
+
+    def write(self, record: dict, sync: bool = False):
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, "a", encoding="utf-8")
+            self._file.write(json.dumps(record) + "\n")
+            self._file.flush()
+            if sync:
+                os.fsync(self._file.fileno())
+
+    def done(self, step: int):
+        # Synced, so that after a power loss at most the running step of each folder is unlogged
+        self.write({"op": "done", "step": step}, sync=True)
+
+    def end(self, outcome: str = "done"):
+        self.write({"op": "end", "outcome": outcome}, sync=True)
+        self.close()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                os.fsync(self._file.fileno())
+                self._file.close()
+                self._file = None
+
+
+def read_batch(path: Path) -> Optional[dict]:
+    """
+    Reads one journal into a dict with its begin record's fields plus "steps" as
+    paths, "done" (indices of the steps that happened), "ended", "path", the
+    JDex rewrite state ("jdex_sha256", "jdex_done") and the vault's ("rewrites":
+    path -> "rewrite" record, "vault_done"). None if the batch never started.
+    """
+    batch = None
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            # A line cut short by a crash is the last one and carries nothing we need
+            if not line.endswith("\n"):
+                break
+            record = json.loads(line)
+            if record["op"] == "begin":
+                batch = dict(record, steps=[(Path(src), Path(dst)) for src, dst in record["steps"]],
+                             done=set(), ended=False, path=path, jdex_sha256=None, jdex_done=False,
+                             rewrites={}, vault_done=False)
+                batch.setdefault("jdex", None)
+                batch.setdefault("vault", None)
+            elif batch is None:
+                break
+            elif record["op"] == "done":
+                batch["done"].add(record["step"])
+            elif record["op"] == "jdex-planned":
+                batch["jdex_sha256"] = record["sha256"]
+            elif record["op"] == "jdex":
+                batch["jdex_done"] = True
+            elif record["op"] == "rewrite":
+                batch["rewrites"][record["path"]] = record
+            elif record["op"] == "vault":
+                batch["vault_done"] = True
+            elif record["op"] == "end":
+                batch["ended"] = True
+    return batch
+
+
+def read_journals(directory: Optional[Path] = None) -> list[dict]:
+    """Every batch in the journal directory, oldest first."""
+    directory = Path(directory or JOURNAL_DIR)
+    if not directory.is_dir():
+        return []
+    batches = (read_batch(path) for path in directory.glob("*.jsonl"))
+    return sorted((batch for batch in batches if batch is not None), key=lambda batch: batch["time"])
+
+
+def replace_file(path: Path, text: str):
+    """Replaces path with text in one step: a synced temporary file renamed over it."""
+    temp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(temp, "w", encoding="utf-8", newline="") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    shutil.copymode(path, temp)
+    os.replace(temp, path)
+
+
+def text_sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def rewrite_jdex_ids(text: str, ids: dict[str, str]) -> str:
+    """Changes the IDs of a single-file JDex all at once, so shifted IDs never collide."""
+    return JDEX_ID_LINE_RE.sub(lambda m: m.group(1) + ids.get(m.group(2), m.group(2)), text)
+
+
+def update_jdex_file(journal: RenameJournal, jdex: dict):
+    """Rewrites the single-file JDex of a batch, journaled so that recover never applies it twice."""
+    path = Path(jdex["path"])
+    with open(path, encoding="utf-8", newline="") as f:
+        text = rewrite_jdex_ids(f.read(), jdex["ids"])
+    journal.write({"op": "jdex-planned", "sha256": text_sha256(text)}, sync=True)
+    replace_file(path, text)
+    journal.write({"op": "jdex"})
+
+
+def jdex_applied(batch: dict) -> bool:
+    """Whether the batch's JDex rewrite happened, even if the crash came before it was logged."""
+    if batch["jdex_done"]:
+        return True
+    if not batch["jdex"] or not batch["jdex_sha256"]:
+        return False
+    try:
+        with open(batch["jdex"]["path"], encoding="utf-8", newline="") as f:
+            return text_sha256(f.read()) == batch["jdex_sha256"]
+    except OSError:
+        return False
+
+
+def renumbered_ids(mapping: dict[Path, Path]) -> tuple[dict[str, str], list[str]]:
+    """
+    The ID changes in a set of folder renames ("15.12" -> "15.13"), and the IDs
+    left alone because several folders share them.
+    """
+    ids, shared = {}, set()
+    for old, new in mapping.items():
+        old_match = jdlint.generic_id_re.fullmatch(old.name)
+        new_match = jdlint.generic_id_re.fullmatch(new.name)
+        if not old_match or not new_match:
+            continue
+        old_id, new_id = f"{old_match.group(1)}.{old_match.group(2)}", f"{new_match.group(1)}.{new_match.group(2)}"
+        if old_id in ids:
+            shared.add(old_id)
+        ids[old_id] = new_id
+    for jid in shared:
+        del ids[jid]
+    return {old: new for old, new in ids.items() if old != new}, sorted(shared)
+
+
+def plan_jdex_notes(jdex: Path, ids: dict[str, str]) -> dict[Path, Path]:
+    """
+    Note renames that keep a nested (area/category/ID notes) or flat (all notes
+    in one folder) JDex in line with ids. Layouts are told apart like jdlint does.
+    """
+    folders = []
+    with os.scandir(jdex) as it:
+        for area in it:
+            if area.is_dir() and jdlint.valid_area_re.fullmatch(area.name):
+                folders.extend(entry.path for entry in os.scandir(area.path)
+                               if entry.is_dir() and jdlint.generic_category_re.fullmatch(entry.name))
+    if not folders:
+        folders = [jdex]
+    mapping = {}
+    for folder in folders:
+        with os.scandir(folder) as it:
+            for note in it:
+                match = jdlint.jdex_note_generic_id_re.fullmatch(note.name)
+                new_id = match and ids.get(f"{match.group(1)}.{match.group(2)}")
+                if new_id:
+                    path = Path(note.path)
+                    mapping[path] = path.with_name(new_id + note.name[5:])
+    return mapping
+
+
+def plan_jdex_update(jdex: Path, ids: dict[str, str]) -> tuple[list[tuple[Path, Path]], Optional[dict]]:
+    """
+    What it takes to give the JDex at jdex the new IDs: note renames for a note
+    layout, or a rewrite of a single-file JDex (returned as the batch's jdex
+    record). Prints what will change.
+    """
+    if jdex.is_file():
+        with open(jdex, encoding="utf-8", newline="") as f:
+            lines = sum(1 for m in JDEX_ID_LINE_RE.finditer(f.read()) if m.group(2) in ids)
+        print(f"JDex: {lines} lines of {jdex} will get new IDs.")
+        return [], {"path": str(jdex), "ids": ids} if lines else None
+    notes = plan_jdex_notes(jdex, ids)
+    print_renames(notes)
+    return plan_renames(notes), None
+
+
+def iter_vault_notes(vault: Path, skip: Optional[str] = None):
+    """The notes in a vault, skipping hidden folders (.obsidian, .git, .trash) and skip."""
+    stack = [str(vault)]
+    while stack:
+        with os.scandir(stack.pop()) as it:
+            for entry in it:
+                if entry.name.startswith("."):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.name.endswith(VAULT_SUFFIXES) and entry.path != skip:
+                    yield Path(entry.path)
+
+
+def rewrite_references(text: str, ids: dict[str, str], at: Optional[set[int]] = None) -> tuple[str, list[int]]:
+    """
+    Replaces every reference to an old ID in text (or only those at the
+    offsets in at), all IDs in one pass. IDs all have the same shape, so one
+    pattern finds every candidate and a dict lookup decides, whatever the
+    number of IDs. Returns the new text and the offsets of the replaced IDs,
+    which are the same before and after since IDs keep their length.
+    """
+    offsets = []
+
+    def replace(m):
+        new = ids.get(m.group(1))
+        if new is None or (at is not None and m.start() not in at):
+            return m.group(1)
+        offsets.append(m.start())
+        return new
+
+    text = ID_REFERENCE_RE.sub(replace, text)
+    return text, offsets
+
+
+def read_note(path: Path) -> Optional[str]:
+    try:
+        with open(path, encoding="utf-8", newline="") as f:
+            return f.read()
+    except UnicodeDecodeError:
+        return None  # Not text, nothing to rewrite
+    except FileNotFoundError:
+        return None  # Deleted or moved since, e.g. by a sync client
+
+
+def vault_notes(vault: dict) -> list[Path]:
+    if vault.get("at") is not None:
+        return [Path(path) for path in vault["at"]]
+    return list(iter_vault_notes(Path(vault["path"]), vault.get("skip")))
+
+
+def count_vault_references(vault: dict, jobs: int = VAULT_WORKERS) -> tuple[int, int]:
+    """(notes, references) that update_vault would change."""
+    def count(path):
+        text = read_note(path)
+        return len(rewrite_references(text, vault["ids"])[1]) if text else 0
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        counts = [n for n in pool.map(count, vault_notes(vault)) if n]
+    return len(counts), sum(counts)
+
+
+def update_vault(journal: RenameJournal, vault: dict, jobs: int = VAULT_WORKERS) -> tuple[int, int]:
+    """
+    Rewrites the ID references in a vault's notes, jobs notes at once. Notes
+    without references are only read; changed ones are replaced atomically,
+    each after a "rewrite" record with its new hash and the offsets changed.
+    vault["at"] (path -> offsets) limits the rewrite to those references, as
+    an undo does. vault["applied"] (path -> rewrite record) lists notes a
+    crashed run may already have rewritten; they are skipped if they still
+    have that hash.
+    Returns the number of notes and references changed.
+    """
+    applied = vault.get("applied", {})
+    at = vault.get("at")
+
+    def rewrite(path):
+        text = read_note(path)
+        if not text or applied.get(str(path), {}).get("sha256") == text_sha256(text):
+            return 0
+        text, offsets = rewrite_references(text, vault["ids"], set(at[str(path)]) if at else None)
+        if offsets:
+            journal.write({"op": "rewrite", "path": str(path), "sha256": text_sha256(text), "at": offsets})
+            replace_file(path, text)
+        return len(offsets)
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        counts = [n for n in pool.map(rewrite, vault_notes(vault)) if n]
+    journal.write({"op": "vault"})
+    return len(counts), sum(counts)
+
+
+def plan_reference_updates(mapping: dict[Path, Path], jdex: Optional[Path] = None, vault: Optional[Path] = None,
+                           jobs: int = VAULT_WORKERS) -> tuple[list[tuple[Path, Path]], Optional[dict], Optional[dict]]:
+    """
+    What has to change besides the folders in mapping: the JDex (note renames
+    and/or a single-file rewrite, see plan_jdex_update) and the ID references
+    in a notes vault (the batch's vault record). Prints what will change.
+    """
+    ids, shared = renumbered_ids(mapping)
+    for jid in shared:
+        print(f"{jid} is used by several folders; the JDex and notes keep it as is.")
+    note_steps, jdex_file, vault_plan = [], None, None
+    if ids and jdex:
+        note_steps, jdex_file = plan_jdex_update(jdex, ids)
+    if ids and vault:
+        vault_plan = {"path": str(vault), "ids": ids, "skip": str(jdex) if jdex and jdex.is_file() else None}
+        notes, references = count_vault_references(vault_plan, jobs)
+        print(f"Vault: {references} references in {notes} notes will get new IDs.")
+    return note_steps, jdex_file, vault_plan
+
+
+def execute_batch(steps: list[tuple[Path, Path]], kind: str = "rename", undoes: Optional[str] = None,
+                  jobs: int = 1, journal: Optional[RenameJournal] = None,
+                  pending: Optional[list[int]] = None, jdex: Optional[dict] = None,
+                  vault: Optional[dict] = None) -> list[tuple[Path, OSError]]:
+    """
+    Runs steps as one journaled batch. Steps are grouped by folder: each folder's
+    steps run in order, up to jobs folders at once. Steps that depend on each
+    other across folders (see ordered_steps) all run in order, one at a time.
+    pending limits the run to some step indices of an existing journal.
+    jdex ({"path": ..., "ids": {old: new}}) is a single-file JDex rewritten once
+    every rename is done, vault ({"path": ..., "ids": ...}) a notes folder whose
+    ID references are rewritten after that.
+    Returns (folder, error) for every folder that stopped early; the batch is
+    then left open for recover_batch().
+    """
+    if journal is None:
+        # "applied" is recovery state, not part of the plan
+        planned_vault = {k: v for k, v in vault.items() if k != "applied"} if vault else None
+        journal = RenameJournal.create(steps, kind, undoes, jdex=jdex, vault=planned_vault)
+    # Ordered steps are one group, reported under the folder they all are in
+    top = Path(os.path.commonpath([src for src, _ in steps])) if steps and ordered_steps(steps) else None
+    groups = {}
+    for i in (range(len(steps)) if pending is None else pending):
+        groups.setdefault(top or steps[i][0].parent, []).append(i)
+
+    def run(indices):
+        apply_renames([steps[i] for i in indices], on_done=lambda j: journal.done(indices[j]))
+
+    failures = []
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        futures = [(folder, pool.submit(run, indices)) for folder, indices in groups.items()]
+        for folder, future in futures:
+            try:
+                future.result()
+            except OSError as e:
+                failures.append((folder, e))
+    if jdex and not failures:
+        try:
+            update_jdex_file(journal, jdex)
+        except OSError as e:
+            failures.append((Path(jdex["path"]), e))
+    if vault and not failures:
+        try:
+            notes, references = update_vault(journal, vault)
+            print(f"Vault: {references} references in {notes} notes updated.")
+        except OSError as e:
+            failures.append((Path(vault["path"]), e))
+    if failures:
+        journal.close()
+    else:
+        journal.end()
+    return failures
+
+
+def ordered_steps(steps: list[tuple[Path, Path]]) -> bool:
+    """
+    Whether steps must all run in order: some move between folders, or rename
+    something inside a folder another step renames (as jdlint --fix does).
+    Their undo is then ordered too.
+    """
+    renamed = {path for step in steps for path in step}
+    return any(src.parent != dst.parent or not renamed.isdisjoint(src.parents) for src, dst in steps)
+
+
+def net_renames(steps: list[tuple[Path, Path]]) -> dict[Path, Path]:
+    """What a sequence of steps amounts to (old path -> new path), without temporary names."""
+    origin = {}
+    for src, dst in steps:
+        origin[dst] = origin.pop(src, src)
+    return {old: new for new, old in origin.items() if old != new}
+
+
+def check_steps(steps: list[tuple[Path, Path]]) -> list[str]:
+    """Problems that would stop steps partway: sources that are gone and targets in the way."""
+    problems = []
+    appeared, vanished = set(), set()
+    for src, dst in steps:
+        src_key, dst_key = name_key(src), name_key(dst)
+        if src_key not in appeared and (src_key in vanished or not os.path.lexists(src)):
+            problems.append(f"'{src}' is missing.")
+        if src_key != dst_key and dst_key not in vanished and (dst_key in appeared or os.path.lexists(dst)):
+            problems.append(f"'{dst}' is in the way.")
+        appeared.discard(src_key)
+        vanished.add(src_key)
+        vanished.discard(dst_key)
+        appeared.add(dst_key)
+    return problems
+
+
+def settle_batch(batch: dict) -> set[int]:
+    """
+    Adds to batch["done"] the steps that happened but were not logged. "done"
+    records are synced, so normally that is only the step each folder was
+    running when the batch stopped, but a journal from a crashed or older
+    system may have lost more. Each folder's steps (or the whole batch's, if
+    they run in order) happen one after the other, so the steps that happened
+    are the first k unlogged ones, for the smallest k whose names match the
+    disk: sources gone and targets there as of step k, and step k + 1 not begun.
+    """
+    done = batch["done"]
+    steps = batch["steps"]
+    ordered = ordered_steps(steps)
+    groups = {}
+    for i, (src, _) in enumerate(steps):
+        if i not in done:
+            groups.setdefault(None if ordered else src.parent, []).append(i)
+    for pending in groups.values():
+        names = {}  # name_key -> (path, whether it exists after the steps so far)
+        for k in range(len(pending) + 1):
+            if k:
+                src, dst = steps[pending[k - 1]]
+                names[name_key(src)] = (src, False)
+                names[name_key(dst)] = (dst, True)
+            if not all(os.path.lexists(path) == exists for path, exists in names.values()):
+                continue
+            if k < len(pending):
+                src, dst = steps[pending[k]]
+                if not os.path.lexists(src) or (name_key(src) != name_key(dst) and os.path.lexists(dst)):
+                    continue
+            done.update(pending[:k])
+            break
+    return done
+
+
+def undo_steps(batch: dict) -> list[tuple[Path, Path]]:
+    """The steps of batch that happened, reversed: replaying them restores the names."""
+    return [(dst, src) for i, (src, dst) in reversed(list(enumerate(batch["steps"]))) if i in batch["done"]]
+
+
+def print_renames(mapping: dict[Path, Path], root: Optional[Path] = None):
+    """Prints renames as a diff, grouped by folder."""
+    folders = {}
+    for old, new in mapping.items():
+        folders.setdefault(old.parent, []).append((old, new))
+    for folder, renames in folders.items():
+        print(f"--- {folder.relative_to(root) if root and folder.is_relative_to(root) else folder}")
+        for old, new in renames:
+            print(f"-{old.name}")
+            print(f"+{new.name}")
+
+
+def print_failures(failures: list[tuple[Path, OSError]]):
+    print("Some folders were not fully renamed (run recover to finish or roll back):")
+    print("\n".join(f"  {folder}: {e}" for folder, e in failures))
+
+
+def describe_batch(batch: dict) -> str:
+    state = "done" if batch["ended"] else f"interrupted after {len(batch['done'])}"
+    what = f"undo of {batch['undoes']}" if batch["undoes"] else batch["kind"]
+    return f"{batch['batch']}  {time.strftime('%Y-%m-%d %H:%M', time.localtime(batch['time']))}  " \
+           f"{what}, {len(batch['steps'])} steps, {state}"
+
+
+def inverse_jdex(batch: dict) -> Optional[dict]:
+    """The JDex rewrite that reverses the batch's, if it had one and it happened."""
+    if not jdex_applied(batch):
+        return None
+    return {"path": batch["jdex"]["path"], "ids": {new: old for old, new in batch["jdex"]["ids"].items()}}
+
+
+def moved_path(path: Path, renames: dict[Path, Path]) -> Path:
+    """Where path ends up after renames, which may move it or one of its parents."""
+    for parent in [path, *path.parents]:
+        if parent in renames:
+            return renames[parent] / path.relative_to(parent)
+    return path
+
+
+def inverse_vault(batch: dict, steps: list[tuple[Path, Path]]) -> Optional[dict]:
+    """
+    The vault rewrite that reverses the batch's: the old IDs back at the
+    offsets it changed. The offsets matter: a note that mentioned 15.13 before
+    15.14 became 15.13 would otherwise get 15.14 back too. Notes edited since
+    keep the new IDs. The rewrite runs after steps, the renames that undo the
+    batch, so notes that steps rename (JDex notes inside the vault) are
+    rewritten under their restored names.
+    """
+    renames = net_renames(steps)
+    at, edited = {}, 0
+    for path, record in batch["rewrites"].items():
+        text = read_note(Path(path))
+        if text is not None and text_sha256(text) == record["sha256"]:
+            at[str(moved_path(Path(path), renames))] = record["at"]
+        else:
+            edited += 1
+    if edited:
+        print(f"Vault: {edited} notes were changed since and keep the new IDs.")
+    if not at:
+        return None
+    return {"path": batch["vault"]["path"], "ids": {new: old for old, new in batch["vault"]["ids"].items()},
+            "at": at}
+
+
+def undo_batch(batch_id: Optional[str] = None, dry_run: bool = True, jobs: int = RENAME_WORKERS,
+               directory: Optional[Path] = None) -> bool:
+    """
+    Reverses one finished batch as a new batch: the given one, or else the
+    latest batch that is neither an undo nor undone. The current names are
+    checked against the journal first, so nothing renamed since is overwritten.
+    """
+    batches = read_journals(directory)
+    undone = {batch["undoes"] for batch in batches if batch["undoes"]}
+    if batch_id:
+        matches = [batch for batch in batches if batch["batch"] == batch_id]
+    else:
+        matches = [batch for batch in batches if not batch["undoes"] and batch["batch"] not in undone][-1:]
+    if not matches:
+        print(f"No batch {batch_id} to undo." if batch_id else "Nothing to undo.")
+        for batch in batches[-10:]:
+            print(f"  {describe_batch(batch)}")
+        return False
+    batch = matches[0]
+    if not batch["ended"]:
+        print(f"Batch {batch['batch']} was interrupted; run recover first.")
+        return False
+    if batch["batch"] in undone:
+        print(f"Batch {batch['batch']} was already undone.")
+        return False
+
+    steps = undo_steps(batch)
+    problems = check_steps(steps)
+    if problems:
+        print(f"Can't undo {batch['batch']}, the folders changed since:")
+        print("\n".join(f"  {problem}" for problem in problems))
+        return False
+    jdex = inverse_jdex(batch)
+    vault = inverse_vault(batch, steps)
+    print_renames(net_renames(steps))
+    if jdex:
+        print(f"JDex: IDs in {jdex['path']} go back too.")
+    if vault:
+        print(f"Vault: references in {len(vault['at'])} notes go back too.")
+    print(f"Undo {describe_batch(batch)}")
+    if dry_run:
+        print("Dry run, nothing renamed. Run again with --apply to undo.")
+        return True
+    failures = execute_batch(steps, "undo", batch["batch"], jobs, jdex=jdex, vault=vault)
+    if failures:
+        print_failures(failures)
+        return False
+    return True
+
+
+def recover_batch(batch: dict, rollback: bool = False, dry_run: bool = True, jobs: int = RENAME_WORKERS) -> bool:
+    """
+    Finishes an interrupted batch, or with rollback reverses the steps it got
+    through. Either way the folders end up as one consistent set of names.
+    """
+    logged = set(batch["done"])
+    done = settle_batch(batch)
+    steps = batch["steps"]
+    if rollback:
+        todo = undo_steps(batch)
+        jdex = inverse_jdex(batch)
+        vault = inverse_vault(batch, todo)
+    else:
+        jdex = None if jdex_applied(batch) else batch["jdex"]
+        vault = None if batch["vault_done"] or not batch["vault"] else dict(batch["vault"], applied=batch["rewrites"])
+        pending = [i for i in range(len(steps)) if i not in done]
+        todo = [steps[i] for i in pending]
+    problems = check_steps(todo)
+    print(f"{'Roll back' if rollback else 'Finish'} {describe_batch(batch)}")
+    print_renames(net_renames(todo))
+    if jdex:
+        print(f"JDex: IDs in {jdex['path']} are updated.")
+    if vault:
+        print(f"Vault: references in {vault['path']} are updated.")
+    if problems:
+        print("Can't, the folders changed since:")
+        print("\n".join(f"  {problem}" for problem in problems))
+        return False
+    if dry_run:
+        return True
+
+    # Rewrites cut short leave their temporary files behind
+    for path in [*batch["rewrites"], *([batch["jdex"]["path"]] if batch["jdex"] else [])]:
+        for temp in Path(path).parent.glob(f".{glob.escape(Path(path).name)}.*.tmp"):
+            temp.unlink()
+    journal = RenameJournal(batch["path"])
+    if rollback:
+        undo = RenameJournal.create(todo, "undo", batch["batch"], batch["path"].parent, jdex, vault)
+        # From here on the undo batch is the one to recover
+        journal.end("rolled back")
+        failures = execute_batch(todo, journal=undo, jobs=jobs, jdex=jdex, vault=vault)
+    else:
+        for i in done - logged:
+            journal.done(i)
+        if jdex_applied(batch) and not batch["jdex_done"]:
+            journal.write({"op": "jdex"})
+        failures = execute_batch(steps, journal=journal, pending=pending, jobs=jobs, jdex=jdex, vault=vault)
+    if failures:
+        print_failures(failures)
+        return False
+    return True
+
+
+def recover_batches(rollback: bool = False, dry_run: bool = True, jobs: int = RENAME_WORKERS,
+                    directory: Optional[Path] = None) -> bool:
+    """Runs recover_batch() on every interrupted batch, newest first."""
+    interrupted = [batch for batch in read_journals(directory) if not batch["ended"]]
+    if not interrupted:
+        print("No interrupted batches.")
+        return True
+    ok = True
+    for batch in reversed(interrupted):
+        ok = recover_batch(batch, rollback, dry_run, jobs) and ok
+    if dry_run:
+        print("Dry run, nothing renamed. Run again with --apply.")
+    return ok
+
+
+def split_folder_name(name: str, prefix: str) -> tuple[Optional[int], str]:
+    """Returns the folder's current number (None unless it already has prefix) and its label."""
+    # Match "12.xx Something"
+    m = PATTERN.match(name)
+    if m:
+        number = int(m.group("number")) if m.group("prefix") == prefix else None
+        return number, m.group("label")
+    parts = name.split(" ", 1)
+    return None, parts[1] if len(parts) > 1 else ""
+
+
+def sequential_numbers(count: int, start: int) -> list[int]:
+    return list(range(start, start + count))
+
+
+def minimal_numbers(current: list[Optional[int]], start: int, gaps: bool = False) -> list[int]:
+    """
+    New numbers for folders in their target order, chosen so that as many folders
+    as possible keep the number they already have.
+
+    Folder i can keep number c only if there is room for the folders before and
+    after it, so with d = c - i the kept folders need non-decreasing d between
+    start and the last usable number minus the folders after it.
+    gaps=True keeps the longest such run (a longest non-decreasing subsequence,
+    O(n log n)) and numbers the others right after the kept folder before them,
+    which leaves gaps. gaps=False keeps the numbering consecutive: all kept
+    folders share one d, the one most folders already have, and numbering
+    starts there rather than at start. Either way start is the lowest number
+    used, not necessarily the first: [11, 13, 14, 15] becomes [12, 13, 14, 15],
+    leaving 11 free, because numbering from 11 would rename three folders.
+    """
+    count = len(current)
+    last = max(MAX_NUMBER, start + count - 1)
+    candidates = [(i, c - i) for i, c in enumerate(current)
+                  if c is not None and start <= c - i <= last - (count - 1)]
+
+    if not gaps:
+        shifts = {}
+        for _, d in candidates:
+            shifts[d] = shifts.get(d, 0) + 1
+        first = min(shifts, key=lambda d: (-shifts[d], d)) if shifts else start
+        return sequential_numbers(count, first)
+
+    # Patience sorting: tails[k] is the smallest d ending a run of length k + 1
+    tails, tail_index, back = [], [], {}
+    for i, d in candidates:
+        k = bisect.bisect_right(tails, d)
+        back[i] = tail_index[k - 1] if k else None
+        if k == len(tails):
+            tails.append(d)
+            tail_index.append(i)
+        else:
+            tails[k] = d
+            tail_index[k] = i
+    kept = set()
+    i = tail_index[-1] if tail_index else None
+    while i is not None:
+        kept.add(i)
+        i = back[i]
+
+    numbers = []
+    previous = start - 1
+    for i, c in enumerate(current):
+        previous = c if i in kept else previous + 1
+        numbers.append(previous)
+    return numbers
+
+
+def plan_renumbering(base: Path, start: int = 11, prefix: str = "15.", minimal: bool = False,
+                      gaps: bool = False, skip_reserved: bool = False,
+                      ids_only: bool = False) -> tuple[dict[Path, Path], int, list[Path]]:
+    """
+    Works out the new names of the subfolders of base, numbered in name order.
+    Returns the renames (old path -> new path), how many renames the plain
+    sequential numbering would take, and the subfolders left out. skip_reserved
+    leaves folders that already have prefix and a number below start (e.g. the
+    15.01 inbox) alone. ids_only leaves out every folder that isn't an ID of
+    this category ("Archive", or a misfiled 16.03 that jdlint --fix would move).
+    """
     if not base.exists() or not base.is_dir():
         raise ValueError(f"Error: '{base}' is not a directory.")
 
-    # Only immediate subfolders, sorted by name
-    entries = sorted([p for p in base.iterdir() if p.is_dir()], key=lambda p: p.name)
+    # Only immediate subfolders, sorted by name; hidden ones include our own parked folders
+    entries = [base / name for name in sorted(list_subfolders(base))]
+    skipped = []
+    if ids_only:
+        is_id = [(m := jdlint.generic_id_re.fullmatch(folder.name)) is not None and m.group(1) + "." == prefix
+                 for folder in entries]
+        skipped = [folder for folder, ok in zip(entries, is_id) if not ok]
+        entries = [folder for folder, ok in zip(entries, is_id) if ok]
+    parsed = [split_folder_name(folder.name, prefix) for folder in entries]
+    if skip_reserved:
+        kept = [i for i, (number, _) in enumerate(parsed) if number is None or number >= start]
+        entries = [entries[i] for i in kept]
+        parsed = [parsed[i] for i in kept]
 
-    for offset, folder in enumerate(entries, start=start):
-        name = folder.name
+    def new_names(numbers):
+        return [f"{prefix}{number:02d}" + (f" {label}" if label else "")
+                for number, (_, label) in zip(numbers, parsed)]
+
+    names = new_names(sequential_numbers(len(entries), start))
+    sequential_renames = sum(1 for folder, name in zip(entries, names) if folder.name != name)
+    if minimal:
+        names = new_names(minimal_numbers([number for number, _ in parsed], start, gaps))
+
+    mapping = {folder: folder.with_name(name) for folder, name in zip(entries, names) if folder.name != name}
+    return mapping, sequential_renames, skipped
+
+
+def renumber_subfolders(base: Path, start: int = 11, prefix: str = "15.", dry_run: bool = True,
+                        minimal: bool = False, gaps: bool = False, jdex: Optional[Path] = None,
+                        vault: Optional[Path] = None):
+    """
+    Numbers the subfolders of base prefix+start, prefix+start+1, ... in name order.
+    minimal=True chooses the numbering that renames the fewest folders instead
+    (see minimal_numbers), which matters on synced drives where every rename is
+    a sync operation, and reports how many renames that saved.
+    With jdex and vault, the JDex and the references in the notes under vault
+    get the new IDs in the same batch (see plan_reference_updates).
+    """
+    mapping, sequential_renames, _ = plan_renumbering(base, start, prefix, minimal, gaps)
+    for folder, new_path in mapping.items():
+        print(f"{folder.name}  ->  {new_path.name}")
+
+    if minimal:
+        print(f"{len(mapping)} renames instead of {sequential_renames} ({sequential_renames - len(mapping)} avoided)")
+
+    # Plan everything before touching anything: shifted numbers collide with
+    # folders that haven't been renamed yet
+    steps = plan_renames(mapping)
+    note_steps, jdex_file, vault_plan = plan_reference_updates(mapping, jdex, vault)
+    steps += note_steps
+    if not dry_run and (steps or jdex_file or vault_plan):
+        failures = execute_batch(steps, jdex=jdex_file, vault=vault_plan)
+        if failures:
+            raise failures[0][1]
+    return steps
+
+
+def list_subfolders(base: Path) -> list[str]:
+    """Names of the visible subfolders of base, typed from the directory listing instead of a stat per entry."""
+    with os.scandir(base) as it:
+        return [entry.name for entry in it if not entry.name.startswith(".") and entry.is_dir()]
 
-        # Match "12.xx Something"
-        m = PATTERN.match(name)
-        if m:
-            label = m.group("label")
-        else:
-            parts = name.split(" ", 1)
-            label = parts[1] if len(parts) > 1 else ""
 
-        new_name = f"{prefix}{offset:02d}" + (f" {label}" if label else "")
-        new_path = folder.with_name(new_name)
+def is_ignored(path: PurePath, ignored: list[str]) -> bool:
+    return any(path.match(pattern) for pattern in ignored)
 
-        if new_path == folder:
+
+def find_categories(root: Path, ignored: Optional[list[str]] = None) -> list[tuple[Path, str]]:
+    """(category folder, ID prefix) for every category under a JD root, e.g. (".../15 Proposals", "15.")."""
+    ignored = ignored or []
+    categories = []
+    for area_name in sorted(list_subfolders(root)):
+        area_match = jdlint.valid_area_re.fullmatch(area_name)
+        if not area_match or is_ignored(PurePath(area_name), ignored):
             continue
+        for category_name in sorted(list_subfolders(root / area_name)):
+            category_match = jdlint.generic_category_re.fullmatch(category_name)
+            # A category in the wrong area is jdlint's business, not ours
+            if (not category_match or category_match.group(1) != area_match.group(1)
+                    or is_ignored(PurePath(area_name, category_name), ignored)):
+                continue
+            categories.append((root / area_name / category_name, category_name[:2] + "."))
+    return categories
+
+
+def renumber_tree(root: Path, start: int = 11, dry_run: bool = True, minimal: bool = False, gaps: bool = False,
+                  ignored: Optional[list[str]] = None, jobs: int = RENAME_WORKERS, jdex: Optional[Path] = None,
+                  vault: Optional[Path] = None) -> bool:
+    """
+    Renumbers the IDs of every category under a JD root, each with its own prefix.
+    Reserved IDs below start (inboxes and other standard zeros) keep their numbers,
+    and folders that aren't IDs of their category are listed and left alone.
+
+    Categories are listed and planned in parallel, and every plan is checked
+    before anything is renamed; one bad category stops the whole run. The
+    renames of all categories are printed as one diff, then run as one
+    journaled batch: each category in order, jobs categories at once, retrying
+    errors from slow cloud mounts. With jdex, the JDex is updated in the same
+    batch: notes are renamed alongside the folders, a single-file JDex is
+    rewritten once all of them are done, and then references to the old IDs in
+    the notes under vault. Returns False if anything could not be planned or
+    renamed.
+    """
+    if not root.is_dir():
+        raise ValueError(f"Error: '{root}' is not a directory.")
+    categories = find_categories(root, ignored)
+
+    def plan(category):
+        folder, prefix = category
+        mapping, sequential_renames, skipped = plan_renumbering(folder, start, prefix, minimal, gaps,
+                                                                skip_reserved=True, ids_only=True)
+        return mapping, sequential_renames, plan_renames(mapping), skipped
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        futures = [(folder, pool.submit(plan, (folder, prefix))) for folder, prefix in categories]
+        plans, problems, skipped = [], [], []
+        for folder, future in futures:
+            try:
+                *category_plan, category_skipped = future.result()
+                plans.append((folder, *category_plan))
+                skipped += category_skipped
+            except (OSError, ValueError) as e:
+                problems.append(f"{folder.relative_to(root)}: {e}")
+    if problems:
+        print("Nothing was renamed, these categories can't be renumbered:")
+        print("\n".join(f"  {problem}" for problem in problems))
+        return False
+    if skipped:
+        # Renumbering would drop their names or give them an ID in the wrong category
+        print(f"Skipped {len(skipped)} folders that aren't IDs of their category (see jdlint):")
+        print("\n".join(f"  {folder.relative_to(root)}" for folder in skipped))
+
+    plans = [plan for plan in plans if plan[1]]
+    print_renames({old: new for _, mapping, _, _ in plans for old, new in mapping.items()}, root)
+    renames = sum(len(mapping) for _, mapping, _, _ in plans)
+    print(f"{renames} renames in {len(plans)} of {len(categories)} categories", end="")
+    if minimal:
+        sequential_renames = sum(count for _, _, count, _ in plans)
+        print(f" instead of {sequential_renames} ({sequential_renames - renames} avoided)", end="")
+    print()
+    steps = [step for _, _, _, steps in plans for step in steps]
+    jdex_file = vault_plan = None
+    if plans:
+        try:
+            note_steps, jdex_file, vault_plan = plan_reference_updates(
+                {old: new for _, mapping, _, _ in plans for old, new in mapping.items()}, jdex, vault)
+        except (OSError, ValueError) as e:
+            print(f"Nothing was renamed, the JDex or notes can't be updated: {e}")
+            return False
+        steps += note_steps
+    if dry_run or not plans:
+        if plans:
+            print("Dry run, nothing renamed. Run again with --apply to rename.")
+        return True
+
+    # One batch for the whole tree, so a single undo reverts it
+    failures = execute_batch(steps, jobs=jobs, jdex=jdex_file, vault=vault_plan)
+    if failures:
+        print_failures(failures)
+        return False
+    print("Done.")
+    return True
+
 
-        print(f"{folder.name}  ->  {new_name}")
-        if not dry_run:
-            folder.rename(new_path)
+class RenameRules:
+    """
+    A rename rule chain, compiled once and applied to every name in a folder:
+    regex rewrites (re.sub, so \\1 and \\g<name> work), a case change and a
+    Unicode normalization of the stem, then a template that builds the final
+    name from {name}, {stem}, {ext} and the sequence number {n} (format specs
+    allowed: "{n:03d} {name}"). Numbers follow sort ("name", "natural",
+    "mtime" or "size", optionally reversed), counting from start in steps of step.
+    """
+
+    CASES = {
+        "lower": str.lower,
+        "upper": str.upper,
+        # str.title() would give "Don'T"
+        "title": lambda text: re.sub(r"(?<![\w'\u2019])\w", lambda m: m.group().upper(), text.lower()),
+    }
+    SORT_KEYS = {
+        "name": lambda entry: unicodedata.normalize("NFC", entry.name).casefold(),
+        # Odd parts are the runs of digits the split captured ("²" is isdigit() but not one)
+        "natural": lambda entry: [(int(part), "") if i % 2 else (0, part) for i, part in
+                                  enumerate(re.split(r"(\d+)", unicodedata.normalize("NFC", entry.name).casefold()))],
+        "mtime": lambda entry: entry.stat(follow_symlinks=False).st_mtime,
+        "size": lambda entry: entry.stat(follow_symlinks=False).st_size,
+    }
+
+    def __init__(self, subs: Optional[list[tuple[str, str]]] = None, case: Optional[str] = None,
+                 normalize: Optional[str] = None, template: str = "{name}", sort: str = "name",
+                 reverse: bool = False, start: int = 1, step: int = 1, match: Optional[str] = None,
+                 kind: str = "all"):
+        try:
+            self.subs = [(re.compile(pattern), repl) for pattern, repl in subs or []]
+            self.match = re.compile(match) if match else None
+        except re.error as e:
+            raise ValueError(f"Error: bad pattern: {e}")
+        if case is not None and case not in self.CASES:
+            raise ValueError(f"Error: unknown case '{case}'.")
+        if normalize not in (None, "NFC", "NFD"):
+            raise ValueError(f"Error: unknown normalization '{normalize}'.")
+        if sort not in self.SORT_KEYS:
+            raise ValueError(f"Error: unknown sort key '{sort}'.")
+        if kind not in ("all", "files", "dirs"):
+            raise ValueError(f"Error: unknown kind '{kind}'.")
+        self.case = self.CASES.get(case)
+        self.normalize = normalize
+        self.template = template
+        self.sort_key = self.SORT_KEYS[sort]
+        self.reverse = reverse
+        self.start = start
+        self.step = step
+        self.kind = kind
+        try:
+            self.numbered = any(field == "n" for _, field, _, _ in string.Formatter().parse(template))
+            self.render("name.ext", False, start)
+        except (KeyError, IndexError, ValueError) as e:
+            raise ValueError(f"Error: bad template '{template}': {e!r}")
+
+    def selects(self, entry: os.DirEntry) -> bool:
+        """Whether the rules touch entry. Uses the type scandir already read, no stat."""
+        if entry.name.startswith("."):
+            return False
+        if self.kind != "all" and entry.is_dir(follow_symlinks=False) != (self.kind == "dirs"):
+            return False
+        return self.match is None or self.match.search(entry.name) is not None
+
+    def render(self, name: str, is_dir: bool, number: Optional[int] = None) -> str:
+        """The new name for name, the number-th entry."""
+        for pattern, repl in self.subs:
+            name = pattern.sub(repl, name)
+        m = None if is_dir else EXTENSION_RE.search(name)
+        ext = m.group() if m else ""
+        stem = name[:len(name) - len(ext)]
+        if self.case:
+            stem = self.case(stem)
+        if self.normalize:
+            stem, ext = unicodedata.normalize(self.normalize, stem), unicodedata.normalize(self.normalize, ext)
+        return self.template.format(name=stem + ext, stem=stem, ext=ext, n=number)
+
+
+def check_name(name: str, old_name: str):
+    """Raises RenamePlanError for a name no file can have, before anything is renamed."""
+    if not name or name in (".", "..") or "/" in name or "\0" in name:
+        raise RenamePlanError(f"'{old_name}' would become '{name}', which is not a valid name.")
+    if name.startswith(".") and not old_name.startswith("."):
+        raise RenamePlanError(f"'{old_name}' would become '{name}', which is hidden.")
+    if len(name.encode("utf-8")) > NAME_MAX_BYTES:
+        raise RenamePlanError(f"'{old_name}' would become a name longer than {NAME_MAX_BYTES} bytes.")
+
+
+def plan_rule_renames(base: Path, rules: RenameRules) -> dict[Path, Path]:
+    """
+    The renames (old path -> new path) the rules make in base, every new name
+    checked. The listing is streamed from os.scandir and only entries whose
+    name changes are kept, so memory follows the renames, not the folder. A
+    numbering template is the exception: its sort needs one key per entry.
+    """
+    if not base.is_dir():
+        raise ValueError(f"Error: '{base}' is not a directory.")
+    mapping = {}
+
+    def add(name, new_name):
+        if new_name != name:
+            check_name(new_name, name)
+            mapping[base / name] = base / new_name
+
+    with os.scandir(base) as it:
+        if not rules.numbered:
+            for entry in it:
+                if rules.selects(entry):
+                    add(entry.name, rules.render(entry.name, entry.is_dir(follow_symlinks=False)))
+            return mapping
+        keyed = [(rules.sort_key(entry), entry.name, entry.is_dir(follow_symlinks=False))
+                 for entry in it if rules.selects(entry)]
+    # Ties (same mtime or size) go by name, so the numbering doesn't depend on the listing order
+    keyed.sort(key=lambda item: (item[0], item[1]), reverse=rules.reverse)
+    for i, (_, name, is_dir) in enumerate(keyed):
+        add(name, rules.render(name, is_dir, rules.start + i * rules.step))
+    return mapping
+
+
+def rename_with_rules(base: Path, rules: RenameRules, dry_run: bool = True) -> bool:
+    """Renames the entries of base by rules as one journaled batch, after checking the whole plan."""
+    mapping = plan_rule_renames(base, rules)
+    steps = plan_renames(mapping)
+    print_renames(mapping)
+    print(f"{len(mapping)} renames")
+    if dry_run or not steps:
+        if steps:
+            print("Dry run, nothing renamed. Run again with --apply to rename.")
+        return True
+    failures = execute_batch(steps)
+    if failures:
+        print_failures(failures)
+        return False
+    print("Done.")
+    return True
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="batchrename",
+        description="Renumber Johnny Decimal ID folders. Nothing is renamed without --apply",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    tree = commands.add_parser("tree", help="Renumber the IDs of every category under a JD root")
+    tree.add_argument(
+        "root",
+        metavar="ROOT_PATH",
+        help='The root of a JD file structure; should contain folders called e.g. "10-19 Life Admin"',
+    )
+    tree.add_argument(
+        "-i",
+        "--ignore",
+        dest="ignored",
+        action="append",
+        metavar="IGNORED_FILE",
+        default=[],
+        help="An area or category name/pattern to leave alone",
+    )
+    tree.add_argument("-j", "--jobs", type=int, default=RENAME_WORKERS, help="Categories renamed at once")
+    folder = commands.add_parser("folder", help="Renumber the subfolders of one folder")
+    folder.add_argument("path", metavar="PATH")
+    folder.add_argument("--prefix", default="15.", help='ID prefix, e.g. "15."')
+    for command in (tree, folder):
+        command.add_argument(
+            "--jdex",
+            "--index",
+            metavar="JDEX_FILES",
+            help="Your JDex/index notes (a folder or a single file), updated along with the folders",
+        )
+        command.add_argument(
+            "--vault",
+            metavar="NOTES_DIR",
+            help="A folder of Markdown notes whose ID references (\"see 15.12\", [[15.12 Foo]]) follow the new IDs",
+        )
+        command.add_argument(
+            "--start",
+            type=int,
+            default=11,
+            help="First ID number (default 11); with --minimal, the lowest number used",
+        )
+        command.add_argument(
+            "--minimal",
+            action="store_true",
+            help="Rename as few folders as possible; the numbers stay consecutive but may start above --start",
+        )
+        command.add_argument("--gaps", action="store_true", help="With --minimal, allow gaps in the numbering")
+    rules = commands.add_parser("rules", help="Rename the files and folders in one folder by rules")
+    rules.add_argument("path", metavar="PATH")
+    rules.add_argument(
+        "-s",
+        "--sub",
+        nargs=2,
+        action="append",
+        metavar=("PATTERN", "REPLACEMENT"),
+        default=[],
+        help="Regex rewrite, applied in order; REPLACEMENT may use \\1 or \\g<name>",
+    )
+    rules.add_argument("--case", choices=sorted(RenameRules.CASES), help="Case of the name, not its extension")
+    rules.add_argument("--normalize", choices=["NFC", "NFD"], help="Unicode normalization form")
+    rules.add_argument(
+        "-t",
+        "--template",
+        default="{name}",
+        help='New name from {name}, {stem}, {ext} and the number {n}, e.g. "{n:02d} {name}"',
+    )
+    rules.add_argument("--sort", choices=list(RenameRules.SORT_KEYS), default="name", help="Order of {n}")
+    rules.add_argument("--reverse", action="store_true", help="Number in reverse order")
+    rules.add_argument("--start", type=int, default=1, help="First {n} (default 1)")
+    rules.add_argument("--step", type=int, default=1, help="{n} increment (default 1)")
+    rules.add_argument("-m", "--match", metavar="REGEX", help="Only rename names this matches")
+    rules.add_argument("--type", dest="kind", choices=["all", "files", "dirs"], default="all", help="What to rename")
+    undo = commands.add_parser("undo", help="Reverse the last batch of renames, or BATCH")
+    undo.add_argument("batch", metavar="BATCH", nargs="?", help="Batch name, as shown by --list")
+    undo.add_argument("--list", action="store_true", help="List the journaled batches")
+    recover = commands.add_parser("recover", help="Finish batches that were interrupted")
+    recover.add_argument("--rollback", action="store_true", help="Roll them back instead")
+    for command in (undo, recover):
+        command.add_argument("-j", "--jobs", type=int, default=RENAME_WORKERS, help="Folders renamed at once")
+    for command in (tree, folder, rules, undo, recover):
+        command.add_argument("--apply", action="store_true", help="Rename; without it only the plan is printed")
+    args = parser.parse_args(argv)
+
+    def user_path(arg):
+        # Absolute, so the journal can be undone or recovered from any directory
+        return Path(os.path.expanduser(arg)).resolve() if arg else None
+
+    jdex = user_path(getattr(args, "jdex", None))
+    vault = user_path(getattr(args, "vault", None))
+
+    try:
+        if args.command == "undo" and args.list:
+            for batch in read_journals():
+                print(describe_batch(batch))
+            ok = True
+        elif args.command == "undo":
+            ok = undo_batch(args.batch, not args.apply, args.jobs)
+        elif args.command == "recover":
+            ok = recover_batches(args.rollback, not args.apply, args.jobs)
+        elif args.command == "rules":
+            ok = rename_with_rules(user_path(args.path),
+                                   RenameRules([tuple(sub) for sub in args.sub], args.case, args.normalize,
+                                               args.template, args.sort, args.reverse, args.start, args.step,
+                                               args.match, args.kind),
+                                   not args.apply)
+        elif args.command == "tree":
+            ok = renumber_tree(user_path(args.root), args.start, not args.apply, args.minimal,
+                               args.gaps, args.ignored, args.jobs, jdex, vault)
+        else:
+            renumber_subfolders(user_path(args.path), args.start, args.prefix, not args.apply,
+                                args.minimal, args.gaps, jdex, vault)
+            ok = True
+    except (OSError, ValueError) as e:
+        print(e)
+        ok = False
+    return 0 if ok else 1
 
 
 if __name__ == "__main__":
-    folder_path = Path(os.path.expanduser("~/Personal/10-19 Cornell/15 Proposals"))
-    renumber_subfolders(folder_path, dry_run=False)  # change dry_run=False to apply
+    sys.exit(main())
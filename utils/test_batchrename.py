@@ -0,0 +1,644 @@
+"""Tests for batchrename's rename planner and journal. Run with: python -m unittest discover utils"""
+
+import contextlib
+import io
+import os
+import random
+import shutil
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from typing import Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+import batchrename  # noqa: E402
+from batchrename import (  # noqa: E402
+    RenameJournal,
+    RenamePlanError,
+    RenameRules,
+    apply_renames,
+    execute_batch,
+    minimal_numbers,
+    plan_renames,
+    plan_renumbering,
+    plan_rule_renames,
+    read_journals,
+    recover_batch,
+    rename_with_retry,
+    settle_batch,
+    undo_batch,
+)
+
+
+class TempTreeCase(unittest.TestCase):
+    """A temporary folder for each test, with journals kept inside it."""
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self._tmp.name)
+        journal_dir = batchrename.JOURNAL_DIR
+        batchrename.JOURNAL_DIR = self.root / "journals"
+        self.addCleanup(setattr, batchrename, "JOURNAL_DIR", journal_dir)
+        self.addCleanup(self._tmp.cleanup)
+
+    def reset(self):
+        for path in self.root.iterdir():
+            shutil.rmtree(path)
+
+    def make(self, *names: str) -> list[Path]:
+        """Folders under root, each holding a file named after it so moves can be traced."""
+        paths = []
+        for name in names:
+            path = self.root / name
+            path.mkdir(parents=True)
+            (path / "origin").write_text(name)
+            paths.append(path)
+        return paths
+
+    def origins(self) -> dict[str, str]:
+        """Current folder name -> the name it was made with."""
+        return {path.parent.name: path.read_text() for path in self.root.glob("*/origin")}
+
+
+class PlanRenamesTest(TempTreeCase):
+    def apply(self, mapping: dict[Path, Path]) -> list[tuple[Path, Path]]:
+        steps = plan_renames(mapping)
+        apply_renames(steps)
+        expected = {new.name: old.name for old, new in mapping.items()}
+        self.assertEqual(self.origins(), expected)
+        self.assertFalse([p for p in self.root.iterdir() if ".renaming-" in p.name])
+        return steps
+
+    def test_chain(self):
+        a, b, c = self.make("15.11 Folder", "15.12 Folder", "15.13 Folder")
+        d = self.root / "15.14 Folder"
+        steps = self.apply({a: b, b: c, c: d})
+        self.assertEqual(len(steps), 3)
+        self.assertEqual(steps, [(c, d), (b, c), (a, b)])
+
+    def test_swap_is_a_cycle(self):
+        a, b = self.make("a", "b")
+        steps = self.apply({a: b, b: a})
+        self.assertEqual(len(steps), 3)
+
+    def test_cycles_and_chains_together(self):
+        paths = self.make(*"abcdefg")
+        a, b, c, d, e, f, g = paths
+        # a -> b -> c -> a is a cycle, d -> e -> f -> x a chain, g stays put
+        mapping = {a: b, b: c, c: a, d: e, e: f, f: self.root / "x", g: g}
+        steps = self.apply(mapping)
+        self.assertEqual(len(steps), 3 + 1 + 3)
+
+    def test_random_permutations(self):
+        rng = random.Random(0)
+        for n in [2, 5, 30]:
+            with self.subTest(n=n):
+                self.reset()
+                paths = self.make(*(f"{i:02d}" for i in range(n)))
+                shuffled = paths[:]
+                rng.shuffle(shuffled)
+                mapping = dict(zip(paths, shuffled))
+                steps = self.apply(mapping)
+                # One extra step per cycle: count the cycles of the permutation
+                cycles, seen = 0, set()
+                for start in paths:
+                    if start in seen or mapping[start] == start:
+                        continue
+                    cycles += 1
+                    path = start
+                    while path not in seen:
+                        seen.add(path)
+                        path = mapping[path]
+                moved = sum(1 for src, dst in mapping.items() if src != dst)
+                self.assertEqual(len(steps), moved + cycles)
+
+    def test_hundreds_of_shifted_ids(self):
+        # Every ID moves up by one, each onto the next one's current name
+        names = [f"{10 + i // 90}.{10 + i % 90:02d} Folder" for i in range(300)]
+        paths = self.make(*names)
+        mapping = {paths[i]: self.root / (names[i + 1] if i + 1 < len(names) else "14.10 Folder")
+                   for i in range(len(paths))}
+        steps = self.apply(mapping)
+        self.assertEqual(len(steps), len(mapping))
+
+    def test_case_only_rename(self):
+        (a,) = self.make("15.11 notes")
+        steps = self.apply({a: self.root / "15.11 Notes"})
+        self.assertEqual(steps, [(a, self.root / "15.11 Notes")])
+
+    def test_unchanged_names_are_skipped(self):
+        (a,) = self.make("a")
+        self.assertEqual(plan_renames({a: a}), [])
+
+    def test_missing_source(self):
+        with self.assertRaisesRegex(RenamePlanError, "does not exist"):
+            plan_renames({self.root / "gone": self.root / "new"})
+
+    def test_two_sources_one_target(self):
+        a, b = self.make("a", "b")
+        with self.assertRaisesRegex(RenamePlanError, "would both become"):
+            plan_renames({a: self.root / "c", b: self.root / "c"})
+
+    def test_target_taken(self):
+        a, b = self.make("a", "b")
+        with self.assertRaisesRegex(RenamePlanError, "already exists"):
+            plan_renames({a: b})
+
+    def test_case_variants_of_one_source(self):
+        (a,) = self.make("a")
+        with self.assertRaisesRegex(RenamePlanError, "same name"):
+            plan_renames({a: self.root / "b", self.root / "A": self.root / "c"})
+
+    def test_nothing_renamed_when_the_plan_fails(self):
+        a, b = self.make("a", "b")
+        with self.assertRaises(RenamePlanError):
+            plan_renames({a: self.root / "c", b: self.root / "c"})
+        self.assertEqual(self.origins(), {"a": "a", "b": "b"})
+
+    def test_target_appearing_after_planning(self):
+        (a,) = self.make("a")
+        steps = plan_renames({a: self.root / "b"})
+        self.make("b")
+        with self.assertRaises(FileExistsError):
+            apply_renames(steps)
+        self.assertEqual(self.origins(), {"a": "a", "b": "b"})
+
+
+class MinimalNumbersTest(unittest.TestCase):
+    def kept(self, current: list[Optional[int]], numbers: list[int]) -> int:
+        return sum(1 for c, n in zip(current, numbers) if c == n)
+
+    def best_consecutive(self, current: list[Optional[int]], start: int) -> tuple[int, int]:
+        """(most folders kept, first number) over every consecutive numbering, by brute force."""
+        last = max(batchrename.MAX_NUMBER, start + len(current) - 1)
+        return max((self.kept(current, list(range(first, first + len(current)))), -first)
+                   for first in range(start, last - len(current) + 2))
+
+    def best_with_gaps(self, current: list[Optional[int]], start: int) -> int:
+        """Most folders kept by any increasing numbering from start, by brute force over the kept sets."""
+        count = len(current)
+        last = max(batchrename.MAX_NUMBER, start + count - 1)
+        best = 0
+        for mask in range(1 << count):
+            kept = [i for i in range(count) if mask >> i & 1]
+            if all(current[i] is not None and start + i <= current[i] <= last - (count - 1 - i) for i in kept) and \
+                    all(current[j] - current[i] >= j - i for i, j in zip(kept, kept[1:])):
+                best = max(best, len(kept))
+        return best
+
+    def test_most_frequent_shift(self):
+        # Three folders already sit at 12 + i, one at 11 + i
+        self.assertEqual(minimal_numbers([11, 13, 14, 15], 11), [12, 13, 14, 15])
+
+    def test_ties_go_to_the_lowest_numbering(self):
+        self.assertEqual(minimal_numbers([11, 12, 20, 21], 11), [11, 12, 13, 14])
+        self.assertEqual(minimal_numbers([None, 13, None, 25], 11), [12, 13, 14, 15])
+
+    def test_may_start_above_start(self):
+        numbers = minimal_numbers([None, 31, 32, 33], 11)
+        self.assertEqual(numbers, [30, 31, 32, 33])
+
+    def test_already_minimal(self):
+        for gaps in [False, True]:
+            self.assertEqual(minimal_numbers([11, 12, 13], 11, gaps), [11, 12, 13])
+        self.assertEqual(minimal_numbers([11, 20, 45], 11, gaps=True), [11, 20, 45])
+        self.assertEqual(minimal_numbers([], 11), [])
+
+    def test_gaps_keep_the_longest_run(self):
+        # 30 and 14 can't both stay along with 11, 13 and 50
+        numbers = minimal_numbers([11, 30, 13, 50, 14], 11, gaps=True)
+        self.assertEqual(numbers, [11, 12, 13, 50, 51])
+
+    def test_numbers_that_leave_no_room_are_renamed(self):
+        # 99 is the last number, so 98 and 99 leave no room for the folder after them
+        self.assertEqual(minimal_numbers([98, 99, None], 11, gaps=True), [11, 12, 13])
+        self.assertEqual(minimal_numbers([97, 98, None], 11, gaps=True), [97, 98, 99])
+        self.assertEqual(minimal_numbers([11, None, 12], 11, gaps=True), [11, 12, 13])
+
+    def test_against_brute_force(self):
+        rng = random.Random(0)
+        for _ in range(300):
+            start = rng.choice([1, 11])
+            current = [rng.choice([None, *range(start, start + 12), 98, 99]) for _ in range(rng.randint(1, 8))]
+            with self.subTest(current=current, start=start):
+                numbers = minimal_numbers(current, start)
+                (kept, first) = self.best_consecutive(current, start)
+                self.assertEqual(numbers, list(range(-first, -first + len(current))))
+                self.assertEqual(self.kept(current, numbers), kept)
+
+                numbers = minimal_numbers(current, start, gaps=True)
+                self.assertEqual(self.kept(current, numbers), self.best_with_gaps(current, start))
+                self.assertEqual(numbers, sorted(set(numbers)))
+                self.assertTrue(start <= numbers[0] and numbers[-1] <= batchrename.MAX_NUMBER)
+
+
+class PlanRenumberingTest(TempTreeCase):
+    def names(self, mapping: dict[Path, Path]) -> dict[str, str]:
+        return {old.name: new.name for old, new in mapping.items()}
+
+    def test_minimal_renames_only_what_is_out_of_place(self):
+        self.make("15.11 A", "15.13 B", "15.14 C", "15.15 D")
+        (mapping, sequential_renames, _) = plan_renumbering(self.root, minimal=True)
+        # Numbering starts above --start, leaving 15.11 free
+        self.assertEqual(self.names(mapping), {"15.11 A": "15.12 A"})
+        self.assertEqual(sequential_renames, 3)
+        (mapping, _, _) = plan_renumbering(self.root)
+        self.assertEqual(len(mapping), 3)
+
+    def test_ids_of_another_category_are_numbered_in_name_order(self):
+        self.make("15.11 A", "15.20 B", "16.13 Elsewhere")
+        (mapping, _, _) = plan_renumbering(self.root, minimal=True, gaps=True)
+        self.assertEqual(self.names(mapping), {"16.13 Elsewhere": "15.21 Elsewhere"})
+
+    def test_already_minimal_plans_nothing(self):
+        self.make("15.11 A", "15.12 B", "15.13 C")
+        for minimal, gaps in [(False, False), (True, False), (True, True)]:
+            (mapping, sequential_renames, skipped) = plan_renumbering(self.root, minimal=minimal, gaps=gaps)
+            self.assertEqual((mapping, sequential_renames, skipped), ({}, 0, []))
+
+
+class RenumberTreeTest(TempTreeCase):
+    def setUp(self):
+        super().setUp()
+        self.output = io.StringIO()
+        redirect = contextlib.redirect_stdout(self.output)
+        redirect.__enter__()
+        self.addCleanup(redirect.__exit__, None, None, None)
+        self.make(
+            "10-19 Projects/15 Proposals/15.01 Inbox",
+            "10-19 Projects/15 Proposals/15.12 A",
+            "10-19 Projects/15 Proposals/15.14 B",
+            "10-19 Projects/15 Proposals/16.03 Trip",
+            "10-19 Projects/15 Proposals/Archive",
+            "10-19 Projects/16 Travel/16.11 Paris",
+            "10-19 Projects/16 Travel/16.13 Rome",
+        )
+
+    def tree(self) -> dict[str, str]:
+        """Current path under root -> the path it was made with, for every folder made."""
+        return {str(path.parent.relative_to(self.root)): path.read_text()
+                for path in self.root.glob("*/*/*/origin")}
+
+    def test_only_a_categorys_own_ids_are_renumbered(self):
+        before = self.tree()
+        self.assertTrue(batchrename.renumber_tree(self.root, dry_run=False))
+        moved = {new: old for new, old in self.tree().items() if new != old}
+        self.assertEqual(moved, {
+            "10-19 Projects/15 Proposals/15.11 A": "10-19 Projects/15 Proposals/15.12 A",
+            "10-19 Projects/15 Proposals/15.12 B": "10-19 Projects/15 Proposals/15.14 B",
+            "10-19 Projects/16 Travel/16.12 Rome": "10-19 Projects/16 Travel/16.13 Rome",
+        })
+        # The inbox keeps its reserved number; the misfiled ID and Archive are left for jdlint
+        for name in ["15.01 Inbox", "16.03 Trip", "Archive"]:
+            self.assertIn(f"10-19 Projects/15 Proposals/{name}", before)
+            self.assertIn(f"10-19 Projects/15 Proposals/{name}", self.tree())
+        output = self.output.getvalue()
+        self.assertIn("Skipped 2 folders that aren't IDs of their category (see jdlint):\n"
+                      "  10-19 Projects/15 Proposals/16.03 Trip\n"
+                      "  10-19 Projects/15 Proposals/Archive\n", output)
+        self.assertIn("3 renames in 2 of 2 categories", output)
+
+    def test_one_bad_category_stops_the_run(self):
+        # A file holds the name 15.12 A would take
+        (self.root / "10-19 Projects/15 Proposals/15.11 A").write_text("")
+        before = self.tree()
+        self.assertFalse(batchrename.renumber_tree(self.root, dry_run=False))
+        self.assertEqual(self.tree(), before)
+        output = self.output.getvalue()
+        self.assertIn("Nothing was renamed, these categories can't be renumbered:\n"
+                      "  10-19 Projects/15 Proposals: ", output)
+        self.assertNotIn("Skipped", output)
+
+
+class JdexUpdateTest(TempTreeCase):
+    def setUp(self):
+        super().setUp()
+        redirect = contextlib.redirect_stdout(io.StringIO())
+        redirect.__enter__()
+        self.addCleanup(redirect.__exit__, None, None, None)
+        self.category = self.root / "15 Proposals"
+
+    def notes(self, folder: Path, *names: str) -> None:
+        """Notes whose text is their own name, so renames can be traced."""
+        folder.mkdir(parents=True, exist_ok=True)
+        for name in names:
+            (folder / name).write_text(name)
+
+    def note_names(self, folder: Path) -> dict[str, str]:
+        """Note name -> the name it was written with."""
+        return {path.name: path.read_text() for path in folder.iterdir() if path.is_file()}
+
+    def shift(self, jdex: Path) -> None:
+        """15.12 A and 15.14 B renumbered to 15.11 and 15.12: 15.12 passes from one to the other."""
+        self.make("15 Proposals/15.12 A", "15 Proposals/15.14 B")
+        batchrename.renumber_subfolders(self.category, dry_run=False, jdex=jdex)
+        self.assertEqual(sorted(path.name for path in self.category.iterdir()), ["15.11 A", "15.12 B"])
+
+    def swap(self, jdex: Path) -> None:
+        """15.11 A and 15.12 B trade IDs: a cycle, as the folders' own renames are."""
+        a, b = self.make("15 Proposals/15.11 A", "15 Proposals/15.12 B")
+        mapping = {a: a.with_name("15.12 A"), b: b.with_name("15.11 B")}
+        note_steps, jdex_file, _ = batchrename.plan_reference_updates(mapping, jdex)
+        self.assertEqual(execute_batch(plan_renames(mapping) + note_steps, jdex=jdex_file), [])
+
+    def test_single_file(self):
+        jdex = self.root / "index.md"
+        jdex.write_text("10-19 Projects\n  15 Proposals\n    15.12 A  // see 15.14\n\t15.14 B\n"
+                        "15.13 Other\nNot an ID line: 15.12\n")
+        self.shift(jdex)
+        # Indented ID lines change; IDs elsewhere on a line are the vault's business
+        self.assertEqual(jdex.read_text(), "10-19 Projects\n  15 Proposals\n    15.11 A  // see 15.14\n"
+                                           "\t15.12 B\n15.13 Other\nNot an ID line: 15.12\n")
+        (batch,) = read_journals()
+        self.assertTrue(batch["jdex_done"])
+
+    def test_single_file_cycle(self):
+        jdex = self.root / "index.md"
+        jdex.write_text("15.11 A\n15.12 B\n")
+        self.swap(jdex)
+        self.assertEqual(jdex.read_text(), "15.12 A\n15.11 B\n")
+
+    def test_nested_notes(self):
+        jdex = self.root / "jdex"
+        notes = jdex / "10-19 Projects/15 Proposals"
+        self.notes(jdex / "10-19 Projects", "10. Projects.md")
+        self.notes(notes, "15.12 A.md", "15.14 B.md", "15.20 Other.md")
+        self.shift(jdex)
+        self.assertEqual(self.note_names(notes),
+                         {"15.11 A.md": "15.12 A.md", "15.12 B.md": "15.14 B.md", "15.20 Other.md": "15.20 Other.md"})
+        self.assertEqual(self.note_names(jdex / "10-19 Projects"), {"10. Projects.md": "10. Projects.md"})
+
+    def test_flat_notes(self):
+        jdex = self.root / "jdex"
+        self.notes(jdex, "10. Projects.md", "15.12 A.md", "15.14 B.md")
+        self.shift(jdex)
+        self.assertEqual(self.note_names(jdex),
+                         {"10. Projects.md": "10. Projects.md", "15.11 A.md": "15.12 A.md", "15.12 B.md": "15.14 B.md"})
+
+    def test_notes_cycle(self):
+        jdex = self.root / "jdex"
+        self.notes(jdex, "15.11 A.md", "15.12 B.md")
+        self.swap(jdex)
+        self.assertEqual(self.note_names(jdex), {"15.12 A.md": "15.11 A.md", "15.11 B.md": "15.12 B.md"})
+        self.assertFalse([path for path in jdex.iterdir() if ".renaming-" in path.name])
+
+
+class VaultUndoTest(TempTreeCase):
+    def setUp(self):
+        super().setUp()
+        self.output = io.StringIO()
+        redirect = contextlib.redirect_stdout(self.output)
+        redirect.__enter__()
+        self.addCleanup(redirect.__exit__, None, None, None)
+
+    def snapshot(self) -> dict[str, bytes]:
+        """Every file under root but the journals, by relative path, with its exact bytes."""
+        return {str(path.relative_to(self.root)): path.read_bytes() for path in self.root.rglob("*")
+                if path.is_file() and "journals" not in path.parts}
+
+    def test_undo_restores_notes_byte_for_byte(self):
+        self.make("15 Proposals/15.12 A", "15 Proposals/15.14 B", "15 Proposals/15.15 C")
+        vault = self.root / "vault"
+        jdex = vault / "JDex"
+        jdex.mkdir(parents=True)
+        # The JDex notes are in the vault: they are renamed and have references rewritten
+        (jdex / "15.12 A.md").write_bytes("See [[15.14 B]] and 15.15.\r\n".encode())
+        (jdex / "15.14 B.md").write_bytes("Back to 15.12, not 15.13 or 115.12.".encode())
+        (vault / "Journal.md").write_bytes(
+            "Versions 15.12.3 and v15.14 stay; so do 15.99 € and 15.13.\r\n"
+            "Prices like 15.15 look like IDs and change, but undo puts them back.\n".encode())
+        (vault / "Photo.md").write_bytes(b"\xff\xfe not text 15.12")
+        before = self.snapshot()
+
+        self.assertEqual(len(batchrename.renumber_subfolders(self.root / "15 Proposals", dry_run=False,
+                                                             jdex=jdex, vault=vault)), 5)
+        after = self.snapshot()
+        self.assertEqual(after["vault/JDex/15.11 A.md"], "See [[15.12 B]] and 15.13.\r\n".encode())
+        self.assertEqual(after["vault/JDex/15.12 B.md"], "Back to 15.11, not 15.13 or 115.12.".encode())
+        self.assertEqual(after["vault/Journal.md"], (
+            "Versions 15.12.3 and v15.14 stay; so do 15.99 € and 15.13.\r\n"
+            "Prices like 15.13 look like IDs and change, but undo puts them back.\n").encode())
+        self.assertEqual(after["vault/Photo.md"], before["vault/Photo.md"])
+
+        self.assertTrue(undo_batch(dry_run=False))
+        self.assertEqual(self.snapshot(), before)
+        self.assertEqual(sorted(path.name for path in (self.root / "15 Proposals").iterdir()),
+                         ["15.12 A", "15.14 B", "15.15 C"])
+
+
+class RenameRulesTest(TempTreeCase):
+    def files(self, *names: str) -> None:
+        for name in names:
+            (self.root / name).write_text(name)
+
+    def renames(self, rules: RenameRules) -> dict[str, str]:
+        return {old.name: new.name for old, new in plan_rule_renames(self.root, rules).items()}
+
+    def test_bad_rules_are_refused_when_compiled(self):
+        for kwargs, message in [
+            ({"subs": [("(", "x")]}, "bad pattern"),
+            ({"match": "[a-"}, "bad pattern"),
+            ({"case": "camel"}, "unknown case"),
+            ({"normalize": "NFKC"}, "unknown normalization"),
+            ({"sort": "ctime"}, "unknown sort key"),
+            ({"kind": "links"}, "unknown kind"),
+            ({"template": "{nme}"}, "bad template"),
+            ({"template": "{n:q}"}, "bad template"),
+            ({"template": "{name"}, "bad template"),
+        ]:
+            with self.subTest(**kwargs), self.assertRaisesRegex(ValueError, message):
+                RenameRules(**kwargs)
+        self.assertTrue(RenameRules(template="{n:03d} {name}").numbered)
+        self.assertFalse(RenameRules(template="{stem}{ext}").numbered)
+
+    def test_rules_apply_in_order(self):
+        # Rewrites in the order given, then the case and normalization of the stem, then the template
+        render = RenameRules(subs=[("a", "b"), ("b", "c")]).render
+        self.assertEqual(render("ab.txt", False), "cc.txt")
+        self.assertEqual(RenameRules(subs=[("b", "c"), ("a", "b")]).render("ab.txt", False), "bc.txt")
+        rules = RenameRules(subs=[(r"^([\w']+) - (\w+)", r"\2 \1")], case="title", normalize="NFC",
+                            template="{n:02d} {name}")
+        self.assertEqual(rules.render("don't - stop.MP3", False, 7), "07 Stop Don't.MP3")
+        self.assertEqual(RenameRules(normalize="NFC").render("cafe\u0301.txt", False), "caf\u00e9.txt")
+        # A folder has no extension to spare from the case change
+        self.assertEqual(RenameRules(case="upper").render("my.dir", True), "MY.DIR")
+        self.assertEqual(RenameRules(case="upper").render("my.dir", False), "MY.dir")
+
+    def test_natural_sort_with_digit_like_characters(self):
+        # "²" is isdigit() but no \d; "٣" is an Arabic-Indic 3, a \d that int() reads
+        self.files("x10", "x\u00b2", "x2", "x\u0663", "x1", "X3", ".hidden")
+        self.assertEqual(self.renames(RenameRules(template="{n} {name}", sort="natural")), {
+            "x1": "1 x1", "x2": "2 x2", "X3": "3 X3", "x\u0663": "4 x\u0663", "x10": "5 x10", "x\u00b2": "6 x\u00b2",
+        })
+
+    def test_numbering_order(self):
+        self.files("b", "a", "c")
+        (self.root / "d").mkdir()
+        rules = RenameRules(template="{n:02d}-{name}", reverse=True, start=10, step=5, kind="files")
+        self.assertEqual(self.renames(rules), {"c": "10-c", "b": "15-b", "a": "20-a"})
+        # Equal sizes go by name, whatever the listing order
+        self.assertEqual(self.renames(RenameRules(template="{n}{ext}", sort="size", match="^[ab]$")),
+                         {"a": "1", "b": "2"})
+
+
+class RecoverTest(TempTreeCase):
+    NAMES = [f"15.{11 + i} Folder" for i in range(10)]
+
+    def setUp(self):
+        super().setUp()
+        self.output = io.StringIO()
+        redirect = contextlib.redirect_stdout(self.output)
+        redirect.__enter__()
+        self.addCleanup(redirect.__exit__, None, None, None)
+
+    def rotate(self) -> dict[Path, Path]:
+        """Every folder takes the next one's name: one cycle, so one step runs under a temporary name."""
+        self.reset()
+        paths = self.make(*self.NAMES)
+        return {path: paths[(i + 1) % len(paths)] for i, path in enumerate(paths)}
+
+    def crash(self, mapping: dict[Path, Path], renamed: int, logged: Optional[int] = None) -> dict:
+        """
+        A batch that stopped after renamed steps, of which the first logged made it
+        into the journal (all of them by default). Returns the batch as read back.
+        """
+        steps = plan_renames(mapping)
+        journal = RenameJournal.create(steps)
+        for i in range(renamed):
+            rename_with_retry(*steps[i])
+            if i < (renamed if logged is None else logged):
+                journal.done(i)
+        journal.close()
+        (batch,) = read_journals()
+        self.assertFalse(batch["ended"])
+        return batch
+
+    def reread(self) -> dict:
+        """The interrupted batch read back afresh, as the recover command sees it."""
+        (batch,) = read_journals()
+        return batch
+
+    def test_finish(self):
+        steps = len(self.NAMES) + 1
+        for renamed in [0, 1, steps // 2, steps - 1]:
+            with self.subTest(renamed=renamed):
+                mapping = self.rotate()
+                batch = self.crash(mapping, renamed)
+                self.assertTrue(recover_batch(batch, dry_run=False))
+                self.assertEqual(self.origins(), {new.name: old.name for old, new in mapping.items()})
+                (batch,) = read_journals()
+                self.assertTrue(batch["ended"])
+                self.assertEqual(batch["done"], set(range(steps)))
+
+    def test_rollback(self):
+        steps = len(self.NAMES) + 1
+        for renamed in [0, 1, steps // 2, steps - 1]:
+            with self.subTest(renamed=renamed):
+                batch = self.crash(self.rotate(), renamed)
+                self.assertTrue(recover_batch(batch, rollback=True, dry_run=False))
+                self.assertEqual(self.origins(), {name: name for name in self.NAMES})
+                self.assertFalse([p for p in self.root.iterdir() if ".renaming-" in p.name])
+                original, undo = read_journals()
+                self.assertTrue(original["ended"] and undo["ended"])
+                self.assertEqual(undo["undoes"], original["batch"])
+
+    def test_unlogged_rename_is_settled(self):
+        mapping = self.rotate()
+        batch = self.crash(mapping, renamed=5, logged=4)
+        self.assertEqual(batch["done"], {0, 1, 2, 3})
+        self.assertEqual(settle_batch(batch), {0, 1, 2, 3, 4})
+        self.assertTrue(recover_batch(batch, dry_run=False))
+        self.assertEqual(self.origins(), {new.name: old.name for old, new in mapping.items()})
+
+    def test_unlogged_rename_is_rolled_back(self):
+        batch = self.crash(self.rotate(), renamed=5, logged=4)
+        self.assertTrue(recover_batch(batch, rollback=True, dry_run=False))
+        self.assertEqual(self.origins(), {name: name for name in self.NAMES})
+
+    def test_many_unlogged_renames_are_settled(self):
+        # A power loss can drop any number of trailing "done" records, including the parked step's
+        steps = len(self.NAMES) + 1
+        for renamed, logged in [(8, 2), (steps - 1, 1), (5, 0), (3, 0)]:
+            with self.subTest(renamed=renamed, logged=logged):
+                mapping = self.rotate()
+                batch = self.crash(mapping, renamed, logged)
+                self.assertEqual(settle_batch(batch), set(range(renamed)))
+                self.assertTrue(recover_batch(self.reread(), dry_run=False))
+                self.assertEqual(self.origins(), {new.name: old.name for old, new in mapping.items()})
+
+    def test_many_unlogged_renames_are_rolled_back(self):
+        batch = self.crash(self.rotate(), renamed=8, logged=2)
+        self.assertTrue(recover_batch(batch, rollback=True, dry_run=False))
+        self.assertEqual(self.origins(), {name: name for name in self.NAMES})
+        self.assertFalse([p for p in self.root.iterdir() if ".renaming-" in p.name])
+
+    def test_unlogged_renames_in_several_folders(self):
+        # Category -> (steps run, steps logged) when the power went
+        progress = {"11": (4, 1), "12": (3, 0)}
+        mapping = {}
+        for category in progress:
+            for path in self.make(*(f"10-19 A/{category} C/{category}.{n} Folder" for n in range(11, 16))):
+                mapping[path] = path.with_name(f"{category}.{int(path.name[3:5]) + 1} Folder")
+        steps = plan_renames(mapping)
+        journal = RenameJournal.create(steps)
+        seen = dict.fromkeys(progress, 0)
+        for i, (src, dst) in enumerate(steps):
+            category = src.name[:2]
+            run, logged = progress[category]
+            if seen[category] < run:
+                rename_with_retry(src, dst)
+            if seen[category] < logged:
+                journal.done(i)
+            seen[category] += 1
+        journal.close()
+        self.assertEqual(len(settle_batch(self.reread())), 4 + 3)
+        self.assertTrue(recover_batch(self.reread(), dry_run=False))
+        for old, new in mapping.items():
+            self.assertEqual((new / "origin").read_text(), str(old.relative_to(self.root)))
+
+    def test_recover_refuses_when_folders_changed(self):
+        a, b = self.make("15.11 A", "15.12 B")
+        batch = self.crash({a: self.root / "15.21 A", b: self.root / "15.22 B"}, renamed=1)
+        self.make("15.22 B")
+        self.assertFalse(recover_batch(batch, dry_run=False))
+        self.assertIn("in the way", self.output.getvalue())
+        self.assertFalse(read_journals()[0]["ended"])
+
+    def test_dry_run_renames_nothing(self):
+        batch = self.crash(self.rotate(), renamed=3)
+        before = self.origins()
+        self.assertTrue(recover_batch(batch, dry_run=True))
+        self.assertEqual(self.origins(), before)
+
+    def test_undo(self):
+        mapping = self.rotate()
+        self.assertEqual(execute_batch(plan_renames(mapping)), [])
+        self.assertTrue(undo_batch(dry_run=False))
+        self.assertEqual(self.origins(), {name: name for name in self.NAMES})
+        self.assertFalse(undo_batch(dry_run=False))
+        self.assertIn("Nothing to undo", self.output.getvalue())
+
+    def test_undo_refuses_when_folders_changed(self):
+        mapping = self.rotate()
+        execute_batch(plan_renames(mapping))
+        (self.root / self.NAMES[0]).rename(self.root / "15.99 Moved")
+        self.assertFalse(undo_batch(dry_run=False))
+        self.assertEqual(self.origins()["15.99 Moved"], self.NAMES[-1])
+
+    def test_relative_paths_are_journaled_absolute(self):
+        self.make("15.12 A", "15.14 B")
+        cwd = os.getcwd()
+        self.addCleanup(os.chdir, cwd)
+        os.chdir(self.root)
+        self.assertEqual(batchrename.main(["folder", ".", "--apply"]), 0)
+        self.assertEqual(self.origins(), {"15.11 A": "15.12 A", "15.12 B": "15.14 B"})
+        (batch,) = read_journals()
+        self.assertTrue(all(src.is_absolute() and dst.is_absolute() for src, dst in batch["steps"]))
+        os.chdir(self.root / "journals")
+        self.assertEqual(batchrename.main(["undo", "--apply"]), 0)
+        self.assertEqual(self.origins(), {"15.12 A": "15.12 A", "15.14 B": "15.14 B"})
+
+
+if __name__ == "__main__":
+    unittest.main()